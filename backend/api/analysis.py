@@ -1,76 +1,271 @@
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Dict
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from typing import Any, Iterator, List, Dict, Optional
+import asyncio
+import json
 import os
+import threading
+import time
 from core.scanner import scan_directory
-from core.metrics import calculate_cyclomatic_complexity
+from core.engine import get_engine
+from core.watcher import get_watcher
+from core.git_source import GitAnalyzer, GitError
+from core.telemetry import record_cache_lookup, record_docstring_source, record_time_to_first_token, timed_iter
 
 router = APIRouter()
 
 class AnalysisRequest(BaseModel):
     project_path: str
+    jobs: Optional[int] = Field(default=None, ge=1, description="Worker processes to use (defaults to CPU count)")
+    include_functions: bool = Field(default=False, description="Return per-function and per-class complexity")
+
+class FunctionMetric(BaseModel):
+    name: str
+    qualified_name: str
+    type: str
+    lineno: int
+    endline: Optional[int] = None
+    complexity: int
 
 class FileMetric(BaseModel):
     file_path: str
     complexity: int
+    functions: Optional[List[FunctionMetric]] = None
 
 class AnalysisResponse(BaseModel):
     files: List[FileMetric]
     average_complexity: float
 
-@router.post("/analyze", response_model=AnalysisResponse)
+def _file_metric(result: Dict, include_functions: bool) -> FileMetric:
+    return FileMetric(
+        file_path=result["file_path"],
+        complexity=result["complexity"],
+        functions=result.get("functions", []) if include_functions else None
+    )
+
+@router.post("/analyze", response_model=AnalysisResponse, response_model_exclude_none=True)
 def analyze_project(request: AnalysisRequest):
     if not os.path.exists(request.project_path):
         raise HTTPException(status_code=404, detail="Project path not found")
 
-    metrics = []
+    metrics = [_file_metric(result, request.include_functions) for result in _iter_project_results(request)]
+
+    total_complexity = sum(m.complexity for m in metrics)
+    avg_complexity = total_complexity / len(metrics) if metrics else 0
+    
+    return AnalysisResponse(files=metrics, average_complexity=avg_complexity)
+
+def _iter_project_results(request: AnalysisRequest) -> Iterator[Dict]:
+    watcher = get_watcher(request.project_path)
+    if watcher is not None:
+        # Watched project: answer from the live index instead of rescanning
+        return (dict(m, file_path=os.path.join(request.project_path, rel))
+                for rel, m in watcher.index.iter_entries())
+    return get_engine(jobs=request.jobs).iter_results(timed_iter("scan", scan_directory(request.project_path)))
+
+def _stream_records(request: AnalysisRequest, fmt: str) -> Iterator[str]:
+    """
+    One record per file as soon as it is analyzed, then a summary record.
+    Only running totals are kept, so memory does not grow with the project.
+    """
     total_complexity = 0
     file_count = 0
+    for result in _iter_project_results(request):
+        metric = _file_metric(result, request.include_functions)
+        total_complexity += metric.complexity
+        file_count += 1
+        yield _encode_record("file", metric.model_dump(exclude_none=True), fmt)
+    summary = {
+        "files": file_count,
+        "average_complexity": total_complexity / file_count if file_count else 0
+    }
+    yield _encode_record("summary", summary, fmt)
 
-    for file_path in scan_directory(request.project_path):
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Only analyze Python files for complexity for now
-            if file_path.endswith('.py'):
-                complexity = calculate_cyclomatic_complexity(content)
-                metrics.append(FileMetric(file_path=file_path, complexity=complexity))
-                total_complexity += complexity
-                file_count += 1
-        except Exception as e:
-            # Log error or skip
-            continue
+def _encode_record(kind: str, payload: Dict, fmt: str) -> str:
+    if fmt == "sse":
+        return f"event: {kind}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({"type": kind, **payload}) + "\n"
+
+@router.post("/analyze/stream")
+def analyze_project_stream(request: AnalysisRequest, format: str = Query("ndjson", pattern="^(ndjson|sse)$")):
+    """
+    Streaming variant of /analyze.
+
+    ndjson: one JSON object per line, each with a "type" of "file" or
+    "summary". sse: the same payloads as Server-Sent Events named "file" and
+    "summary".
+    """
+    if not os.path.exists(request.project_path):
+        raise HTTPException(status_code=404, detail="Project path not found")
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(_stream_records(request, format), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+class GitDiffRequest(BaseModel):
+    repo_path: str
+    base: str
+    head: str = "HEAD"
+
+class GitDiffResponse(BaseModel):
+    base: str
+    head: str
+    files: List[Dict[str, Any]]
+    deleted: List[str]
+
+class GitHistoryRequest(BaseModel):
+    repo_path: str
+    head: str = "HEAD"
+    max_commits: int = Field(default=100, ge=1, le=5000)
+
+class CommitSummary(BaseModel):
+    commit: str
+    files: int
+    loc: int
+    functions: int
+    average_maintainability: float
+    average_complexity: float
+    doc_coverage: float
+
+class GitHistoryResponse(BaseModel):
+    head: str
+    commits: List[CommitSummary]
+    distinct_blobs: int
+
+# Shared by all git requests so blob metrics are reused through the persistent cache
+_git_metrics = None
+_git_metrics_lock = threading.Lock()
+
+def _git_analyzer(repo_path: str) -> GitAnalyzer:
+    global _git_metrics
+    from core.analyzer import MetricsAnalyzer
+    from core.cache import open_default_cache
+
+    if not os.path.isdir(repo_path):
+        raise HTTPException(status_code=404, detail="Repository path not found")
+    with _git_metrics_lock:
+        if _git_metrics is None:
+            _git_metrics = MetricsAnalyzer(cache=open_default_cache())
+    return GitAnalyzer(repo_path, analyzer=_git_metrics)
+
+@router.post("/analyze/git/diff", response_model=GitDiffResponse)
+def analyze_git_diff(request: GitDiffRequest):
+    """Analyze only the files changed between two revisions, read directly from the object store."""
+    try:
+        with _git_analyzer(request.repo_path) as git_analyzer:
+            return git_analyzer.analyze_diff(request.base, request.head)
+    except GitError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.post("/analyze/git/history", response_model=GitHistoryResponse)
+def analyze_git_history(request: GitHistoryRequest):
+    """Per-commit metric summaries for the last `max_commits` first-parent commits."""
+    try:
+        with _git_analyzer(request.repo_path) as git_analyzer:
+            return git_analyzer.analyze_history(request.head, request.max_commits)
+    except GitError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+GENERATE_TIMEOUT = float(os.environ.get("CODEWHISPER_GENERATE_TIMEOUT", "30"))
 
-    avg_complexity = total_complexity / file_count if file_count > 0 else 0
-    
-    return AnalysisResponse(files=metrics, average_complexity=avg_complexity)
 class GenerateRequest(BaseModel):
     code: str
     language: str
+    timeout: Optional[float] = Field(default=None, gt=0, description="Seconds to wait for the model (at most CODEWHISPER_GENERATE_TIMEOUT)")
+    latency_budget_ms: Optional[float] = Field(default=None, gt=0, description="Target generation time; picks a cheaper decoding when needed")
+    policy: Optional[str] = Field(default=None, pattern="^(beam|greedy|adaptive)$", description="Decoding policy (defaults to CODEWHISPER_DECODING_POLICY)")
+    use_templates: bool = Field(default=True, description="Answer trivial functions (getters, setters, plain constructors, delegations) with a template instead of the model")
+    adapter: Optional[str] = Field(default=None, description="LoRA adapter to generate with (defaults to the one named after the language, if any)")
 
 @router.post("/generate")
-async def generate_doc(request: GenerateRequest):
+async def generate_doc(request: GenerateRequest, http_request: Request):
     """
     Generate docstring for the provided code using the fine-tuned CodeT5 model.
+
+    Inference runs on the batcher's thread, so the event loop stays free.
+    Results are cached by normalized code, and identical requests in flight
+    share one generation. The decoding (beam count and output length) is
+    chosen from the code's length and the optional latency budget, which
+    covers generation only, not queueing. Trivial functions are answered
+    from a template without the model (see ml.templates). Requests are only
+    batched with others using the same adapter. Answers 400 for an unknown
+    adapter, 429 when the inference queue is full and 503 when the request
+    could not be served within its deadline.
     """
-    from ml.inference import generate_docstring, is_model_available
+    from ml.inference import is_model_available, token_lengths
+    from ml.batching import ClientDisconnected, get_generation_batcher
+    from ml.decoding import DEFAULT_POLICY, choose_decoding
+    from ml.doc_cache import get_docstring_cache
+    from ml.templates import template_docstring
     from core.analyzer import MetricsAnalyzer
-    
-    # Generate docstring using trained model
-    if is_model_available():
+    from core.jobs import QueueFullError
+
+    timeout = min(request.timeout or GENERATE_TIMEOUT, GENERATE_TIMEOUT)
+    batcher = get_generation_batcher()
+    generation = None
+    decoding = None
+    template = template_docstring(request.code, request.language) if request.use_templates else None
+    if template is not None:
+        record_docstring_source("template", template[0])
+    elif is_model_available():
+        adapter = _resolve_adapter(request.language, request.adapter)
+        input_tokens = (await run_in_threadpool(token_lengths, [request.code], [request.language]))[0]
+        decoding = choose_decoding(input_tokens, request.latency_budget_ms, request.policy or DEFAULT_POLICY)
+        cache = get_docstring_cache()
+        key = cache.make_key(request.code, request.language, decoding=decoding._asdict(), adapter=adapter)
         try:
-            generated_doc = generate_docstring(request.code, request.language)
+            # Admission happens here, before any other work is started; cache
+            # hits and requests joining one in flight take no queue slot
+            generation = cache.submit(
+                key, lambda: batcher.submit((request.code, request.language, decoding, adapter), timeout=timeout))
+        except QueueFullError as e:
+            raise HTTPException(status_code=429, detail=f"Inference queue is full: {e}", headers={"Retry-After": "1"})
+
+    # Complexity metrics are computed in the threadpool while the model runs
+    analyzer = MetricsAnalyzer()
+    metrics_task = asyncio.ensure_future(run_in_threadpool(analyzer.analyze_code, request.code, request.language))
+
+    # Generate docstring using trained model; concurrent requests share a batch
+    if template is not None:
+        generated_doc = template[1]
+    elif generation is not None:
+        try:
+            generated_doc = await batcher.wait(generation, timeout, disconnected=http_request.is_disconnected)
+            record_docstring_source("model")
+        except ClientDisconnected:
+            # Nobody is listening any more; the request was cancelled if still queued
+            metrics_task.cancel()
+            return Response(status_code=499)
+        except TimeoutError as e:
+            metrics_task.cancel()
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
         except Exception as e:
             print(f"Model inference error: {e}")
             generated_doc = f"[Model error: {str(e)}]"
     else:
         generated_doc = "[Model not available - place trained model in backend/models/codet5-finetuned/]"
     
-    # Also calculate complexity metrics
-    analyzer = MetricsAnalyzer()
-    metrics = analyzer.analyze_code(request.code, request.language)
-    
+    metrics = await metrics_task
+    response = {"docstring": _format_docstring(generated_doc, metrics)}
+    if template is not None:
+        response["template"] = template[0]
+    if decoding is not None:
+        response["decoding"] = decoding._asdict()
+        response["adapter"] = adapter
+    return response
+
+def _resolve_adapter(language: str, adapter: Optional[str]) -> str:
+    from ml.inference import resolve_adapter
+
+    try:
+        return resolve_adapter(language, adapter)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _format_docstring(generated_doc: str, metrics: Optional[Dict]) -> str:
+    """The model's text followed by a complexity report, as a Python docstring."""
     complexity_info = ""
     if metrics:
         avg_cc = 0
@@ -83,6 +278,238 @@ async def generate_doc(request: GenerateRequest):
         complexity_info = f"\n\nComplexity Report:\n- Maintainability Index: {metrics.get('maintainability_index', 0):.2f}\n- Avg Cyclomatic Complexity: {avg_cc:.2f}\n- Max Cyclomatic Complexity: {max_cc}"
 
     # Combine model output with complexity info
-    docstring = f'"""\n{generated_doc}{complexity_info}\n"""'
-    return {"docstring": docstring}
+    return f'"""\n{generated_doc}{complexity_info}\n"""'
+
+STREAM_CONCURRENCY = int(os.environ.get("CODEWHISPER_STREAM_CONCURRENCY", "2"))
+_active_streams = 0
+_streams_lock = threading.Lock()
+
+class _StreamSlot:
+    """One of the STREAM_CONCURRENCY slots, taken by a request and given back exactly once."""
+
+    def __init__(self):
+        self._released = False
+
+    @classmethod
+    def acquire(cls) -> Optional["_StreamSlot"]:
+        global _active_streams
+        with _streams_lock:
+            if _active_streams >= STREAM_CONCURRENCY:
+                return None
+            _active_streams += 1
+        return cls()
+
+    def release(self):
+        global _active_streams
+        with _streams_lock:
+            if not self._released:
+                self._released = True
+                _active_streams -= 1
+
+class GenerateStreamRequest(BaseModel):
+    code: str
+    language: str
+    mode: str = Field(default="greedy", pattern="^(greedy|sample)$", description="Decoding mode; beam search cannot stream")
+    use_templates: bool = Field(default=True, description="Answer trivial functions with a template instead of the model")
+    adapter: Optional[str] = Field(default=None, description="LoRA adapter to generate with (defaults to the one named after the language, if any)")
+
+def _stream_generation(request: GenerateStreamRequest, fmt: str, started: float, adapter: str,
+                       slot: _StreamSlot) -> Iterator[str]:
+    """
+    "token" records as the model decodes, then a "done" record with the
+    complete docstring (including the complexity report), or an "error"
+    record if generation failed part-way. Gives back `slot` when done.
+    """
+    from ml.inference import STREAM_MODES, is_model_available, stream_docstring
+    from ml.doc_cache import get_docstring_cache
+    from ml.templates import template_docstring
+    from core.analyzer import MetricsAnalyzer
+
+    try:
+        cache = key = cached = source = None
+        template = template_docstring(request.code, request.language) if request.use_templates else None
+        if template is not None:
+            # Sent whole, as a single token record
+            pieces = iter([template[1]])
+            source = "template"
+        elif not is_model_available():
+            pieces = iter(["[Model not available - place trained model in backend/models/codet5-finetuned/]"])
+        else:
+            if request.mode == "greedy":
+                # Greedy decoding is deterministic, so its results can be cached
+                cache = get_docstring_cache()
+                key = cache.make_key(request.code, request.language, max_new_tokens=128, stream=STREAM_MODES["greedy"],
+                                     adapter=adapter)
+                cached = cache.get(key)
+                record_cache_lookup("docstring", cached is not None)
+            pieces = iter([cached]) if cached is not None else stream_docstring(
+                request.code, request.language, 128, request.mode, adapter)
+            source = "model"
+
+        generated = []
+        try:
+            for piece in pieces:
+                if not generated:
+                    record_time_to_first_token(request.mode, time.perf_counter() - started)
+                generated.append(piece)
+                yield _encode_record("token", {"text": piece}, fmt)
+        except Exception as e:
+            print(f"Model inference error: {e}")
+            yield _encode_record("error", {"detail": f"[Model error: {str(e)}]"}, fmt)
+            return
+        finally:
+            # Closes the model stream early if the client went away
+            close = getattr(pieces, "close", None)
+            if close is not None:
+                close()
+
+        generated_doc = "".join(generated)
+        if source is not None:
+            record_docstring_source(source, template[0] if template is not None else "")
+        if cache is not None and cached is None:
+            cache.put(key, generated_doc)
+        metrics = MetricsAnalyzer().analyze_code(request.code, request.language)
+        yield _encode_record("done", {"docstring": _format_docstring(generated_doc, metrics)}, fmt)
+    finally:
+        slot.release()
+
+@router.post("/generate/stream")
+def generate_doc_stream(request: GenerateStreamRequest, format: str = Query("sse", pattern="^(ndjson|sse)$")):
+    """
+    Streaming variant of /generate: the docstring is sent token by token as
+    the model decodes it (see _stream_generation for the records), in the
+    same ndjson or sse framing as /analyze/stream. At most
+    CODEWHISPER_STREAM_CONCURRENCY streams run at once; beyond that it
+    answers 429. An unknown adapter is answered with 400.
+    """
+    started = time.perf_counter()
+    adapter = _resolve_adapter(request.language, request.adapter)
+    # Taken here, not when the body starts streaming, so a burst cannot overshoot the limit
+    slot = _StreamSlot.acquire()
+    if slot is None:
+        raise HTTPException(status_code=429, detail="Too many streaming generations in progress",
+                            headers={"Retry-After": "1"})
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    # The background task gives the slot back if the body never started (client gone early)
+    return StreamingResponse(_stream_generation(request, format, started, adapter, slot), media_type=media_type,
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+                             background=BackgroundTask(slot.release))
+
+class GenerateBatchRequest(BaseModel):
+    code: str = Field(description="Contents of the whole file")
+    language: str
+    use_templates: bool = Field(default=True, description="Answer trivial functions with a template instead of the model")
+    adapter: Optional[str] = Field(default=None, description="LoRA adapter to generate with (defaults to the one named after the language, if any)")
+
+class FunctionDoc(BaseModel):
+    name: str
+    qualified_name: str
+    lineno: int
+    endline: Optional[int] = None
+    insert_line: int = Field(description="1-based line the documentation is inserted before")
+    docstring: str
+    text: str = Field(description="The documentation as it should be inserted: indented, delimited and newline-terminated")
+    template: Optional[str] = Field(default=None, description="Kind of template used instead of the model, if any")
+
+class GenerateBatchResponse(BaseModel):
+    functions: List[FunctionDoc]
+
+def _doc_comment(docstring: str, language: str, indent: str) -> str:
+    docstring = docstring.strip()
+    if language == "java":
+        lines = docstring.replace("*/", "* /").splitlines() or [""]
+        body = "".join(f"{indent} * {line}".rstrip() + "\n" for line in lines)
+        return f"{indent}/**\n{body}{indent} */\n"
+    docstring = docstring.replace("\\", "\\\\").replace('"""', '\\"\\"\\"')
+    if docstring.endswith('"'):
+        docstring += " "
+    return f'{indent}"""{docstring}"""\n'
+
+@router.post("/generate/batch", response_model=GenerateBatchResponse)
+async def generate_doc_batch(request: GenerateBatchRequest, http_request: Request):
+    """
+    Document every undocumented function of a file in one request.
+
+    Functions are found with the extractor's AST (Python) or javalang (Java)
+    traversal, sorted by prompt length in tokens so each padded batch holds
+    similar lengths, and sent through the generation batcher one batch at a
+    time, each with the decoding policy's choice for its length. Trivial
+    functions are answered from a template without the model. Results come
+    back in source order with the line each docstring belongs on. Answers
+    400 for an unknown adapter, 429 when the inference queue is full and 503
+    when the model is unavailable or did not finish in time.
+    """
+    from ml.inference import is_model_available, token_lengths
+    from ml.batching import ClientDisconnected, get_generation_batcher
+    from ml.decoding import choose_decoding
+    from ml.doc_cache import get_docstring_cache
+    from ml.templates import template_docstring
+    from core.extractor import CodeExtractor
+    from core.jobs import QueueFullError
+
+    language = request.language.lower()
+    adapter = _resolve_adapter(language, request.adapter)
+    functions = await run_in_threadpool(CodeExtractor().undocumented_functions, request.code, language)
+    if not functions:
+        return GenerateBatchResponse(functions=[])
+
+    codes = [f["code"] for f in functions]
+    templates = [None] * len(functions)
+    if request.use_templates:
+        templates = await run_in_threadpool(lambda: [template_docstring(code, language) for code in codes])
+    docstrings: List[Optional[str]] = [None] * len(functions)
+    for i, template in enumerate(templates):
+        if template is not None:
+            docstrings[i] = template[1]
+            record_docstring_source("template", template[0])
+    pending = [i for i, docstring in enumerate(docstrings) if docstring is None]
+    if pending and not is_model_available():
+        raise HTTPException(status_code=503, detail="Model not available - place trained model in backend/models/codet5-finetuned/")
+
+    lengths = dict(zip(pending, await run_in_threadpool(
+        token_lengths, [codes[i] for i in pending], [language] * len(pending)))) if pending else {}
+    order = sorted(pending, key=lambda i: lengths[i])
+
+    cache = get_docstring_cache()
+    batcher = get_generation_batcher()
+    for wave_start in range(0, len(order), batcher.max_batch_size):
+        wave = order[wave_start:wave_start + batcher.max_batch_size]
+        futures = []
+        try:
+            for i in wave:
+                decoding = choose_decoding(lengths[i])
+                key = cache.make_key(codes[i], language, decoding=decoding._asdict(), adapter=adapter)
+                futures.append(cache.submit(key, lambda code=codes[i], decoding=decoding: batcher.submit(
+                    (code, language, decoding, adapter), timeout=GENERATE_TIMEOUT)))
+        except QueueFullError as e:
+            for future in futures:
+                future.cancel()
+            raise HTTPException(status_code=429, detail=f"Inference queue is full: {e}", headers={"Retry-After": "1"})
+
+        results = await asyncio.gather(
+            *(batcher.wait(future, GENERATE_TIMEOUT, disconnected=http_request.is_disconnected) for future in futures),
+            return_exceptions=True)
+        for i, result in zip(wave, results):
+            if isinstance(result, ClientDisconnected):
+                return Response(status_code=499)
+            if isinstance(result, TimeoutError):
+                raise HTTPException(status_code=503, detail=str(result), headers={"Retry-After": "1"})
+            if isinstance(result, BaseException):
+                print(f"Model inference error: {result}")
+                raise HTTPException(status_code=500, detail=f"Model error: {result}")
+            docstrings[i] = result
+            record_docstring_source("model")
 
+    return GenerateBatchResponse(functions=[
+        FunctionDoc(
+            name=f["name"],
+            qualified_name=f["qualified_name"],
+            lineno=f["lineno"],
+            endline=f["endline"],
+            insert_line=f["insert_line"],
+            docstring=docstring,
+            text=_doc_comment(docstring, language, f["indent"]),
+            template=template[0] if template is not None else None
+        )
+        for f, docstring, template in zip(functions, docstrings, templates)
+    ])
@@ -0,0 +1,89 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel
+from typing import Optional
+import os
+from core.engine import get_engine
+from core.jobs import COMPLETED, CANCELLED, Job, QueueFullError, get_job_manager
+from core.scanner import scan_directory
+from core.telemetry import stage
+from core.watcher import get_watcher
+from api.analysis import AnalysisRequest, AnalysisResponse, _file_metric
+
+router = APIRouter()
+
+class JobStatus(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    processed: int
+    total: Optional[int] = None
+    progress: Optional[float] = None
+    results: int
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+
+def _run_analysis(job: Job, request: AnalysisRequest):
+    watcher = get_watcher(request.project_path)
+    if watcher is not None:
+        _, entries = watcher.index.snapshot()
+        job.set_total(len(entries))
+        job.advance(len(entries), [dict(m, file_path=os.path.join(request.project_path, rel)) for rel, m in entries])
+        return
+
+    # Listing the tree first gives a total for progress reporting
+    paths = []
+    with stage("scan"):
+        for path in scan_directory(request.project_path):
+            if job.cancelled:
+                return
+            paths.append(path)
+    job.set_total(len(paths))
+    for count, results in get_engine(jobs=request.jobs).iter_chunks(paths):
+        job.advance(count, results)
+        if job.cancelled:
+            return
+
+def _get_job(job_id: str) -> Job:
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/jobs/analyze", response_model=JobStatus, status_code=202)
+def submit_analysis(request: AnalysisRequest):
+    """Queue a project analysis and return immediately with a job id."""
+    if not os.path.exists(request.project_path):
+        raise HTTPException(status_code=404, detail="Project path not found")
+    try:
+        job = get_job_manager().submit("analyze", _run_analysis, request,
+                                       params={"include_functions": request.include_functions})
+    except QueueFullError as e:
+        raise HTTPException(status_code=429, detail=f"Analysis queue is full: {e}", headers={"Retry-After": "5"})
+    return job.status_dict()
+
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+def job_status(job_id: str):
+    """Status and progress (files processed out of total) of a job."""
+    return _get_job(job_id).status_dict()
+
+@router.post("/jobs/{job_id}/cancel", response_model=JobStatus)
+def cancel_job(job_id: str):
+    """Request cancellation; results collected so far are kept."""
+    _get_job(job_id)
+    return get_job_manager().cancel(job_id).status_dict()
+
+@router.get("/jobs/{job_id}/result", response_model=AnalysisResponse, response_model_exclude_none=True)
+def job_result(job_id: str):
+    """
+    Results of a completed job, or the partial results of a cancelled one,
+    with per-function metrics if the job was submitted with include_functions.
+    """
+    job = _get_job(job_id)
+    if job.status not in (COMPLETED, CANCELLED):
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    include_functions = job.params.get("include_functions", False)
+    metrics = [_file_metric(result, include_functions) for result in job.snapshot_results()]
+    avg_complexity = sum(m.complexity for m in metrics) / len(metrics) if metrics else 0
+    return AnalysisResponse(files=metrics, average_complexity=avg_complexity)
@@ -0,0 +1,66 @@
+from fastapi import APIRouter, HTTPException
+from pydantic import BaseModel, Field
+from typing import List, Optional
+import os
+from core.watcher import get_watcher, list_watchers, unwatch_project, watch_project
+from api.analysis import FileMetric, _file_metric
+
+router = APIRouter()
+
+class WatchRequest(BaseModel):
+    project_path: str
+    jobs: Optional[int] = Field(default=None, ge=1, description="Worker processes for the initial scan")
+    polling: bool = Field(default=False, description="Poll for changes instead of using file system events")
+
+class WatchStatus(BaseModel):
+    project_path: str
+    mode: str
+    version: int
+    files: int
+
+class ChangesResponse(BaseModel):
+    version: int
+    files: List[FileMetric]
+    deleted: List[str]
+    reset: bool = Field(default=False, description="`files` lists every file; drop any others")
+
+def _status(watcher) -> WatchStatus:
+    return WatchStatus(project_path=watcher.root, mode=watcher.mode, version=watcher.index.version,
+                       files=len(watcher.index))
+
+@router.post("/watch", response_model=WatchStatus)
+def watch(request: WatchRequest):
+    """Start keeping a live metrics index for a project root."""
+    if not os.path.isdir(request.project_path):
+        raise HTTPException(status_code=404, detail="Project path not found")
+    return _status(watch_project(request.project_path, jobs=request.jobs, use_polling=request.polling))
+
+@router.get("/watch", response_model=List[WatchStatus])
+def list_watched():
+    return [_status(w) for w in list_watchers()]
+
+@router.delete("/watch")
+def unwatch(project_path: str):
+    if not unwatch_project(project_path):
+        raise HTTPException(status_code=404, detail="Project is not being watched")
+    return {"status": "stopped"}
+
+@router.get("/watch/changes", response_model=ChangesResponse, response_model_exclude_none=True)
+def changes(project_path: str, since: int = 0, include_functions: bool = False):
+    """
+    Files whose metrics changed, and files deleted, after version `since`.
+    Pass the returned version as `since` on the next call. Only the most
+    recent deletions are kept; a client whose `since` is older than those,
+    or newer than the current version, gets `reset` with the full file list
+    instead.
+    """
+    watcher = get_watcher(project_path)
+    if watcher is None:
+        raise HTTPException(status_code=404, detail="Project is not being watched")
+    version, changed, deleted, reset = watcher.index.changes_since(since)
+    return ChangesResponse(
+        version=version,
+        files=[_file_metric(dict(m, file_path=os.path.join(project_path, rel)), include_functions) for rel, m in changed],
+        deleted=[os.path.join(project_path, rel) for rel in deleted],
+        reset=reset
+    )
@@ -0,0 +1,142 @@
+"""
+Benchmark for MetricsAnalyzer._analyze_python_code.
+
+Compares the single-parse pipeline against the previous implementation,
+which parsed every file four times (mi_visit, raw.analyze, ast.parse and
+cc_visit). Both paths are run over the same corpus and their outputs are
+checked for equality before timings are reported. (Docstring flags and
+function identities are excluded from the comparison: the old path keyed
+docstrings by bare name and got them wrong for duplicate names.)
+
+Usage (from backend/):
+    python -m benchmarks.bench_python_metrics [corpus_dir] [--limit N] [--repeat R]
+
+The corpus defaults to the Python standard library, which is large and
+available offline.
+"""
+import argparse
+import ast
+import os
+import sysconfig
+import time
+from typing import Any, Dict, List
+
+import radon.complexity as radon_cc
+import radon.metrics as radon_metrics
+import radon.raw as radon_raw
+from radon.visitors import Function
+
+from core.analyzer import MetricsAnalyzer
+
+
+def legacy_analyze_python_code(code: str) -> Dict[str, Any]:
+    """The four-parse implementation, kept verbatim as the baseline."""
+    try:
+        mi = radon_metrics.mi_visit(code, multi=False)
+    except:
+        mi = 0
+
+    try:
+        raw = radon_raw.analyze(code)
+        loc = raw.loc
+        sloc = raw.sloc
+    except:
+        loc = 0
+        sloc = 0
+
+    functions = []
+    try:
+        tree = ast.parse(code)
+        docstrings = {}
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                docstrings[node.name] = bool(ast.get_docstring(node))
+
+        blocks = radon_cc.cc_visit(code)
+        for block in blocks:
+            if isinstance(block, Function):
+                functions.append({
+                    "name": block.name,
+                    "lineno": block.lineno,
+                    "cyclomatic_complexity": block.complexity,
+                    "type": "method" if block.is_method else "function",
+                    "has_docstring": docstrings.get(block.name, False)
+                })
+    except Exception:
+        pass
+
+    return {
+        "language": "python",
+        "loc": loc,
+        "sloc": sloc,
+        "maintainability_index": mi,
+        "functions": functions
+    }
+
+
+_COMPARED_FUNCTION_FIELDS = ("name", "lineno", "cyclomatic_complexity", "type")
+
+
+def _comparable(result: Dict[str, Any]) -> Dict[str, Any]:
+    comparable = {k: v for k, v in result.items() if k != "functions"}
+    comparable["functions"] = [tuple(f[k] for k in _COMPARED_FUNCTION_FIELDS) for f in result["functions"]]
+    return comparable
+
+
+def load_corpus(root: str, limit: int) -> List[str]:
+    sources = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in ('site-packages', '__pycache__'))
+        for name in sorted(filenames):
+            if not name.endswith('.py'):
+                continue
+            try:
+                with open(os.path.join(dirpath, name), 'r', encoding='utf-8') as f:
+                    sources.append(f.read())
+            except (OSError, UnicodeDecodeError):
+                continue
+            if limit and len(sources) >= limit:
+                return sources
+    return sources
+
+
+def _time(fn, sources: List[str], repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for code in sources:
+            fn(code)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python metrics pipeline")
+    parser.add_argument("corpus", nargs="?", default=sysconfig.get_paths()["stdlib"], help="Directory of Python files")
+    parser.add_argument("--limit", type=int, default=0, help="Maximum number of files (0 = all)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation; the best is reported")
+    args = parser.parse_args()
+
+    sources = load_corpus(args.corpus, args.limit)
+    if not sources:
+        print(f"No Python files found under {args.corpus}")
+        return
+    total_bytes = sum(len(s) for s in sources)
+    print(f"Corpus: {len(sources)} files, {total_bytes / 1e6:.1f} MB from {args.corpus}")
+
+    analyzer = MetricsAnalyzer()
+    mismatches = sum(1 for code in sources
+                     if _comparable(legacy_analyze_python_code(code)) != _comparable(analyzer._analyze_python_code(code)))
+    print(f"Output mismatches: {mismatches}")
+
+    legacy = _time(legacy_analyze_python_code, sources, args.repeat)
+    current = _time(analyzer._analyze_python_code, sources, args.repeat)
+
+    print(f"{'pipeline':<14}{'total s':>10}{'ms/file':>10}{'files/s':>10}")
+    for name, seconds in (("four-parse", legacy), ("single-parse", current)):
+        print(f"{name:<14}{seconds:>10.2f}{seconds / len(sources) * 1000:>10.3f}{len(sources) / seconds:>10.1f}")
+    print(f"Speedup: {legacy / current:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
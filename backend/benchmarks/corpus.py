@@ -0,0 +1,162 @@
+"""
+Deterministic synthetic corpora for the benchmark suite.
+
+A corpus is a tree of Python and Java sources (about one Java file in five,
+100 files per package directory) plus, next to it, the same files in the
+scraped `.txt` format that DataProcessor consumes. Content is generated from
+a seeded RNG, so a given (size, seed) always produces byte-identical files
+and results from different machines or releases are comparable.
+
+The "giant" corpus holds a few pathological files instead: one very large
+module, one module with thousands of small functions, a very long boolean
+expression, deeply nested control flow, and very long lines.
+"""
+import os
+import random
+import tempfile
+from typing import Dict, List
+
+CORPUS_VERSION = "1"
+DEFAULT_SEED = 1234
+DEFAULT_ROOT = os.path.join(tempfile.gettempdir(), "codewhisper-bench")
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000}
+FILES_PER_DIR = 100
+JAVA_RATIO = 0.2
+
+_WORDS = ("value", "count", "item", "node", "result", "buffer", "index", "total", "name", "config",
+          "request", "record", "entry", "limit", "offset", "token", "state", "cache", "queue", "path")
+
+
+def _ident(rng: random.Random, parts: int = 2) -> str:
+    return "_".join(rng.choice(_WORDS) for _ in range(parts))
+
+
+def _python_function(rng: random.Random, name: str, indent: str = "", method: bool = False) -> List[str]:
+    args = [_ident(rng, 1) + str(i) for i in range(rng.randint(0, 4))]
+    if method:
+        args.insert(0, "self")
+    lines = [f"{indent}def {name}({', '.join(args)}):"]
+    body = indent + "    "
+    if rng.random() < 0.6:
+        lines.append(f'{body}"""{rng.choice(_WORDS).capitalize()} the {rng.choice(_WORDS)} for {name}."""')
+    var = _ident(rng, 1)
+    lines.append(f"{body}{var} = 0")
+    for _ in range(rng.randint(1, 6)):
+        kind = rng.random()
+        other = _ident(rng, 1)
+        if kind < 0.3:
+            lines += [f"{body}if {var} > {rng.randint(0, 9)} and {other} is not None:",
+                      f"{body}    {var} += {rng.randint(1, 5)}",
+                      f"{body}else:",
+                      f"{body}    {var} -= 1"]
+        elif kind < 0.5:
+            lines += [f"{body}for {other} in range({rng.randint(2, 20)}):",
+                      f"{body}    {var} += {other}"]
+        elif kind < 0.6:
+            lines += [f"{body}while {var} < {rng.randint(10, 99)}:",
+                      f"{body}    {var} += 7"]
+        elif kind < 0.7:
+            lines += [f"{body}try:",
+                      f"{body}    {var} = int({var})",
+                      f"{body}except ValueError:",
+                      f"{body}    {var} = 0"]
+        else:
+            lines.append(f"{body}{other} = [{var} * i for i in range({rng.randint(1, 9)})]")
+    lines.append(f"{body}return {var}")
+    return lines
+
+
+def python_source(rng: random.Random) -> str:
+    lines = ['"""Generated module."""', "import os", "import sys", ""]
+    for i in range(rng.randint(2, 12)):
+        if rng.random() < 0.3:
+            lines += ["", f"class {_ident(rng, 1).capitalize()}{i}:"]
+            if rng.random() < 0.5:
+                lines.append(f'    """A {rng.choice(_WORDS)} holder."""')
+            for j in range(rng.randint(1, 5)):
+                lines += [""] + _python_function(rng, f"{_ident(rng)}_{j}", "    ", method=True)
+        else:
+            lines += [""] + _python_function(rng, f"{_ident(rng)}_{i}")
+    return "\n".join(lines) + "\n"
+
+
+def java_source(rng: random.Random, class_name: str, methods: int = 0) -> str:
+    lines = ["package bench;", "", f"public class {class_name} {{"]
+    for i in range(methods or rng.randint(2, 10)):
+        name = _ident(rng, 1) + str(i)
+        if rng.random() < 0.6:
+            lines += ["    /**", f"     * Computes the {rng.choice(_WORDS)} for {name}.", "     */"]
+        lines += [f"    public int {name}(int a, int b) {{", "        int total = 0;"]
+        for _ in range(rng.randint(1, 5)):
+            if rng.random() < 0.5:
+                lines += [f"        if (a > {rng.randint(0, 9)} && b < {rng.randint(10, 99)}) {{",
+                          "            total += a;", "        }"]
+            else:
+                lines += [f"        for (int i = 0; i < {rng.randint(2, 20)}; i++) {{",
+                          "            total += i * b;", "        }"]
+        lines += ["        return total;", "    }", ""]
+    lines.append("}")
+    return "\n".join(lines) + "\n"
+
+
+def giant_sources(seed: int = DEFAULT_SEED) -> Dict[str, str]:
+    rng = random.Random(f"{seed}-giant")
+    sources = {}
+    sources["huge_module.py"] = "".join(python_source(rng) for _ in range(400))
+    sources["many_functions.py"] = "\n".join(
+        f"def f{i}(x):\n    return x + {i}\n" for i in range(5000))
+    sources["long_boolop.py"] = "def check(x):\n    return " + " and ".join(f"x > {i}" for i in range(5000)) + "\n"
+    # Stay below the parser's nesting limit (~100 indentation levels)
+    nested = ["def deep(x):"]
+    for depth in range(1, 90):
+        nested.append("    " * depth + f"if x > {depth}:")
+    nested.append("    " * 90 + "return x")
+    sources["deep_nesting.py"] = "\n".join(nested) + "\n"
+    sources["long_lines.py"] = "\n".join(
+        f"TABLE_{i} = [" + ", ".join(str(j) for j in range(2000)) + "]" for i in range(50)) + "\n"
+    sources["Giant.java"] = java_source(rng, "Giant", methods=3000)
+    return sources
+
+
+def _scraped(rel_path: str, language: str, source: str) -> str:
+    # Same header format core/github_scraper.py writes
+    return f"Repo: bench/synthetic\nPath: {rel_path}\nLanguage: {language}\n\n{source}"
+
+
+def _write(path: str, content: str):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def ensure_corpus(size: str, root: str = DEFAULT_ROOT, seed: int = DEFAULT_SEED) -> str:
+    """
+    Path of the corpus directory for `size` ("1k", "10k", "100k" or "giant"),
+    generating it on first use. Sources are under `<dir>/src`, the scraped
+    copies under `<dir>/scraped`.
+    """
+    corpus_dir = os.path.join(root, f"{size}-s{seed}-v{CORPUS_VERSION}")
+    marker = os.path.join(corpus_dir, ".complete")
+    if os.path.exists(marker):
+        return corpus_dir
+
+    print(f"Generating {size} corpus in {corpus_dir}...")
+    if size == "giant":
+        files = giant_sources(seed)
+    else:
+        rng = random.Random(f"{seed}-{size}")
+        files = {}
+        for i in range(SIZES[size]):
+            package = f"pkg{i // FILES_PER_DIR:04d}"
+            if rng.random() < JAVA_RATIO:
+                class_name = f"Module{i:06d}"
+                files[f"{package}/{class_name}.java"] = java_source(rng, class_name)
+            else:
+                files[f"{package}/module_{i:06d}.py"] = python_source(rng)
+
+    for rel_path, source in files.items():
+        language = "java" if rel_path.endswith(".java") else "python"
+        _write(os.path.join(corpus_dir, "src", rel_path), source)
+        _write(os.path.join(corpus_dir, "scraped", rel_path + ".txt"), _scraped(rel_path, language, source))
+    _write(marker, "")
+    return corpus_dir
@@ -0,0 +1,133 @@
+"""
+Load test for micro-batched docstring generation.
+
+Runs 1, 8 and 32 concurrent clients against the generation batcher, once
+with batching disabled (max batch size 1: requests serialize, as they did
+before the scheduler) and once with batching, and reports throughput and
+latency percentiles for each.
+
+By default the model is simulated: a generate call sleeps for a fixed
+overhead plus a small per-item cost, which is roughly how beam search on a
+padded batch scales and lets the test run offline. --real uses the
+fine-tuned model from models/codet5-finetuned instead.
+
+Usage (from backend/):
+    python -m benchmarks.load_generate [--clients 1,8,32] [--requests 20]
+                                       [--max-batch-size 8] [--max-wait-ms 10]
+                                       [--real] [--output load.json]
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+from typing import Any, Callable, Dict, List
+
+from ml.batching import MicroBatcher
+from ml.decoding import FIXED_DECODING
+
+SAMPLE_CODE = '''def moving_average(values, window):
+    total = 0
+    result = []
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        result.append(total / min(i + 1, window))
+    return result
+'''
+
+
+def simulated_generate(overhead: float, per_item: float) -> Callable[[List[Any]], List[str]]:
+    def generate(items: List[Any]) -> List[str]:
+        time.sleep(overhead + per_item * len(items))
+        return ["Compute a moving average." for _ in items]
+    return generate
+
+
+def real_generate(items: List[Any]) -> List[str]:
+    from ml.inference import generate_docstrings
+    return generate_docstrings([code for code, _, _, _ in items], [lang for _, lang, _, _ in items],
+                               decoding=items[0][2], adapter=items[0][3])
+
+
+def run_load(batch_fn: Callable, clients: int, requests_per_client: int, max_batch_size: int,
+             max_wait: float) -> Dict[str, Any]:
+    batcher = MicroBatcher(batch_fn, max_batch_size=max_batch_size, max_wait=max_wait, key=lambda item: item[2:])
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            batcher.submit((SAMPLE_CODE, "python", FIXED_DECODING, "default")).result()
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    batcher.shutdown()
+
+    latencies.sort()
+    return {
+        "clients": clients,
+        "max_batch_size": max_batch_size,
+        "requests": len(latencies),
+        "seconds": elapsed,
+        "requests_per_s": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000,
+        "mean_batch_size": batcher.items / batcher.batches if batcher.batches else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test micro-batched generation")
+    parser.add_argument("--clients", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=20, help="Requests sent by each client")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--overhead-ms", type=float, default=80, help="Simulated cost of one generate call")
+    parser.add_argument("--per-item-ms", type=float, default=8, help="Simulated extra cost per batched request")
+    parser.add_argument("--real", action="store_true", help="Use the fine-tuned model instead of the simulation")
+    parser.add_argument("--output", help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    if args.real:
+        from ml.inference import is_model_available, load_model
+        if not is_model_available():
+            parser.error("no trained model in models/codet5-finetuned")
+        load_model()
+        batch_fn = real_generate
+    else:
+        batch_fn = simulated_generate(args.overhead_ms / 1000, args.per_item_ms / 1000)
+
+    results = []
+    if not args.real:
+        print(f"Simulated model: {args.overhead_ms:g} ms per generate call + {args.per_item_ms:g} ms per request "
+              "(pass --real to measure the fine-tuned model)")
+    print(f"{'clients':>8}{'batch':>7}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'avg batch':>11}")
+    for clients in (int(c) for c in args.clients.split(",")):
+        row = {}
+        for max_batch_size in (1, args.max_batch_size):
+            result = run_load(batch_fn, clients, args.requests, max_batch_size, args.max_wait_ms / 1000)
+            results.append(result)
+            row[max_batch_size] = result
+            print(f"{clients:>8}{max_batch_size:>7}{result['requests_per_s']:>9.1f}{result['p50_ms']:>9.0f}"
+                  f"{result['p99_ms']:>9.0f}{result['mean_batch_size']:>11.1f}")
+        speedup = row[args.max_batch_size]["requests_per_s"] / row[1]["requests_per_s"]
+        print(f"{'':>8}throughput gain with batching: {speedup:.2f}x ({'fine-tuned model' if args.real else 'simulated model'})")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"simulated": not args.real, "results": results}, f, indent=2)
+        print(f"Saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
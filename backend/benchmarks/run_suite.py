@@ -0,0 +1,257 @@
+"""
+Benchmark suite for the analysis and data pipelines.
+
+Times scan_directory, calculate_cyclomatic_complexity,
+MetricsAnalyzer.analyze_file, CodeExtractor and DataProcessor.process over
+synthetic corpora (see benchmarks/corpus.py), and writes the results as
+JSON. Every (benchmark, corpus) case runs in a fresh process, so the peak RSS
+it reports belongs to that case alone; on Linux it is reset after the case's
+setup and covers only the timed runs. Everything runs offline.
+
+Usage (from backend/):
+    python -m benchmarks.run_suite [--sizes 1k,10k,100k,giant] [--only analyze_file,...]
+                                   [--repeat R] [--output results.json]
+                                   [--baseline old.json [--threshold 0.1] [--fail-on-regression]]
+
+With --baseline, each case is compared with the same case in an earlier
+results file and cases slower by more than --threshold are flagged.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from benchmarks.corpus import CORPUS_VERSION, DEFAULT_ROOT, DEFAULT_SEED, SIZES, ensure_corpus
+
+DEFAULT_SIZES = "1k,giant"
+DEFAULT_THRESHOLD = 0.10
+
+
+def _source_files(src_dir: str) -> List[str]:
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(src_dir):
+        dirnames.sort()
+        paths.extend(os.path.join(dirpath, name) for name in sorted(filenames))
+    return paths
+
+
+def _total_bytes(paths: List[str]) -> int:
+    return sum(os.path.getsize(p) for p in paths)
+
+
+# Each setup function prepares a case outside the timed region and returns
+# (the function to time, files processed per run, bytes processed per run).
+# Anything to clean up afterwards is registered on `cleanup`.
+
+def _setup_scan(corpus_dir: str, cleanup: contextlib.ExitStack) -> Tuple[Callable[[], Any], int, int]:
+    from core.scanner import scan_directory
+    src = os.path.join(corpus_dir, "src")
+    paths = list(scan_directory(src))
+    return (lambda: list(scan_directory(src))), len(paths), _total_bytes(paths)
+
+
+def _setup_complexity(corpus_dir: str, cleanup: contextlib.ExitStack):
+    from core.metrics import calculate_cyclomatic_complexity
+    sources = []
+    for path in _source_files(os.path.join(corpus_dir, "src")):
+        if path.endswith(".py"):
+            with open(path, "r", encoding="utf-8") as f:
+                sources.append(f.read())
+
+    def run():
+        for source in sources:
+            calculate_cyclomatic_complexity(source)
+    return run, len(sources), sum(len(s.encode("utf-8")) for s in sources)
+
+
+def _setup_analyze_file(corpus_dir: str, cleanup: contextlib.ExitStack):
+    from core.analyzer import MetricsAnalyzer
+    paths = _source_files(os.path.join(corpus_dir, "src"))
+    # No persistent cache: every run must do the full analysis
+    analyzer = MetricsAnalyzer()
+
+    def run():
+        for path in paths:
+            analyzer.analyze_file(path)
+    return run, len(paths), _total_bytes(paths)
+
+
+def _setup_extractor(corpus_dir: str, cleanup: contextlib.ExitStack):
+    from core.extractor import CodeExtractor
+    src = os.path.join(corpus_dir, "src")
+    paths = _source_files(src)
+    return (lambda: CodeExtractor().extract_from_directory(src)), len(paths), _total_bytes(paths)
+
+
+def _setup_data_processor(corpus_dir: str, cleanup: contextlib.ExitStack):
+    from core.data_processor import DataProcessor
+    scraped = os.path.join(corpus_dir, "scraped")
+    paths = _source_files(scraped)
+    output_dir = cleanup.enter_context(tempfile.TemporaryDirectory(prefix="codewhisper-bench-out-"))
+    return (lambda: DataProcessor(scraped, output_dir).process()), len(paths), _total_bytes(paths)
+
+
+BENCHMARKS: Dict[str, Callable[[str, contextlib.ExitStack], Tuple[Callable[[], Any], int, int]]] = {
+    "scan_directory": _setup_scan,
+    "cyclomatic_complexity": _setup_complexity,
+    "analyze_file": _setup_analyze_file,
+    "code_extractor": _setup_extractor,
+    "data_processor": _setup_data_processor,
+}
+
+
+def _reset_peak_rss() -> bool:
+    """Restart peak RSS tracking from the current RSS (Linux); False if not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(name: str, corpus_dir: str, repeat: int) -> Dict[str, Any]:
+    """Run one benchmark; meant to be called in a fresh process."""
+    with contextlib.ExitStack() as cleanup:
+        run, files, nbytes = BENCHMARKS[name](corpus_dir, cleanup)
+        # Peak RSS should cover the runs, not loading the corpus in setup
+        peak_reset = _reset_peak_rss()
+        times = []
+        for _ in range(repeat):
+            with contextlib.redirect_stdout(io.StringIO()):
+                start = time.perf_counter()
+                run()
+                times.append(time.perf_counter() - start)
+        peak_rss = _peak_rss_mb()
+    best = min(times)
+    return {
+        "files": files,
+        "bytes": nbytes,
+        "seconds": best,
+        "mean_seconds": sum(times) / len(times),
+        "files_per_s": files / best if best else None,
+        "mb_per_s": nbytes / 1e6 / best if best else None,
+        "peak_rss_mb": peak_rss,
+        "peak_rss_includes_setup": not peak_reset,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                             cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        return out.stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """Cases whose best time grew by more than `threshold` relative to `baseline`."""
+    previous = {(r["benchmark"], r["corpus"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'benchmark':<24}{'corpus':<8}{'baseline s':>12}{'current s':>12}{'ratio':>8}")
+    for result in results:
+        old = previous.get((result["benchmark"], result["corpus"]))
+        if old is None or not old["seconds"]:
+            continue
+        ratio = result["seconds"] / old["seconds"]
+        flag = "  REGRESSION" if ratio > 1 + threshold else ""
+        print(f"{result['benchmark']:<24}{result['corpus']:<8}{old['seconds']:>12.3f}{result['seconds']:>12.3f}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(dict(result, baseline_seconds=old["seconds"], ratio=ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis and data pipelines")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma-separated corpora: {', '.join(SIZES)}, giant")
+    parser.add_argument("--only", help=f"Comma-separated benchmarks (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the best is reported")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED, help="Corpus generator seed")
+    parser.add_argument("--corpus-root", default=DEFAULT_ROOT, help="Where generated corpora are kept between runs")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results JSON file")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed slowdown before a case counts as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if any case regressed")
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    names = [n.strip() for n in args.only.split(",")] if args.only else list(BENCHMARKS)
+    for size in sizes:
+        if size not in SIZES and size != "giant":
+            parser.error(f"unknown corpus size: {size}")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark: {name}")
+
+    results = []
+    print(f"{'benchmark':<24}{'corpus':<8}{'files':>8}{'best s':>10}{'files/s':>12}{'MB/s':>10}{'peak MB':>9}")
+    for size in sizes:
+        corpus_dir = ensure_corpus(size, args.corpus_root, args.seed)
+        for name in names:
+            # A fresh interpreter per case keeps peak RSS and warm caches separate
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_case, name, corpus_dir, args.repeat).result()
+            result = dict(benchmark=name, corpus=size, **result)
+            results.append(result)
+            rss = f"{result['peak_rss_mb']:.0f}" if result["peak_rss_mb"] is not None else "-"
+            print(f"{name:<24}{size:<8}{result['files']:>8}{result['seconds']:>10.3f}"
+                  f"{result['files_per_s'] or 0:>12.1f}{result['mb_per_s'] or 0:>10.2f}{rss:>9}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "corpus_version": CORPUS_VERSION,
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
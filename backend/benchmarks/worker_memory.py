@@ -0,0 +1,149 @@
+"""
+Startup time and memory of multi-worker servers.
+
+Starts `uvicorn main:app --workers N` for each worker count and inference
+backend, waits until every worker reports ready on /ready (each worker loads
+and warms up the model itself), then reads each worker's memory from
+/proc/<pid>/smaps_rollup and stops the server. RSS counts every page a
+worker maps, including weights it shares with the others; PSS divides
+shared pages among the processes sharing them, so the sum of PSS over the
+workers is the memory the server really uses.
+
+Compare the default torch backend, where each worker loads its own copy of
+the weights, with the mmap backend (python -m ml.export_merged first),
+where the workers map one copy.
+
+Linux only (reads /proc). Usage (from backend/):
+    python -m benchmarks.worker_memory [--workers 1,4,8] [--backends torch,mmap]
+                                       [--port 8765] [--output worker_memory.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Any, Dict, List, Optional
+
+# smaps_rollup fields reported, in kB
+MEMORY_FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+def read_memory(pid: int) -> Dict[str, float]:
+    """Memory of process `pid` in MB, from /proc/<pid>/smaps_rollup."""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            field = parts[0].rstrip(":")
+            if field in MEMORY_FIELDS:
+                memory[field.lower() + "_mb"] = int(parts[1]) / 1024
+    return memory
+
+
+def _ready_status(url: str) -> Optional[Dict[str, Any]]:
+    # A new connection per call, so the kernel hands it to any of the workers
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return json.load(response)
+    except urllib.error.HTTPError as e:
+        return json.load(e)
+    except (urllib.error.URLError, ConnectionError, OSError):
+        # Not listening yet
+        return None
+
+
+def wait_until_ready(url: str, workers: int, server: subprocess.Popen, timeout: float) -> List[Dict[str, Any]]:
+    """The /ready status of each of the `workers` processes, once all are ready."""
+    ready: Dict[int, Dict[str, Any]] = {}
+    deadline = time.monotonic() + timeout
+    while len(ready) < workers:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with status {server.returncode}")
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Only {len(ready)} of {workers} workers ready after {timeout:.0f}s")
+        status = _ready_status(url)
+        if status is None:
+            time.sleep(0.2)
+        elif status["status"] == "failed":
+            raise RuntimeError(f"Model load failed in worker {status.get('pid')}: {status.get('error')}")
+        elif status["status"] == "ready":
+            ready[status["pid"]] = status
+        else:
+            time.sleep(0.05)
+    return list(ready.values())
+
+
+def run_case(backend: str, workers: int, port: int, timeout: float) -> Dict[str, Any]:
+    env = dict(os.environ, CODEWHISPER_INFERENCE_BACKEND=backend)
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers),
+               "--port", str(port), "--log-level", "warning"]
+    start = time.perf_counter()
+    server = subprocess.Popen(command, env=env)
+    try:
+        statuses = wait_until_ready(f"http://127.0.0.1:{port}/ready", workers, server, timeout)
+        startup = time.perf_counter() - start
+        per_worker = []
+        for status in sorted(statuses, key=lambda s: s["pid"]):
+            per_worker.append({"pid": status["pid"], "load_seconds": status["load_seconds"],
+                               **read_memory(status["pid"])})
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def mean(field: str) -> float:
+        return sum(w[field] for w in per_worker) / len(per_worker)
+
+    return {
+        "backend": backend,
+        "workers": workers,
+        "startup_seconds": startup,
+        "mean_load_seconds": mean("load_seconds"),
+        "mean_rss_mb": mean("rss_mb"),
+        "mean_pss_mb": mean("pss_mb"),
+        "total_pss_mb": sum(w["pss_mb"] for w in per_worker),
+        "per_worker": per_worker,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure startup time and memory per uvicorn worker")
+    parser.add_argument("--workers", default="1,4,8", help="Comma-separated worker counts")
+    parser.add_argument("--backends", default="torch,mmap", help="Comma-separated inference backends")
+    parser.add_argument("--port", type=int, default=8765, help="Port the servers listen on")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for all workers to be ready")
+    parser.add_argument("--output", default="worker_memory.json", help="Results JSON file")
+    args = parser.parse_args()
+
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        parser.error("needs Linux: memory is read from /proc/<pid>/smaps_rollup")
+
+    results = []
+    print(f"{'backend':<12} {'workers':>7} {'startup s':>10} {'RSS/worker MB':>14} {'PSS/worker MB':>14} {'total PSS MB':>13}")
+    for backend in args.backends.split(","):
+        for workers in [int(n) for n in args.workers.split(",")]:
+            result = run_case(backend, workers, args.port, args.timeout)
+            results.append(result)
+            print(f"{backend:<12} {workers:>7} {result['startup_seconds']:>10.1f} {result['mean_rss_mb']:>14.0f} "
+                  f"{result['mean_pss_mb']:>14.0f} {result['total_pss_mb']:>13.0f}")
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,166 +1,334 @@
+import ast
 import json
 import os
-import radon.complexity as radon_cc
 import radon.metrics as radon_metrics
 import radon.raw as radon_raw
-from radon.visitors import Function, Class
+from radon.visitors import ComplexityVisitor, Function, Class
 import lizard
-from typing import List, Dict, Any
+import javalang
+from typing import List, Dict, Any, Optional
+from core.cache import MetricsCache, open_default_cache
+from core.symbols import LINE_TOLERANCE, SymbolTable
+from core.telemetry import stage
+
+# Bump whenever the shape or meaning of analyze_file's output changes, so
+# stale entries in the persistent cache are ignored.
+ANALYZER_VERSION = "3"
+
+LANGUAGE_EXTENSIONS = {
+    '.py': 'python',
+    '.java': 'java',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+}
+
+# Accepts both short names and VS Code language ids
+LANGUAGE_ALIASES = {
+    'py': 'python',
+    'js': 'javascript',
+    'javascriptreact': 'javascript',
+    'ts': 'typescript',
+    'typescriptreact': 'typescript',
+}
+
+# Lizard chooses its parser from the file name, so buffers without a path get a placeholder
+LIZARD_FILENAMES = {
+    'python': '<source>.py',
+    'java': '<source>.java',
+    'javascript': '<source>.js',
+    'typescript': '<source>.ts',
+}
+
+def _decode_source(data: bytes) -> str:
+    """Decode file bytes the way open(..., encoding='utf-8') would, including newline translation."""
+    code = data.decode('utf-8')
+    if '\r' in code:
+        code = code.replace('\r\n', '\n').replace('\r', '\n')
+    return code
 
 class MetricsAnalyzer:
-    def analyze_code(self, code: str, language: str = 'python') -> Dict[str, Any]:
-        """Analyze code string directly without file I/O"""
-        if language.lower() in ['python', 'py']:
-            return self._analyze_python_code(code)
-        elif language.lower() in ['java']:
-            # Java analysis in this class currently relies on file path for Lizard
-            # We'll need a workaround or just skip full metrics for string-only Java for now
-            # or write to temp file if needed. For now, let's support Python fully.
-            return {}
+    def __init__(self, cache: Optional[MetricsCache] = None):
+        self.cache = cache
+
+    def analyze_code(self, code: str, language: str = 'python', file_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analyze code string directly without file I/O.
+
+        `file_path` is only used to label the source for Lizard (which picks
+        its parser from the extension); the file itself is never opened.
+        """
+        language = LANGUAGE_ALIASES.get(language.lower(), language.lower())
+        if language == 'python':
+            return self._analyze_python_code(code, file_path or LIZARD_FILENAMES[language])
+        elif language == 'java':
+            return self._analyze_java_code(code, file_path or LIZARD_FILENAMES[language])
+        elif language in ('javascript', 'typescript'):
+            return self._analyze_lizard_code(code, language, file_path or LIZARD_FILENAMES[language])
         else:
             return {}
 
-    def _analyze_python_code(self, code: str) -> Dict[str, Any]:
-        # File-level metrics
-        try:
-            mi = radon_metrics.mi_visit(code, multi=False)
-        except:
-            mi = 0
-            
+    def _analyze_python_code(self, code: str, lizard_filename: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Radon/AST metrics for Python source, optionally augmented with Lizard
+        when `lizard_filename` is given.
+        """
+        # Token stream: one pass for raw line counts (also feeds the MI comment ratio)
         try:
-            raw = radon_raw.analyze(code)
+            with stage("parse"):
+                raw = radon_raw.analyze(code)
             loc = raw.loc
             sloc = raw.sloc
         except:
+            raw = None
             loc = 0
             sloc = 0
 
-        # Function-level metrics using Radon
+        # Syntax tree: parsed once and shared by the complexity, Halstead and docstring passes
+        mi = 0
         functions = []
+        symbols = None
         try:
-            # AST parse for docstrings
-            import ast
-            tree = ast.parse(code)
-            docstrings = {}
-            for node in ast.walk(tree):
-                if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
-                    docstrings[node.name] = bool(ast.get_docstring(node))
-
-            blocks = radon_cc.cc_visit(code)
-            for block in blocks:
-                if isinstance(block, Function):
-                    func_metrics = {
-                        "name": block.name,
-                        "lineno": block.lineno,
-                        "cyclomatic_complexity": block.complexity,
-                        "type": "method" if block.is_method else "function",
-                        "has_docstring": docstrings.get(block.name, False)
-                    }
-                    functions.append(func_metrics)
+            with stage("parse"):
+                tree = ast.parse(code)
+            with stage("metrics"):
+                cc_visitor = ComplexityVisitor.from_ast(tree)
+
+                # Same inputs radon_metrics.mi_visit(code, multi=False) would compute
+                if raw is not None:
+                    try:
+                        comments = raw.comments / float(raw.sloc) * 100 if raw.sloc != 0 else 0
+                        volume = radon_metrics.h_visit_ast(tree).total.volume
+                        mi = radon_metrics.mi_compute(volume, cc_visitor.total_complexity, raw.lloc, comments)
+                    except:
+                        mi = 0
+
+                # Function-level metrics using Radon, joined to the symbol table by start line
+                symbols = SymbolTable.from_python(tree)
+                for block in cc_visitor.blocks:
+                    if isinstance(block, Function):
+                        symbol = symbols.at_line(block.lineno)
+                        func_metrics = {
+                            "name": block.name,
+                            "lineno": block.lineno,
+                            "cyclomatic_complexity": block.complexity,
+                            "type": "method" if block.is_method else "function",
+                            "has_docstring": symbol.has_docstring if symbol else False
+                        }
+                        _add_identity(func_metrics, symbol, block.endline)
+                        functions.append(func_metrics)
         except Exception as e:
             print(f"Error in Radon/AST analysis: {e}")
 
-        return {
+        result = {
             "language": "python",
             "loc": loc,
             "sloc": sloc,
             "maintainability_index": mi,
             "functions": functions
         }
+        if lizard_filename is not None and symbols is not None:
+            with stage("metrics"):
+                self._augment_with_lizard(result, code, lizard_filename, symbols)
+        return result
 
     def analyze_file(self, file_path: str) -> Dict[str, Any]:
         _, ext = os.path.splitext(file_path)
-        if ext == '.py':
-            with open(file_path, 'r', encoding='utf-8') as f:
-                code = f.read()
-            result = self._analyze_python_code(code)
-            result['file_path'] = file_path
-            
-            # Augment with Lizard (requires file path usually, but we can try string if supported or skip)
-            # Lizard analyze_file needs path. 
-            try:
-                liz_analysis = lizard.analyze_file(file_path)
-                for func in liz_analysis.function_list:
-                    match = next((f for f in result['functions'] if f['name'] == func.name and abs(f['lineno'] - func.start_line) < 5), None)
-                    if match:
-                        match['nloc'] = func.nloc
-                        match['token_count'] = func.token_count
-                        match['cyclomatic_complexity_lizard'] = func.cyclomatic_complexity
-            except Exception:
-                pass
-                
-            return result
-        elif ext == '.java':
-            return self._analyze_java(file_path)
-        else:
+        if ext not in LANGUAGE_EXTENSIONS:
+            return {}
+
+        # An unchanged file is found by its (mtime, size) without reading it
+        st = None
+        if self.cache is not None:
+            st = os.stat(file_path)
+            cached = self.cache.get_stamped(file_path, f"analyzer={ANALYZER_VERSION}{ext}", st)
+            if cached is not None:
+                cached['file_path'] = file_path
+                return cached
+
+        # The file is read exactly once; everything below works on the buffer
+        with stage("read"):
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        return self._analyze_data(file_path, data, st)
+
+    def analyze_bytes(self, file_path: str, data: bytes) -> Dict[str, Any]:
+        """
+        Analyze raw file contents that came from somewhere other than the
+        working tree (e.g. a git blob). `file_path` selects the language and
+        labels the result.
+        """
+        return self._analyze_data(file_path, data)
+
+    def _analyze_data(self, file_path: str, data: bytes, st: Optional[os.stat_result] = None) -> Dict[str, Any]:
+        """analyze_bytes; `st` is the stat of the file `data` was read from, if any."""
+        _, ext = os.path.splitext(file_path)
+        language = LANGUAGE_EXTENSIONS.get(ext)
+        if language is None:
             return {}
 
-    def _analyze_java(self, file_path: str) -> Dict[str, Any]:
-        # Java analysis relies primarily on Lizard
+        key = None
+        kind = f"analyzer={ANALYZER_VERSION}{ext}"
+        if self.cache is not None:
+            key = self.cache.make_key(data, kind)
+            cached = self.cache.get(key)
+            if cached is not None:
+                if st is not None:
+                    self.cache.put_stamped(file_path, kind, st, key)
+                cached['file_path'] = file_path
+                return cached
+
+        result = {"file_path": file_path}
+        result.update(self.analyze_code(_decode_source(data), language, file_path))
+        if key is not None:
+            self.cache.put(key, result)
+            if st is not None:
+                self.cache.put_stamped(file_path, kind, st, key)
+        return result
+
+    def _augment_with_lizard(self, result: Dict[str, Any], code: str, filename: str, symbols: SymbolTable):
+        """Add Lizard's per-function nloc/token counts to Radon's results."""
+        by_id = {f['symbol_id']: f for f in result['functions'] if 'symbol_id' in f}
+        try:
+            liz_analysis = lizard.analyze_file.analyze_source_code(filename, code)
+            for func in liz_analysis.function_list:
+                symbol = symbols.at_line(func.start_line, LINE_TOLERANCE)
+                match = by_id.get(symbol.symbol_id) if symbol else None
+                if match:
+                    match['nloc'] = func.nloc
+                    match['token_count'] = func.token_count
+                    match['cyclomatic_complexity_lizard'] = func.cyclomatic_complexity
+        except Exception:
+            pass
+
+    def _analyze_java_code(self, code: str, filename: str) -> Dict[str, Any]:
+        # Javalang for docstrings and qualified names
+        try:
+            with stage("parse"):
+                tree = javalang.parse.parse(code)
+            symbols = SymbolTable.from_javalang(tree)
+        except:
+            symbols = None
+        return self._analyze_lizard_code(code, 'java', filename, symbols)
+
+    def _analyze_lizard_code(self, code: str, language: str, filename: str,
+                             symbols: Optional[SymbolTable] = None) -> Dict[str, Any]:
+        """
+        Lizard-based analysis shared by Java, JavaScript and TypeScript.
+
+        Functions are joined to `symbols` when a parser-built table is given;
+        otherwise identities come from Lizard's own names and docstrings are
+        detected from JSDoc comments.
+        """
         functions = []
         loc = 0
         nloc = 0
-        
+        lines = code.splitlines()
+
         try:
-            # Javalang for docstrings
-            import javalang
-            try:
-                tree = javalang.parse.parse(open(file_path, encoding='utf-8').read())
-                docstrings = {}
-                for _, node in tree.filter(javalang.tree.MethodDeclaration):
-                    docstrings[node.name] = bool(node.documentation)
-            except:
-                docstrings = {}
-
-            liz_analysis = lizard.analyze_file(file_path)
-            loc = len(open(file_path, encoding='utf-8').readlines())
+            with stage("metrics"):
+                liz_analysis = lizard.analyze_file.analyze_source_code(filename, code)
+            loc = len(lines)
             nloc = liz_analysis.nloc
+            parsed = symbols is not None
+            if not parsed:
+                symbols = SymbolTable.from_lizard(liz_analysis.function_list)
             
             for func in liz_analysis.function_list:
-                functions.append({
+                symbol = symbols.at_line(func.start_line, LINE_TOLERANCE if parsed else 0)
+                func_metrics = {
                     "name": func.name,
                     "lineno": func.start_line,
                     "cyclomatic_complexity": func.cyclomatic_complexity,
                     "nloc": func.nloc,
                     "token_count": func.token_count,
                     "params": len(func.parameters),
-                    "has_docstring": docstrings.get(func.name, False)
-                })
+                    "has_docstring": symbol.has_docstring if parsed and symbol else _has_jsdoc(func, lines)
+                }
+                _add_identity(func_metrics, symbol, func.end_line)
+                functions.append(func_metrics)
         except Exception as e:
-            print(f"Error in Lizard/Javalang analysis for {file_path}: {e}")
+            print(f"Error in Lizard analysis for {filename}: {e}")
 
         return {
-            "file_path": file_path,
-            "language": "java",
+            "language": language,
             "loc": loc,
             "nloc": nloc,
             "functions": functions
         }
 
+def _add_identity(func_metrics: Dict[str, Any], symbol, endline: Optional[int]):
+    """Attach the stable identity (qualified name, symbol id, line span) to a function record."""
+    if symbol is None:
+        return
+    func_metrics["qualified_name"] = symbol.qualified_name
+    func_metrics["symbol_id"] = symbol.symbol_id
+    func_metrics["endline"] = symbol.endline or endline
+
+def _has_jsdoc(func, lines: List[str]) -> bool:
+    """True if the nearest non-blank line above the function closes a /** ... */ comment."""
+    i = func.start_line - 2
+    while i >= 0 and (not lines[i].strip() or lines[i].strip().startswith('@')):
+        i -= 1
+    if i < 0 or not lines[i].rstrip().endswith('*/'):
+        return False
+    while i >= 0:
+        if '/**' in lines[i]:
+            return True
+        if '/*' in lines[i]:
+            return False
+        i -= 1
+    return False
+
 if __name__ == "__main__":
     import argparse
-    import glob
+    from core.scanner import DEFAULT_WORKERS as DEFAULT_SCAN_WORKERS, Scanner
     
     parser = argparse.ArgumentParser(description="Extract Code Metrics")
     parser.add_argument("path", help="File or directory to analyze")
-    parser.add_argument("--output", help="Output JSON file", default="metrics.json")
+    parser.add_argument("--output", help="Output JSON file (or store directory with --format columnar)", default="metrics.json")
+    parser.add_argument("--format", choices=["json", "columnar"], default="json", help="Output format; columnar writes a memory-mappable store for the ML scripts and dashboard")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the persistent metrics cache")
+    parser.add_argument("--git-diff", metavar="BASE[..HEAD]", help="Analyze only files changed between two revisions of the git repo at PATH")
+    parser.add_argument("--git-history", type=int, metavar="N", help="Summarize metrics for the last N commits of the git repo at PATH")
+    parser.add_argument("--scan-workers", type=int, default=DEFAULT_SCAN_WORKERS, help="Threads used to walk the directory tree")
+    parser.add_argument("--rev", default="HEAD", help="Revision to start from for --git-history (default: HEAD)")
     
     args = parser.parse_args()
     
-    analyzer = MetricsAnalyzer()
-    results = []
+    cache = None if args.no_cache else open_default_cache()
+    analyzer = MetricsAnalyzer(cache=cache)
     
-    if os.path.isfile(args.path):
-        results.append(analyzer.analyze_file(args.path))
+    if args.git_diff or args.git_history:
+        # Read blobs straight from the repository; nothing is checked out
+        from core.git_source import GitAnalyzer
+        with GitAnalyzer(args.path, analyzer) as git_analyzer:
+            if args.git_diff:
+                base, _, head = args.git_diff.partition('..')
+                results = git_analyzer.analyze_diff(base, head or 'HEAD')
+                print(f"Analyzed {len(results['files'])} changed files ({len(results['deleted'])} deleted).")
+            else:
+                results = git_analyzer.analyze_history(args.rev, args.git_history)
+                print(f"Summarized {len(results['commits'])} commits from {results['distinct_blobs']} distinct blobs.")
     else:
-        for root, _, files in os.walk(args.path):
-            for file in files:
-                if file.endswith(('.py', '.java')):
-                    full_path = os.path.join(root, file)
-                    if 'venv' in full_path: continue
-                    results.append(analyzer.analyze_file(full_path))
+        results = []
+        if os.path.isfile(args.path):
+            results.append(analyzer.analyze_file(args.path))
+        else:
+            scanner = Scanner(extensions=LANGUAGE_EXTENSIONS, workers=args.scan_workers)
+            for full_path in scanner.scan(args.path):
+                results.append(analyzer.analyze_file(full_path))
+        print(f"Analyzed {len(results)} files.")
     
-    print(f"Analyzed {len(results)} files.")
-    with open(args.output, 'w', encoding='utf-8') as f:
-        json.dump(results, f, indent=2)
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_ratio']:.1%})")
+        cache.close()
+    if args.format == "columnar" and isinstance(results, list):
+        from core.columnar import MetricsStore
+        MetricsStore.from_results(results).save(args.output)
+    else:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
     print(f"Saved to {args.output}")
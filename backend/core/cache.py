@@ -0,0 +1,234 @@
+"""
+Persistent, content-addressed cache for file metrics.
+
+Results are stored in a small SQLite database keyed by the SHA-256 of the
+file contents plus a version tag covering the analyzer, radon and lizard.
+Touching a file without changing it keeps its entry valid, and upgrading
+any of the analysis libraries invalidates everything automatically.
+
+For files on disk the cache also remembers which content key a path had at
+a given (mtime, size) stamp, so an unchanged file is found with one stat
+instead of a read and a hash (get_stamped / put_stamped).
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from importlib import metadata
+from typing import Any, Dict, Optional
+
+from core.telemetry import record_cache_lookup
+
+DEFAULT_CACHE_PATH = os.environ.get(
+    "CODEWHISPER_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "codewhisper", "metrics.sqlite")
+)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Commit after this many writes instead of once per lookup
+_COMMIT_EVERY = 256
+# Files modified more recently than this are not stamped: a second write
+# within the file system's timestamp granularity would keep the same stamp
+_STAMP_MIN_AGE = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+def _package_version(name: str) -> str:
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+
+def cache_enabled() -> bool:
+    """The cache can be switched off with CODEWHISPER_CACHE=off."""
+    return os.environ.get("CODEWHISPER_CACHE", "on").lower() not in ("0", "off", "false", "no")
+
+
+def open_default_cache(version: str = "") -> Optional["MetricsCache"]:
+    """Open the cache at the default location, or return None if it is disabled or unusable."""
+    if not cache_enabled():
+        return None
+    try:
+        return MetricsCache(version=version)
+    except (OSError, sqlite3.Error) as e:
+        logger.warning("Metrics cache unavailable: %s", e)
+        return None
+
+
+class MetricsCache:
+    """
+    SQLite-backed cache mapping content hashes to analysis results.
+
+    The total size of stored results is bounded by `max_bytes`; when it is
+    exceeded the least recently used entries are evicted. Hit and miss
+    counters are kept per instance, and lookups are reported to telemetry
+    under `name`.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES,
+                 version: str = "", name: str = "metrics"):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.name = name
+        self.version = "|".join([
+            version,
+            f"radon={_package_version('radon')}",
+            f"lizard={_package_version('lizard')}",
+        ])
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS metrics ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS metrics_last_used ON metrics(last_used)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS stamps ("
+            " id TEXT PRIMARY KEY,"
+            " mtime_ns INTEGER NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " key TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS stamps_key ON stamps(key)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM metrics").fetchone()[0]
+
+    def make_key(self, content: bytes, kind: str = "") -> str:
+        """Hash file contents together with the analysis kind and version tag."""
+        digest = hashlib.sha256()
+        digest.update(self.version.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(kind.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(content)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self._fetch(key)
+            if value is None:
+                self.misses += 1
+                record_cache_lookup(self.name, False)
+            return value
+
+    def _fetch(self, key: str) -> Optional[Dict[str, Any]]:
+        """A hit (counted) or None (not counted). Called with the lock held."""
+        row = self._conn.execute("SELECT value FROM metrics WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.hits += 1
+        record_cache_lookup(self.name, True)
+        self._conn.execute("UPDATE metrics SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._maybe_commit()
+        return json.loads(row[0])
+
+    def _stamp_id(self, path: str, kind: str) -> str:
+        return self.make_key(os.path.abspath(path).encode("utf-8"), "stamp:" + kind)
+
+    def get_stamped(self, path: str, kind: str, st: os.stat_result) -> Optional[Dict[str, Any]]:
+        """
+        The result stored for `path` when it last had the mtime and size in
+        `st`, without reading the file. A miss is not counted: the caller
+        goes on to read, hash and get().
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT key FROM stamps WHERE id = ? AND mtime_ns = ? AND size = ?",
+                                     (self._stamp_id(path, kind), st.st_mtime_ns, st.st_size)).fetchone()
+            return self._fetch(row[0]) if row is not None else None
+
+    def put_stamped(self, path: str, kind: str, st: os.stat_result, key: str):
+        """Remember that `path`, as of `st`, has the content stored under `key`."""
+        if time.time() - st.st_mtime < _STAMP_MIN_AGE:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stamps (id, mtime_ns, size, key) VALUES (?, ?, ?, ?)",
+                (self._stamp_id(path, kind), st.st_mtime_ns, st.st_size, key)
+            )
+            self._maybe_commit()
+
+    def put(self, key: str, value: Dict[str, Any]):
+        data = json.dumps(value, separators=(",", ":"))
+        size = len(data)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM metrics WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO metrics (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time())
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._maybe_commit()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is at 90% of its budget."""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM metrics ORDER BY last_used ASC").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            doomed.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM metrics WHERE key = ?", doomed)
+        self._conn.executemany("DELETE FROM stamps WHERE key = ?", doomed)
+
+    def _maybe_commit(self):
+        self._pending_writes += 1
+        if self._pending_writes >= _COMMIT_EVERY:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def flush(self):
+        """Commit pending writes."""
+        with self._lock:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, total_bytes = self.hits, self.misses, self._total_bytes
+            entries = self._conn.execute("SELECT COUNT(*) FROM metrics").fetchone()[0]
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM metrics")
+            self._conn.execute("DELETE FROM stamps")
+            self._conn.commit()
+            self._total_bytes = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,232 @@
+"""
+Columnar storage for analysis results.
+
+The analyzer's output is a list of nested dicts (one per file, each with a
+list of function dicts). That is convenient to produce but expensive to
+consume: every reader re-walks it in Python loops to build features. A
+MetricsStore holds the same data as two flat tables of NumPy arrays:
+
+- files: one row per file (path, language, loc, sloc, nloc, maintainability
+  index, number of functions)
+- functions: one row per function, with `file_index` pointing into files
+
+On disk a store is a directory with one Arrow IPC file per table
+(uncompressed, so it can be memory-mapped) when pyarrow is installed, or one
+.npy file per column otherwise. Either way numeric columns are loaded as
+zero-copy views of the mapped file; string columns are only decoded when a
+consumer actually asks for them.
+
+In memory, string columns are object arrays of Python strings rather than
+fixed-width NumPy unicode, which would pad every path to the longest one
+(four bytes per character). In Arrow files they are string columns, with
+the few distinct languages dictionary-encoded.
+"""
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, List
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# name -> (dtype, default when the field is missing)
+FILE_COLUMNS = {
+    "file_path": (str, ""),
+    "language": (str, ""),
+    "loc": (np.int64, 0),
+    "sloc": (np.int64, 0),
+    "nloc": (np.int64, 0),
+    "maintainability_index": (np.float64, np.nan),
+    "n_functions": (np.int32, 0),
+}
+FUNCTION_COLUMNS = {
+    "file_index": (np.int32, 0),
+    "name": (str, ""),
+    "symbol_id": (str, ""),
+    "lineno": (np.int32, 0),
+    "endline": (np.int32, 0),
+    "cyclomatic_complexity": (np.int32, 0),
+    "nloc": (np.int32, 0),
+    "token_count": (np.int32, 0),
+    "has_docstring": (np.bool_, False),
+}
+
+
+class ColumnTable:
+    """
+    A set of equal-length columns. Columns may be given as arrays or as
+    zero-argument loaders, which are called (once) on first access.
+    """
+
+    def __init__(self, columns: Dict[str, Any], length: int):
+        self._columns = dict(columns)
+        self.length = length
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        column = self._columns[name]
+        if callable(column):
+            column = column()
+            self._columns[name] = column
+        return column
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def names(self) -> List[str]:
+        return list(self._columns)
+
+
+def _build_columns(schema: Dict[str, tuple], values: Dict[str, list]) -> Dict[str, np.ndarray]:
+    columns = {}
+    for name, (dtype, _) in schema.items():
+        if dtype is str:
+            column = np.empty(len(values[name]), dtype=object)
+            column[:] = values[name]
+            columns[name] = column
+        else:
+            columns[name] = np.array(values[name], dtype=dtype)
+    return columns
+
+
+class MetricsStore:
+    def __init__(self, files: ColumnTable, functions: ColumnTable):
+        self.files = files
+        self.functions = functions
+
+    @classmethod
+    def from_results(cls, results: Iterable[Dict[str, Any]]) -> "MetricsStore":
+        """Flatten analyzer results (as written by core/analyzer.py) in a single pass."""
+        file_values = {name: [] for name in FILE_COLUMNS}
+        func_values = {name: [] for name in FUNCTION_COLUMNS}
+        for result in results:
+            if not result:
+                continue
+            file_index = len(file_values["file_path"])
+            funcs = result.get("functions", [])
+            for name, (_, default) in FILE_COLUMNS.items():
+                if name == "n_functions":
+                    file_values[name].append(len(funcs))
+                else:
+                    value = result.get(name, default)
+                    file_values[name].append(default if value is None else value)
+            for func in funcs:
+                for name, (_, default) in FUNCTION_COLUMNS.items():
+                    if name == "file_index":
+                        func_values[name].append(file_index)
+                    else:
+                        value = func.get(name, default)
+                        func_values[name].append(default if value is None else value)
+
+        files = ColumnTable(_build_columns(FILE_COLUMNS, file_values), len(file_values["file_path"]))
+        functions = ColumnTable(_build_columns(FUNCTION_COLUMNS, func_values), len(func_values["file_index"]))
+        return cls(files, functions)
+
+    def save(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        for table_name, table, schema in (("files", self.files, FILE_COLUMNS),
+                                          ("functions", self.functions, FUNCTION_COLUMNS)):
+            if pa is not None:
+                arrow_table = pa.table({name: _arrow_array(name, table[name], dtype)
+                                        for name, (dtype, _) in schema.items()})
+                with pa.OSFile(os.path.join(path, f"{table_name}.arrow"), "wb") as sink:
+                    with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+                        writer.write_table(arrow_table)
+            else:
+                os.makedirs(os.path.join(path, table_name), exist_ok=True)
+                for name, (dtype, _) in schema.items():
+                    column = table[name]
+                    if dtype is str:
+                        # Object arrays cannot be memory-mapped; fixed width is the price on disk
+                        column = column.astype(str) if len(column) else np.array([], dtype="<U1")
+                    np.save(os.path.join(path, table_name, f"{name}.npy"), column)
+
+    @classmethod
+    def load(cls, path: str) -> "MetricsStore":
+        return cls(_load_table(path, "files", FILE_COLUMNS), _load_table(path, "functions", FUNCTION_COLUMNS))
+
+    def file_features(self) -> Dict[str, np.ndarray]:
+        """
+        Per-file aggregates of the function table, computed with bincount
+        over `file_index` instead of a Python loop per file. Files without
+        functions get zeros.
+        """
+        n_files = len(self.files)
+        index = self.functions["file_index"]
+        counts = np.bincount(index, minlength=n_files).astype(np.float64)
+        safe_counts = np.where(counts > 0, counts, 1)
+
+        def mean(column: str) -> np.ndarray:
+            sums = np.bincount(index, weights=self.functions[column], minlength=n_files)
+            return np.where(counts > 0, sums / safe_counts, 0.0)
+
+        complexity = self.functions["cyclomatic_complexity"]
+        max_complexity = np.zeros(n_files, dtype=np.int64)
+        if len(index):
+            np.maximum.at(max_complexity, index, complexity)
+
+        return {
+            "loc": self.files["loc"],
+            "sloc": self.files["sloc"],
+            "maintainability_index": self.files["maintainability_index"],
+            "n_functions": self.files["n_functions"],
+            "avg_complexity": mean("cyclomatic_complexity"),
+            "max_complexity": max_complexity,
+            "avg_nloc": mean("nloc"),
+            "avg_tokens": mean("token_count"),
+            "doc_coverage": mean("has_docstring") * 100,
+        }
+
+
+def _load_table(path: str, table_name: str, schema: Dict[str, tuple]) -> ColumnTable:
+    arrow_path = os.path.join(path, f"{table_name}.arrow")
+    if os.path.exists(arrow_path):
+        if pa is None:
+            raise ImportError(f"pyarrow is required to read {arrow_path}")
+        table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+        columns = {name: _arrow_loader(table.column(name), dtype) for name, (dtype, _) in schema.items()}
+        return ColumnTable(columns, table.num_rows)
+
+    table_dir = os.path.join(path, table_name)
+    columns = {}
+    length = 0
+    for name in schema:
+        column = np.load(os.path.join(table_dir, f"{name}.npy"), mmap_mode="r")
+        columns[name] = column
+        length = len(column)
+    return ColumnTable(columns, length)
+
+
+# Low-cardinality string columns, stored dictionary-encoded
+DICTIONARY_COLUMNS = {"language"}
+
+
+def _arrow_array(name: str, column: np.ndarray, dtype):
+    if dtype is not str:
+        return pa.array(column)
+    array = pa.array(column, type=pa.string())
+    return array.dictionary_encode() if name in DICTIONARY_COLUMNS else array
+
+
+def _arrow_loader(column, dtype) -> Callable[[], np.ndarray]:
+    def load() -> np.ndarray:
+        if dtype is str:
+            strings = column.cast(pa.string()) if pa.types.is_dictionary(column.type) else column
+            return strings.to_numpy().astype(object, copy=False)
+        # Single-chunk, null-free numeric columns map straight onto the file
+        return column.combine_chunks().to_numpy(zero_copy_only=dtype is not np.bool_)
+    return load
+
+
+def load_results(path: str) -> MetricsStore:
+    """Open a store directory, or convert a legacy analyzer JSON file."""
+    if os.path.isdir(path):
+        return MetricsStore.load(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        return MetricsStore.from_results(json.load(f))
@@ -0,0 +1,272 @@
+"""
+Analysis engines for project-wide metrics.
+
+An engine turns an iterable of file paths into per-file metric dicts. The
+serial engine runs everything in-process; the process-pool engine fans
+chunks of paths out to a bounded pool of worker processes. Both yield
+results in the same order as the input paths, so the output of a scan is
+deterministic regardless of which engine (or how many jobs) produced it.
+
+get_engine hands out shared engines, so a process pool is started once and
+reused by every later scan with the same number of jobs.
+"""
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from core.cache import open_default_cache
+from core.metrics import analyze_complexity
+from core.telemetry import capture, record_captured, stage
+
+DEFAULT_CHUNK_SIZE = 64
+
+# Bump whenever analyze_source's output changes
+ENGINE_VERSION = "5"
+
+# Opened lazily, once per process (pool workers each get their own connection)
+_cache = None
+_cache_opened = False
+
+
+def _get_cache():
+    global _cache, _cache_opened
+    if not _cache_opened:
+        _cache = open_default_cache()
+        _cache_opened = True
+    return _cache
+
+
+def analyze_source(file_path: str, content: str) -> Optional[Dict]:
+    """
+    Compute metrics for one file's contents. Returns None for unsupported files.
+
+    The result holds the module complexity and per-function/class detail,
+    both from a single parse and traversal.
+    """
+    # Only analyze Python files for complexity for now
+    if not file_path.endswith('.py'):
+        return None
+    result = {"file_path": file_path}
+    result.update(analyze_complexity(content))
+    return result
+
+
+def analyze_path(file_path: str) -> Optional[Dict]:
+    """
+    Read a file and compute its metrics. Unreadable files are skipped.
+
+    Results are looked up in the persistent cache by (mtime, size) first and
+    then by content hash, so re-scanning an unchanged tree costs one stat per
+    file, and a touched but unchanged file one read and one hash.
+    """
+    if not file_path.endswith('.py'):
+        return None
+    try:
+        cache = _get_cache()
+        kind = f"engine={ENGINE_VERSION}"
+        st = None
+        if cache is not None:
+            st = os.stat(file_path)
+            cached = cache.get_stamped(file_path, kind, st)
+            if cached is not None:
+                cached["file_path"] = file_path
+                return cached
+        with stage("read"):
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        key = None
+        if cache is not None:
+            key = cache.make_key(data, kind)
+            cached = cache.get(key)
+            if cached is not None:
+                cache.put_stamped(file_path, kind, st, key)
+                cached["file_path"] = file_path
+                return cached
+        result = analyze_source(file_path, data.decode('utf-8'))
+        if key is not None and result is not None:
+            cache.put(key, result)
+            cache.put_stamped(file_path, kind, st, key)
+        return result
+    except Exception:
+        return None
+
+
+def _analyze_chunk(file_paths: List[str]) -> List[Dict]:
+    """Work unit executed by a worker: analyze a list of paths in order."""
+    results = []
+    for file_path in file_paths:
+        result = analyze_path(file_path)
+        if result is not None:
+            results.append(result)
+    cache = _get_cache()
+    if cache is not None:
+        cache.flush()
+    return results
+
+
+def _analyze_chunk_captured(file_paths: List[str]):
+    """_analyze_chunk for pool workers: also returns the stage timings it took."""
+    with capture() as captured:
+        results = _analyze_chunk(file_paths)
+    return results, captured
+
+
+def _chunked(iterable: Iterable[str], size: int) -> Iterator[List[str]]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class AnalysisEngine(ABC):
+    """Base class for analysis engines."""
+
+    def __init__(self, jobs: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        self.jobs = max(1, jobs or os.cpu_count() or 1)
+        self.chunk_size = max(1, chunk_size)
+
+    @abstractmethod
+    def iter_chunks(self, file_paths: Iterable[str]) -> Iterator[Tuple[int, List[Dict]]]:
+        """
+        Yield (number of paths in the chunk, results for the chunk) for each
+        chunk of paths, in input order. Unsupported or unreadable files count
+        towards the first number but have no result.
+        """
+
+    def iter_results(self, file_paths: Iterable[str]) -> Iterator[Dict]:
+        for _, chunk in self.iter_chunks(file_paths):
+            yield from chunk
+
+    def analyze(self, file_paths: Iterable[str]) -> List[Dict]:
+        return list(self.iter_results(file_paths))
+
+    def shutdown(self):
+        """Release whatever the engine keeps between calls."""
+
+
+class SerialEngine(AnalysisEngine):
+    """Analyzes files one after another in the calling process; always one job."""
+
+    def __init__(self, jobs: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE):
+        super().__init__(1, chunk_size)
+
+    def iter_chunks(self, file_paths: Iterable[str]) -> Iterator[Tuple[int, List[Dict]]]:
+        for chunk in _chunked(file_paths, self.chunk_size):
+            yield len(chunk), _analyze_chunk(chunk)
+
+
+class ProcessPoolEngine(AnalysisEngine):
+    """
+    Fans chunks of paths out to a pool of worker processes.
+
+    The pool is started on first use and kept until shutdown(), so calls
+    after the first skip worker start-up. At most `max_pending` chunks are in
+    flight at once, so the path iterator is consumed lazily and memory stays
+    bounded on very large trees.
+    """
+
+    def __init__(self, jobs: Optional[int] = None, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 max_pending: Optional[int] = None):
+        super().__init__(jobs, chunk_size)
+        self.max_pending = max_pending or self.jobs * 2
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+            return self._executor
+
+    def iter_chunks(self, file_paths: Iterable[str]) -> Iterator[Tuple[int, List[Dict]]]:
+        executor = self._get_executor()
+        pending = deque()
+        try:
+            for chunk in _chunked(file_paths, self.chunk_size):
+                pending.append((len(chunk), executor.submit(_analyze_chunk_captured, chunk)))
+                if len(pending) >= self.max_pending:
+                    count, future = pending.popleft()
+                    yield count, self._collect(future)
+            while pending:
+                count, future = pending.popleft()
+                yield count, self._collect(future)
+        except BrokenProcessPool:
+            # A worker died; the next call starts a fresh pool
+            with self._executor_lock:
+                if self._executor is executor:
+                    self._executor = None
+            raise
+        finally:
+            # The consumer stopped early (e.g. a cancelled job): drop queued work
+            for _, future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def _collect(future) -> List[Dict]:
+        results, captured = future.result()
+        record_captured(captured)
+        return results
+
+
+ENGINES: Dict[str, Callable[..., AnalysisEngine]] = {
+    "serial": SerialEngine,
+    "process": ProcessPoolEngine,
+}
+
+
+# (engine name, jobs) -> engine handed out by get_engine
+_engines: Dict[Tuple[str, int], AnalysisEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def register_engine(name: str, factory: Callable[..., AnalysisEngine]):
+    """Register an additional engine under `name`."""
+    with _engines_lock:
+        ENGINES[name] = factory
+        # Engines built by a factory this one replaces are no longer handed out
+        stale = [_engines.pop(key) for key in list(_engines) if key[0] == name]
+    for engine in stale:
+        engine.shutdown()
+
+
+def get_engine(jobs: Optional[int] = None, name: Optional[str] = None) -> AnalysisEngine:
+    """
+    The shared engine for the requested parallelism.
+
+    `jobs` defaults to the number of CPUs and is capped at it; a single job
+    runs serially to avoid the cost of starting a pool. Engines are created
+    on first request and reused, so their worker pools outlive a single scan.
+    """
+    max_jobs = os.cpu_count() or 1
+    jobs = min(jobs or max_jobs, max_jobs)
+    if name is None:
+        name = "serial" if jobs == 1 else "process"
+    if name not in ENGINES:
+        raise ValueError(f"Unknown analysis engine: {name}")
+    with _engines_lock:
+        engine = _engines.get((name, jobs))
+        if engine is None:
+            engine = _engines[(name, jobs)] = ENGINES[name](jobs=jobs)
+        return engine
+
+
+def shutdown_engines():
+    """Shut down every engine handed out by get_engine."""
+    with _engines_lock:
+        engines = list(_engines.values())
+        _engines.clear()
+    for engine in engines:
+        engine.shutdown()
@@ -1,25 +1,22 @@
 import ast
-import os
-import glob
-from typing import List, Dict, Optional
+import textwrap
+from typing import Any, List, Dict
 import javalang
 
+from core.scanner import Scanner
+from core.symbols import SymbolTable
+
 class CodeExtractor:
     def __init__(self):
         pass
 
     def extract_from_directory(self, root_path: str) -> List[Dict[str, str]]:
         results = []
-        # Python files
-        for file_path in glob.glob(os.path.join(root_path, '**', '*.py'), recursive=True):
-            if 'venv' in file_path or '__pycache__' in file_path:
-                continue
-            results.extend(self.extract_python(file_path))
-        
-        # Java files
-        for file_path in glob.glob(os.path.join(root_path, '**', '*.java'), recursive=True):
-            results.extend(self.extract_java(file_path))
-            
+        for file_path in Scanner(extensions={'.py', '.java'}).scan(root_path):
+            if file_path.endswith('.py'):
+                results.extend(self.extract_python(file_path))
+            else:
+                results.extend(self.extract_java(file_path))
         return results
 
     def extract_python(self, file_path: str) -> List[Dict[str, str]]:
@@ -74,6 +71,126 @@ class CodeExtractor:
              
         return pairs
 
+    def undocumented_functions(self, source: str, language: str) -> List[Dict[str, Any]]:
+        """
+        Functions in `source` that have no docstring (Python) or Javadoc
+        (Java), in source order. Each entry has the function's code and
+        where its documentation belongs: `insert_line` is the 1-based line
+        the documentation is inserted before, `indent` its indentation.
+        Unparseable source yields an empty list.
+        """
+        try:
+            if language == 'python':
+                return self._undocumented_python(source)
+            if language == 'java':
+                return self._undocumented_java(source)
+        except (SyntaxError, ValueError, javalang.parser.JavaSyntaxError, javalang.tokenizer.LexerError) as e:
+            print(f"Error parsing {language} source: {e}")
+        return []
+
+    def _undocumented_python(self, source: str) -> List[Dict[str, Any]]:
+        tree = ast.parse(source)
+        symbols = SymbolTable.from_python(tree)
+        lines = source.splitlines(keepends=True)
+        functions = []
+        for node in ast.walk(tree):
+            if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                continue
+            first = node.body[0]
+            # Any leading string is a docstring, even an empty one (which
+            # ast.get_docstring reports as "")
+            if isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) \
+                    and isinstance(first.value.value, str):
+                continue
+            # A body on the same line as the signature has nowhere to put a docstring
+            if first.lineno == node.lineno:
+                continue
+            # Directly below the signature, above any comments opening the body
+            insert_line = first.lineno
+            while insert_line - 1 > node.lineno and (
+                    not lines[insert_line - 2].strip() or lines[insert_line - 2].lstrip().startswith('#')):
+                insert_line -= 1
+            symbol = symbols.at_line(node.lineno)
+            functions.append({
+                'language': 'python',
+                'name': node.name,
+                'qualified_name': symbol.qualified_name if symbol else node.name,
+                'lineno': node.lineno,
+                'endline': node.end_lineno,
+                'insert_line': insert_line,
+                'indent': lines[first.lineno - 1][:first.col_offset],
+                'code': textwrap.dedent("".join(lines[node.lineno - 1:node.end_lineno]))
+            })
+        functions.sort(key=lambda f: f['lineno'])
+        return functions
+
+    def _undocumented_java(self, source: str) -> List[Dict[str, Any]]:
+        tree = javalang.parse.parse(source)
+        symbols = SymbolTable.from_javalang(tree)
+        lines = source.splitlines(keepends=True)
+        functions = []
+        for path, node in tree:
+            # Constructors too: the templates document those that only store their arguments
+            if not isinstance(node, (javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration)):
+                continue
+            if node.documentation or not node.position:
+                continue
+            # Javadoc goes above the annotations, which javalang positions separately
+            start = min([node.position.line] + [a.position.line for a in node.annotations if a.position])
+            end = _java_member_end(lines, node.position.line)
+            start_text = lines[start - 1]
+            symbol = symbols.at_line(node.position.line)
+            functions.append({
+                'language': 'java',
+                'name': node.name,
+                'qualified_name': symbol.qualified_name if symbol else node.name,
+                'lineno': start,
+                'endline': end,
+                'insert_line': start,
+                'indent': start_text[:len(start_text) - len(start_text.lstrip())],
+                'code': textwrap.dedent("".join(lines[start - 1:end]))
+            })
+        functions.sort(key=lambda f: f['lineno'])
+        return functions
+
+def _java_member_end(lines: List[str], start_line: int) -> int:
+    """
+    Last line of the method starting at `start_line`: where its body's braces
+    balance, or its `;` if it has no body. Braces inside string and char
+    literals and comments are ignored.
+    """
+    depth = 0
+    in_block_comment = False
+    for index in range(start_line - 1, len(lines)):
+        line = lines[index]
+        i = 0
+        while i < len(line):
+            char = line[i]
+            if in_block_comment:
+                if line.startswith("*/", i):
+                    in_block_comment = False
+                    i += 1
+            elif line.startswith("//", i):
+                break
+            elif line.startswith("/*", i):
+                in_block_comment = True
+                i += 1
+            elif char in "\"'":
+                # Skip the literal, honouring escapes
+                i += 1
+                while i < len(line) and line[i] != char:
+                    i += 2 if line[i] == "\\" else 1
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+            elif char == ";" and depth == 0:
+                return index + 1
+            i += 1
+    return len(lines)
+
 if __name__ == "__main__":
     import argparse
     import json
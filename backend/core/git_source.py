@@ -0,0 +1,271 @@
+"""
+Analyze code straight from a git repository, without checking anything out.
+
+Blobs are read through a single long-running `git cat-file --batch` process,
+and results are memoized by blob id. A file that did not change between two
+revisions has the same blob id in both, so it is analyzed once no matter
+how many commits it appears in: a history over N commits costs roughly the
+number of distinct blobs, not N x files.
+"""
+import os
+import subprocess
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from core.analyzer import LANGUAGE_EXTENSIONS, MetricsAnalyzer
+
+# Requests written to cat-file before reading its answers; small enough that
+# the request pipe never fills up while we are not reading.
+_BATCH_SIZE = 256
+
+
+class GitError(RuntimeError):
+    pass
+
+
+def _check_rev(rev: str) -> str:
+    """Refuse revisions git could take for an option (e.g. --output=<file>)."""
+    if not rev or rev.startswith("-"):
+        raise GitError(f"Invalid revision {rev!r}")
+    return rev
+
+
+def _is_analyzable(path: str) -> bool:
+    return os.path.splitext(path)[1] in LANGUAGE_EXTENSIONS
+
+
+class GitRepository:
+    """Thin wrapper over the git CLI for one local repository."""
+
+    def __init__(self, repo_path: str):
+        self.repo_path = os.path.abspath(repo_path)
+        self._cat_file = None
+
+    def _git(self, *args: str) -> bytes:
+        try:
+            proc = subprocess.run(
+                ["git", "-C", self.repo_path, *args],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False
+            )
+        except FileNotFoundError:
+            raise GitError("git executable not found")
+        if proc.returncode != 0:
+            raise GitError(proc.stderr.decode("utf-8", "replace").strip() or f"git {args[0]} failed")
+        return proc.stdout
+
+    def resolve(self, rev: str) -> str:
+        return self._git("rev-parse", "--verify", "--end-of-options", f"{_check_rev(rev)}^{{commit}}").decode().strip()
+
+    def rev_list(self, head: str, max_count: int) -> List[str]:
+        """Up to `max_count` commits reachable from `head` along first parents, newest first."""
+        out = self._git("rev-list", "--first-parent", f"--max-count={max_count}", "--end-of-options",
+                        _check_rev(head))
+        return out.decode().split()
+
+    def list_tree(self, rev: str) -> Dict[str, str]:
+        """All blobs in a revision as {path: blob id}."""
+        tree = {}
+        for entry in self._git("ls-tree", "-r", "-z", "--full-tree", "--end-of-options", _check_rev(rev)).split(b"\0"):
+            if not entry:
+                continue
+            meta, path = entry.split(b"\t", 1)
+            _, obj_type, sha = meta.split()
+            if obj_type == b"blob":
+                tree[path.decode("utf-8", "surrogateescape")] = sha.decode()
+        return tree
+
+    def diff(self, base: str, head: str) -> List[Tuple[str, str, str, str]]:
+        """Changed paths between two revisions as (status, path, old blob, new blob)."""
+        out = self._git("diff-tree", "-r", "-z", "--no-renames", "--no-commit-id", "--end-of-options",
+                        _check_rev(base), _check_rev(head))
+        fields = out.split(b"\0")
+        changes = []
+        # Records are ":<modes> <old> <new> <status>" followed by the path
+        for i in range(0, len(fields) - 1, 2):
+            meta = fields[i].decode()
+            if not meta.startswith(":"):
+                continue
+            _, _, old_sha, new_sha, status = meta[1:].split()
+            changes.append((status[0], fields[i + 1].decode("utf-8", "surrogateescape"), old_sha, new_sha))
+        return changes
+
+    def read_blobs(self, shas: Iterable[str]) -> Dict[str, bytes]:
+        """Read many blobs through the persistent `cat-file --batch` process."""
+        if self._cat_file is None:
+            self._cat_file = subprocess.Popen(
+                ["git", "-C", self.repo_path, "cat-file", "--batch"],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE
+            )
+        proc = self._cat_file
+        shas = list(shas)
+        blobs = {}
+        for start in range(0, len(shas), _BATCH_SIZE):
+            batch = shas[start:start + _BATCH_SIZE]
+            proc.stdin.write("".join(f"{sha}\n" for sha in batch).encode())
+            proc.stdin.flush()
+            for sha in batch:
+                header = proc.stdout.readline().split()
+                if len(header) < 3:
+                    # "<sha> missing"
+                    continue
+                size = int(header[2])
+                blobs[sha] = proc.stdout.read(size)
+                proc.stdout.read(1)  # trailing newline
+        return blobs
+
+    def close(self):
+        if self._cat_file is not None:
+            self._cat_file.stdin.close()
+            self._cat_file.wait()
+            self._cat_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class GitAnalyzer:
+    """Per-file metrics for git revisions, memoized by blob id."""
+
+    def __init__(self, repo_path: str, analyzer: Optional[MetricsAnalyzer] = None):
+        self.repo = GitRepository(repo_path)
+        self.analyzer = analyzer or MetricsAnalyzer()
+        self._by_blob: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def distinct_blobs(self) -> int:
+        return len(self._by_blob)
+
+    def _analyze_blobs(self, entries: Iterable[Tuple[str, str]]):
+        """Analyze every (path, blob) pair whose blob has not been seen yet."""
+        todo = {}
+        for path, sha in entries:
+            if sha not in self._by_blob and sha not in todo:
+                todo[sha] = path
+        for sha, data in self.repo.read_blobs(todo).items():
+            path = todo[sha]
+            try:
+                result = self.analyzer.analyze_bytes(path, data)
+            except Exception as e:
+                print(f"Error analyzing {path} ({sha[:12]}): {e}")
+                result = {}
+            result.pop("file_path", None)
+            self._by_blob[sha] = result
+
+    def _result(self, path: str, sha: str) -> Dict[str, Any]:
+        result = dict(self._by_blob.get(sha) or {})
+        result["file_path"] = path
+        result["blob"] = sha
+        return result
+
+    def analyze_revision(self, rev: str = "HEAD") -> List[Dict[str, Any]]:
+        """Metrics for every analyzable file in one revision."""
+        tree = {p: s for p, s in self.repo.list_tree(rev).items() if _is_analyzable(p)}
+        self._analyze_blobs(tree.items())
+        return [self._result(path, tree[path]) for path in sorted(tree)]
+
+    def analyze_diff(self, base: str, head: str = "HEAD") -> Dict[str, Any]:
+        """Metrics for files added or modified between `base` and `head`, plus deleted paths."""
+        base_commit, head_commit = self.repo.resolve(base), self.repo.resolve(head)
+        changed, deleted = [], []
+        for status, path, _, new_sha in self.repo.diff(base_commit, head_commit):
+            if not _is_analyzable(path):
+                continue
+            if status == "D":
+                deleted.append(path)
+            else:
+                changed.append((path, new_sha))
+        self._analyze_blobs(changed)
+        return {
+            "base": base_commit,
+            "head": head_commit,
+            "files": [self._result(path, sha) for path, sha in changed],
+            "deleted": deleted,
+        }
+
+    def analyze_history(self, head: str = "HEAD", max_commits: int = 100) -> Dict[str, Any]:
+        """
+        Aggregate metrics for the last `max_commits` first-parent commits.
+
+        The tree of the newest commit is listed once; older trees are derived
+        by walking diffs backwards, and per-commit totals are updated only for
+        the paths that changed.
+        """
+        commits = self.repo.rev_list(self.repo.resolve(head), max_commits)
+        if not commits:
+            return {"head": head, "commits": [], "distinct_blobs": 0}
+
+        tree = {p: s for p, s in self.repo.list_tree(commits[0]).items() if _is_analyzable(p)}
+        self._analyze_blobs(tree.items())
+        totals = _Totals()
+        for sha in tree.values():
+            totals.add(self._by_blob.get(sha))
+
+        history = []
+        for i, commit in enumerate(commits):
+            history.append(dict(totals.summary(), commit=commit))
+            if i + 1 == len(commits):
+                break
+            # Undo this commit's changes to get its parent's tree
+            changes = [c for c in self.repo.diff(commits[i + 1], commit) if _is_analyzable(c[1])]
+            self._analyze_blobs((path, old) for status, path, old, _ in changes if status != "A")
+            for status, path, old_sha, _ in changes:
+                if path in tree:
+                    totals.remove(self._by_blob.get(tree.pop(path)))
+                if status != "A":
+                    tree[path] = old_sha
+                    totals.add(self._by_blob.get(old_sha))
+
+        return {"head": commits[0], "commits": history, "distinct_blobs": self.distinct_blobs}
+
+    def close(self):
+        self.repo.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class _Totals:
+    """Running sums behind the per-commit summary, updated incrementally."""
+
+    def __init__(self):
+        self.files = 0
+        self.loc = 0
+        self.mi_sum = 0.0
+        self.mi_files = 0
+        self.functions = 0
+        self.complexity_sum = 0
+        self.documented = 0
+
+    def _apply(self, result: Optional[Dict[str, Any]], sign: int):
+        if not result:
+            return
+        funcs = result.get("functions", [])
+        self.files += sign
+        self.loc += sign * result.get("loc", 0)
+        if "maintainability_index" in result:
+            self.mi_sum += sign * result["maintainability_index"]
+            self.mi_files += sign
+        self.functions += sign * len(funcs)
+        self.complexity_sum += sign * sum(f.get("cyclomatic_complexity", 0) for f in funcs)
+        self.documented += sign * sum(1 for f in funcs if f.get("has_docstring"))
+
+    def add(self, result: Optional[Dict[str, Any]]):
+        self._apply(result, 1)
+
+    def remove(self, result: Optional[Dict[str, Any]]):
+        self._apply(result, -1)
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "files": self.files,
+            "loc": self.loc,
+            "functions": self.functions,
+            "average_maintainability": self.mi_sum / self.mi_files if self.mi_files else 0,
+            "average_complexity": self.complexity_sum / self.functions if self.functions else 0,
+            "doc_coverage": self.documented / self.functions * 100 if self.functions else 0,
+        }
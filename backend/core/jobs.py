@@ -0,0 +1,211 @@
+"""
+Background jobs with progress reporting and cancellation.
+
+Jobs run on a small, fixed pool of worker threads. At most `max_queued`
+jobs may wait for a worker; further submissions are rejected with
+QueueFullError so callers can push back on clients instead of piling up
+work. A job's function receives the Job object and reports progress through
+it; it is expected to check `job.cancelled` between units of work and
+simply return when it is set, leaving whatever results it has collected.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from core.telemetry import register_queue
+
+DEFAULT_WORKERS = int(os.environ.get("CODEWHISPER_JOB_WORKERS", "2"))
+DEFAULT_MAX_QUEUED = int(os.environ.get("CODEWHISPER_JOB_QUEUE", "16"))
+# Finished jobs kept around for result retrieval; the oldest are dropped first
+DEFAULT_MAX_FINISHED = 100
+
+QUEUED, RUNNING, COMPLETED, CANCELLED, FAILED = "queued", "running", "completed", "cancelled", "failed"
+FINISHED_STATES = (COMPLETED, CANCELLED, FAILED)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None):
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        # Options chosen at submit time that shape how results are reported
+        self.params = params or {}
+        self.status = QUEUED
+        self.processed = 0
+        self.total: Optional[int] = None
+        self.results: List[Any] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+        self._future: Optional[Future] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def cancel(self) -> bool:
+        """
+        Request cancellation. A job that has not started yet is cancelled
+        right away; returns True in that case.
+        """
+        with self._lock:
+            self._cancel.set()
+            if self.status != QUEUED:
+                return False
+            self.status = CANCELLED
+            self.finished_at = time.time()
+        if self._future is not None:
+            self._future.cancel()
+        return True
+
+    def start(self) -> bool:
+        """Mark a queued job as running; False if it was cancelled first."""
+        with self._lock:
+            if self.cancelled:
+                return False
+            self.status = RUNNING
+            self.started_at = time.time()
+            return True
+
+    def set_total(self, total: int):
+        self.total = total
+
+    def advance(self, processed: int, results: List[Any]):
+        """Record `processed` more units of work and their results."""
+        with self._lock:
+            self.processed += processed
+            self.results.extend(results)
+
+    def snapshot_results(self) -> List[Any]:
+        with self._lock:
+            return list(self.results)
+
+    @property
+    def progress(self) -> Optional[float]:
+        if self.status == COMPLETED:
+            return 1.0
+        if not self.total:
+            return None
+        return min(1.0, self.processed / self.total)
+
+    def status_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "progress": self.progress,
+            "results": len(self.results),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobManager:
+    def __init__(self, max_workers: int = DEFAULT_WORKERS, max_queued: int = DEFAULT_MAX_QUEUED,
+                 max_finished: int = DEFAULT_MAX_FINISHED):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="codewhisper-job")
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._active = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queued(self) -> int:
+        """Jobs accepted but not yet picked up by a worker."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if job.status == QUEUED)
+
+    def submit(self, kind: str, fn: Callable[..., None], *args,
+               params: Optional[Dict[str, Any]] = None) -> Job:
+        job = Job(kind, params)
+        with self._lock:
+            if self._active >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"{self._active} jobs already queued or running")
+            self._active += 1
+            self._jobs[job.job_id] = job
+            self._prune()
+        job._future = self._executor.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED_STATES and job.cancel():
+            # Never started: its queue slot is free now
+            with self._lock:
+                self._active -= 1
+        return job
+
+    def _run(self, job: Job, fn: Callable[..., None], args):
+        # A job cancelled while queued was already finished by cancel()
+        if not job.start():
+            return
+        try:
+            fn(job, *args)
+            job.status = CANCELLED if job.cancelled else COMPLETED
+        except Exception as e:
+            print(f"Job {job.job_id} failed: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            with self._lock:
+                self._active -= 1
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in list(self._jobs.values()):
+            job.cancel()
+        self._executor.shutdown(wait=True)
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager() -> JobManager:
+    """Process-wide job manager, created on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager()
+        return _manager
+
+
+def _queued_jobs() -> int:
+    manager = _manager
+    return manager.queued if manager is not None else 0
+
+
+register_queue("jobs", _queued_jobs)
+
+
+def shutdown_job_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is not None:
+            _manager.shutdown()
+            _manager = None
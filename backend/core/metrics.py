@@ -1,51 +1,116 @@
 import ast
+from typing import Any, Dict, List
 
-class ComplexityVisitor(ast.NodeVisitor):
-    def __init__(self):
-        self.complexity = 1  # Base complexity is 1
+from core.telemetry import stage
 
-    def visit_If(self, node):
-        self.complexity += 1
-        self.generic_visit(node)
+# Exact-type sets: AST node classes are never subclassed, and a set lookup
+# is much cheaper than an isinstance chain on every node.
+_FUNCTION_NODES = frozenset({ast.FunctionDef, ast.AsyncFunctionDef})
+_BRANCH_NODES = frozenset({ast.If, ast.For, ast.While, ast.With, ast.AsyncWith})
 
-    def visit_For(self, node):
-        self.complexity += 1
-        self.generic_visit(node)
+def _decision_points(node: ast.AST) -> int:
+    """Number of extra paths a single node adds to the control flow."""
+    node_type = type(node)
+    if node_type in _BRANCH_NODES:
+        return 1
+    if node_type is ast.Try:
+        return len(node.handlers)
+    if node_type is ast.BoolOp:
+        return len(node.values) - 1
+    return 0
 
-    def visit_While(self, node):
-        self.complexity += 1
-        self.generic_visit(node)
+def complexity_from_ast(tree: ast.AST) -> Dict[str, Any]:
+    """
+    Cyclomatic complexity of a module and of every class, function and
+    method in it, computed in a single traversal.
 
-    def visit_FunctionDef(self, node):
-        # We don't increment for function def itself in the global scope, 
-        # but if we are calculating for a function, we start at 1.
-        # This visitor is intended to be run on a function body or module.
-        self.generic_visit(node)
+    The walk uses an explicit stack, so deeply nested (e.g. generated) code
+    cannot hit the recursion limit. Each function's complexity is 1 plus the
+    decision points inside it, including those of nested functions and
+    classes. A class's complexity is the sum of its methods' (and nested
+    classes') complexities plus any decision points in the class body
+    itself, and at least 1. The module total is 1 plus every decision point
+    in the file.
+    """
+    total = 1
+    blocks: List[Dict[str, Any]] = []
+    parents: List[int] = []
+    own: List[int] = []
 
-    def visit_AsyncFunctionDef(self, node):
-        self.generic_visit(node)
+    # (node, index of the innermost enclosing function or -1, qualified-name prefix, inside a class body)
+    stack = [(tree, -1, "", False)]
+    while stack:
+        node, owner, prefix, in_class = stack.pop()
+        points = _decision_points(node)
+        if points:
+            total += points
+            if owner >= 0:
+                own[owner] += points
 
-    def visit_Try(self, node):
-        self.complexity += len(node.handlers)
-        self.generic_visit(node)
+        children = []
+        for child in ast.iter_child_nodes(node):
+            child_type = type(child)
+            if child_type in _FUNCTION_NODES:
+                qualified_name = prefix + child.name
+                index = len(blocks)
+                blocks.append({
+                    "name": child.name,
+                    "qualified_name": qualified_name,
+                    "type": "method" if in_class else "function",
+                    "lineno": child.lineno,
+                    "endline": getattr(child, "end_lineno", None),
+                })
+                parents.append(owner)
+                own.append(0)
+                children.append((child, index, qualified_name + ".<locals>.", False))
+            elif child_type is ast.ClassDef:
+                qualified_name = prefix + child.name
+                index = len(blocks)
+                blocks.append({
+                    "name": child.name,
+                    "qualified_name": qualified_name,
+                    "type": "class",
+                    "lineno": child.lineno,
+                    "endline": getattr(child, "end_lineno", None),
+                })
+                parents.append(owner)
+                own.append(0)
+                children.append((child, index, qualified_name + ".", True))
+            else:
+                children.append((child, owner, prefix, in_class))
+        stack.extend(reversed(children))
 
-    def visit_With(self, node):
-        self.complexity += 1
-        self.generic_visit(node)
+    # Blocks are created after their parents, so one reverse sweep sees every
+    # block complete before its parent and rolls nested counts upwards.
+    members = [0] * len(blocks)
+    for index in range(len(blocks) - 1, -1, -1):
+        block = blocks[index]
+        if block["type"] == "class":
+            # The class body's own branches plus its methods' complexities
+            block["complexity"] = (own[index] + members[index]) or 1
+        else:
+            block["complexity"] = 1 + own[index]
+        parent = parents[index]
+        if parent >= 0:
+            own[parent] += own[index]
+            if blocks[parent]["type"] == "class":
+                members[parent] += block["complexity"] - own[index]
+    # A class's methods are found only after everything at its own level
+    blocks.sort(key=lambda block: block["lineno"])
 
-    def visit_AsyncWith(self, node):
-        self.complexity += 1
-        self.generic_visit(node)
-        
-    def visit_BoolOp(self, node):
-        self.complexity += len(node.values) - 1
-        self.generic_visit(node)
+    return {"complexity": total, "functions": blocks}
 
-def calculate_cyclomatic_complexity(source_code: str) -> int:
+def analyze_complexity(source_code: str) -> Dict[str, Any]:
+    """Module and per-function complexity for a source string; zero for unparsable code."""
     try:
-        tree = ast.parse(source_code)
-        visitor = ComplexityVisitor()
-        visitor.visit(tree)
-        return visitor.complexity
-    except SyntaxError:
-        return 0
+        with stage("parse"):
+            tree = ast.parse(source_code)
+    except (SyntaxError, ValueError, RecursionError, MemoryError):
+        # The parser itself recurses and gives up on very deeply nested
+        # expressions; null bytes raise ValueError
+        return {"complexity": 0, "functions": []}
+    with stage("metrics"):
+        return complexity_from_ast(tree)
+
+def calculate_cyclomatic_complexity(source_code: str) -> int:
+    return analyze_complexity(source_code)["complexity"]
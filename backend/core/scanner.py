@@ -1,17 +1,400 @@
+"""
+Source file discovery.
+
+Every place that needs "the source files of a project" goes through Scanner:
+it walks the tree with os.scandir, honors .gitignore files (and
+.git/info/exclude at the root), applies include/exclude patterns, skips
+oversized and binary files, and does not loop on symlink cycles. Results come
+back in a stable order: a directory's own files first, then its
+subdirectories, each sorted by name.
+
+With `workers > 1`, directory listings (and the per-file stat and binary
+sniffing) run on a thread pool a few directories ahead of the consumer,
+which mostly pays off on network or cold file systems; the results and
+their order do not change.
+"""
 import os
-from typing import List, Generator
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Generator, Iterable, List, Optional, Tuple
 
 SUPPORTED_EXTENSIONS = {'.py', '.js', '.ts', '.jsx', '.tsx'}
 
-def scan_directory(root_path: str) -> Generator[str, None, None]:
+# gitignore-style patterns that are never scanned, whatever .gitignore says:
+# hidden directories (.git, .venv, ...), virtualenvs, node_modules and bytecode
+DEFAULT_EXCLUDE = ('.*/', 'venv/', 'node_modules/', '__pycache__/')
+# Larger files are almost always generated or vendored
+DEFAULT_MAX_FILE_SIZE = int(os.environ.get("CODEWHISPER_SCAN_MAX_FILE_SIZE", str(2 * 1024 * 1024)))
+DEFAULT_WORKERS = int(os.environ.get("CODEWHISPER_SCAN_WORKERS", "1"))
+
+# Same heuristic as git: a NUL byte in the first 8000 bytes means binary
+_SNIFF_BYTES = 8000
+
+
+def _translate(pattern: str) -> str:
+    """Regex for one gitignore glob, matched against '/'-separated relative paths."""
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                i += 2
+                if i < n and pattern[i] == '/':
+                    # "**/" matches zero or more directories
+                    out.append('(?:.*/)?')
+                    i += 1
+                else:
+                    out.append('.*')
+                continue
+            out.append('[^/]*')
+        elif c == '?':
+            out.append('[^/]')
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[0] == '!':
+                    body = '^' + body[1:]
+                out.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return ''.join(out)
+
+
+def _compile_pattern(line: str):
+    """(regex, negated, dir_only) for one gitignore line, or None for blanks and comments."""
+    line = line.rstrip('\n').rstrip('\r')
+    if not line.endswith('\\ '):
+        line = line.rstrip(' ')
+    if not line or line.startswith('#'):
+        return None
+    negated = line.startswith('!')
+    if negated:
+        line = line[1:]
+    elif line.startswith('\\'):
+        # "\#foo" and "\!foo" are literal
+        line = line[1:] if line[1:2] in ('#', '!') else line
+    dir_only = line.endswith('/')
+    line = line.rstrip('/')
+    if not line:
+        return None
+    # A slash anywhere but the end anchors the pattern to the file's directory;
+    # otherwise it matches a name at any depth.
+    anchored = '/' in line
+    line = line.lstrip('/')
+    regex = _translate(line) if anchored else '(?:.*/)?' + _translate(line)
+    return re.compile(regex), negated, dir_only
+
+
+class IgnoreRules:
+    """
+    An ordered set of gitignore patterns, each relative to the directory of
+    the file it came from. As in git, the last matching pattern decides.
+    """
+
+    def __init__(self, rules: Tuple = ()):
+        self.rules = rules
+        # Most rule sets (e.g. DEFAULT_EXCLUDE) only name directories
+        self._has_file_rules = any(not rule[3] for rule in rules)
+
+    @classmethod
+    def from_patterns(cls, patterns: Iterable[str], base: str = "") -> "IgnoreRules":
+        return cls().extend(patterns, base)
+
+    def extend(self, patterns: Iterable[str], base: str = "") -> "IgnoreRules":
+        compiled = [rule for rule in map(_compile_pattern, patterns) if rule is not None]
+        if not compiled:
+            return self
+        prefix = base + '/' if base else ''
+        return IgnoreRules(self.rules + tuple((prefix,) + rule for rule in compiled))
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        if not (is_dir or self._has_file_rules):
+            return False
+        for prefix, regex, negated, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if prefix:
+                if not rel_path.startswith(prefix):
+                    continue
+                if regex.fullmatch(rel_path, len(prefix)):
+                    return not negated
+            elif regex.fullmatch(rel_path):
+                return not negated
+        return False
+
+    def __bool__(self):
+        return bool(self.rules)
+
+
+# Parsed ignore files keyed by path, revalidated by (mtime, size)
+_ignore_files: Dict[str, Tuple[Tuple[int, int], List[str]]] = {}
+_ignore_files_lock = threading.Lock()
+
+
+def _read_ignore_file(path: str) -> List[str]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return []
+    stamp = (st.st_mtime_ns, st.st_size)
+    with _ignore_files_lock:
+        cached = _ignore_files.get(path)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    try:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    with _ignore_files_lock:
+        _ignore_files[path] = (stamp, lines)
+    return lines
+
+
+def _extension(name: str) -> str:
+    """os.path.splitext(name)[1] for a bare file name, without the generic path handling."""
+    stem = name.lstrip('.')
+    dot = stem.rfind('.')
+    return stem[dot:] if dot >= 0 else ''
+
+
+def _is_binary(path: str) -> bool:
+    try:
+        with open(path, 'rb') as f:
+            return b'\0' in f.read(_SNIFF_BYTES)
+    except OSError:
+        return True
+
+
+class Scanner:
+    def __init__(self, extensions: Optional[Iterable[str]] = SUPPORTED_EXTENSIONS, include: Iterable[str] = (),
+                 exclude: Iterable[str] = DEFAULT_EXCLUDE, respect_gitignore: bool = True,
+                 max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE, skip_binary: bool = True,
+                 follow_symlinks: bool = False, workers: int = DEFAULT_WORKERS):
+        """
+        `extensions` restricts results to those suffixes (None: any file).
+        `include` and `exclude` are gitignore-style patterns relative to the
+        scan root; when `include` is given a file must match one of them.
+        `max_file_size` of None or 0 disables the size limit.
+        """
+        self.extensions = None if extensions is None else set(extensions)
+        self.include = IgnoreRules.from_patterns(include)
+        self.exclude = IgnoreRules.from_patterns(exclude)
+        self.respect_gitignore = respect_gitignore
+        self.max_file_size = max_file_size
+        self.skip_binary = skip_binary
+        self.follow_symlinks = follow_symlinks
+        self.workers = max(1, workers)
+
+    # --- Filtering ---
+
+    def _root_rules(self, root_path: str) -> IgnoreRules:
+        if not self.respect_gitignore:
+            return IgnoreRules()
+        return IgnoreRules.from_patterns(_read_ignore_file(os.path.join(root_path, '.git', 'info', 'exclude')))
+
+    def _dir_rules(self, dir_path: str, rel: str, rules: IgnoreRules) -> IgnoreRules:
+        """`rules` plus the directory's own .gitignore, if any."""
+        if not self.respect_gitignore:
+            return rules
+        return rules.extend(_read_ignore_file(os.path.join(dir_path, '.gitignore')), rel)
+
+    def _skip_dir(self, rel: str, rules: IgnoreRules) -> bool:
+        return self.exclude.ignored(rel, True) or rules.ignored(rel, True)
+
+    def _matches_file(self, rel: str, rules: IgnoreRules) -> bool:
+        """Name- and pattern-based checks only; no file system access."""
+        if self.include and not self.include.ignored(rel, False):
+            return False
+        return not (self.exclude.ignored(rel, False) or rules.ignored(rel, False))
+
+    def _matches_extension(self, name: str) -> bool:
+        return self.extensions is None or _extension(name) in self.extensions
+
+    def _accept_contents(self, path: str, stat: Callable[[], os.stat_result]) -> bool:
+        if self.max_file_size and stat().st_size > self.max_file_size:
+            return False
+        return not (self.skip_binary and _is_binary(path))
+
+    # --- Walking ---
+
+    def _list_dir(self, path: str, rel: str, rules: IgnoreRules):
+        """
+        One directory's accepted files and the subdirectories to descend
+        into, as (path, rel, rules, (st_dev, st_ino) when following symlinks).
+        """
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError:
+            return [], []
+        rules = self._dir_rules(path, rel, rules)
+
+        files, dirs = [], []
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+                if not (is_dir or self._matches_extension(entry.name)):
+                    continue
+                child_rel = rel + '/' + entry.name if rel else entry.name
+                if is_dir:
+                    if entry.is_symlink() and not self.follow_symlinks:
+                        continue
+                    if self._skip_dir(child_rel, rules):
+                        continue
+                    key = None
+                    if self.follow_symlinks:
+                        st = entry.stat()
+                        key = (st.st_dev, st.st_ino)
+                    dirs.append((entry.path, child_rel, rules, key))
+                elif self._matches_file(child_rel, rules) and entry.is_file():
+                    if self._accept_contents(entry.path, entry.stat):
+                        files.append(entry.path)
+            except OSError:
+                # Vanished while scanning, broken symlink, permission denied
+                continue
+        return files, dirs
+
+    @staticmethod
+    def _unvisited(dirs: List[Tuple], visited: Optional[set]) -> List[Tuple[str, str, IgnoreRules]]:
+        """
+        `dirs` minus those already reached through another path. Only the
+        consuming thread calls this, in yield order, so which of two links to
+        the same tree gets scanned never depends on thread timing.
+        """
+        kept = []
+        for path, rel, rules, key in dirs:
+            if visited is not None:
+                if key in visited:
+                    # Symlink cycle or a second link to the same tree
+                    continue
+                visited.add(key)
+            kept.append((path, rel, rules))
+        return kept
+
+    def scan(self, root_path: str) -> Generator[str, None, None]:
+        """Yield paths (joined onto `root_path` as given) of every accepted file under it."""
+        visited = None
+        if self.follow_symlinks:
+            try:
+                st = os.stat(root_path)
+            except OSError:
+                return
+            visited = {(st.st_dev, st.st_ino)}
+
+        root_item = (root_path, "", self._root_rules(root_path))
+        if self.workers == 1:
+            stack = [root_item]
+            while stack:
+                files, dirs = self._list_dir(*stack.pop())
+                yield from files
+                stack.extend(reversed(self._unvisited(dirs, visited)))
+            return
+
+        # Stack entries are [listing arguments, future or None]. The listings
+        # the consumer will reach next (the top of the stack) are submitted
+        # ahead of it, at most `lookahead` at a time, so the pool runs ahead
+        # without queueing a listing for every directory discovered.
+        lookahead = self.workers * 2
+        in_flight = 0
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="codewhisper-scan")
+        try:
+            stack = [[root_item, None]]
+            while stack:
+                item, future = stack.pop()
+                if future is None:
+                    files, dirs = self._list_dir(*item)
+                else:
+                    files, dirs = future.result()
+                    in_flight -= 1
+                stack.extend([d, None] for d in reversed(self._unvisited(dirs, visited)))
+                for entry in reversed(stack):
+                    if in_flight >= lookahead:
+                        break
+                    if entry[1] is None:
+                        entry[1] = pool.submit(self._list_dir, *entry[0])
+                        in_flight += 1
+                yield from files
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    # --- Single-path checks (watch mode) ---
+
+    def _rules_for_dir(self, root_path: str, parts: List[str]) -> Optional[IgnoreRules]:
+        """Rules in effect inside root/parts..., or None if scanning never gets there."""
+        rules = self._dir_rules(root_path, "", self._root_rules(root_path))
+        current, rel = root_path, ""
+        for part in parts:
+            rel = rel + '/' + part if rel else part
+            if self._skip_dir(rel, rules):
+                return None
+            current = os.path.join(current, part)
+            rules = self._dir_rules(current, rel, rules)
+        return rules
+
+    def accepts_file(self, root_path: str, file_path: str) -> bool:
+        rel = os.path.relpath(file_path, root_path)
+        parts = rel.split(os.sep)
+        if parts[0] == os.pardir:
+            return False
+        if not self._matches_extension(parts[-1]):
+            return False
+        rules = self._rules_for_dir(root_path, parts[:-1])
+        if rules is None or not self._matches_file('/'.join(parts), rules):
+            return False
+        if not os.path.isfile(file_path):
+            # Gone: still "ours", so callers can drop it
+            return True
+        try:
+            return self._accept_contents(file_path, lambda: os.stat(file_path))
+        except OSError:
+            return True
+
+    def accepts_dir(self, root_path: str, dir_path: str) -> bool:
+        rel = os.path.relpath(dir_path, root_path)
+        if rel == os.curdir:
+            return True
+        parts = rel.split(os.sep)
+        if parts[0] == os.pardir:
+            return False
+        rules = self._rules_for_dir(root_path, parts[:-1])
+        return rules is not None and not self._skip_dir('/'.join(parts), rules)
+
+
+_default_scanner = Scanner()
+
+
+def scan_directory(root_path: str, scanner: Optional[Scanner] = None) -> Generator[str, None, None]:
     """
     Recursively scans the directory and yields paths to supported files.
     """
-    for root, dirs, files in os.walk(root_path):
-        # Skip hidden directories and venv
-        dirs[:] = [d for d in dirs if not d.startswith('.') and d != 'venv' and d != 'node_modules']
-        
-        for file in files:
-            _, ext = os.path.splitext(file)
-            if ext in SUPPORTED_EXTENSIONS:
-                yield os.path.join(root, file)
+    return (scanner or _default_scanner).scan(root_path)
+
+def is_scanned_path(root_path: str, file_path: str, scanner: Optional[Scanner] = None) -> bool:
+    """
+    True if scan_directory(root_path) would yield file_path. A file that no
+    longer exists is judged on its path alone.
+    """
+    return (scanner or _default_scanner).accepts_file(root_path, file_path)
+
+def is_scanned_dir(root_path: str, dir_path: str, scanner: Optional[Scanner] = None) -> bool:
+    """True if scan_directory(root_path) would descend into dir_path."""
+    return (scanner or _default_scanner).accepts_dir(root_path, dir_path)
+
+def scan_order_key(rel_path: str):
+    """
+    Sort key reproducing scan_directory's order for paths relative to the
+    root: a directory's own files first, then its subdirectories, each sorted.
+    """
+    parts = rel_path.split(os.sep)
+    return tuple((1, d) for d in parts[:-1]) + ((0, parts[-1]),)
@@ -0,0 +1,149 @@
+"""
+Per-file symbol tables.
+
+Radon, Lizard and javalang each report functions in their own way (bare
+names, `Class::method`, `outer.inner`, no end lines, ...). A SymbolTable is
+built once per file from the syntax tree and indexed by start line, so each
+tool's results can be joined against it in O(1) per function instead of
+searching by name.
+
+Every symbol gets a `symbol_id` derived from its qualified name (plus the
+parameter types for Java overloads). It does not contain line numbers, so it
+stays the same when unrelated code above the function moves, which makes it
+usable as a key for caches and diffs between revisions.
+"""
+import ast
+from typing import Dict, Iterable, List, Optional
+
+import javalang
+
+# Lizard and javalang can disagree on the start line when modifiers or
+# annotations span several lines; matches are looked up within this window.
+LINE_TOLERANCE = 4
+
+_JAVA_TYPE_DECLARATIONS = (
+    javalang.tree.ClassDeclaration,
+    javalang.tree.InterfaceDeclaration,
+    javalang.tree.EnumDeclaration,
+)
+
+
+def _has_docstring(node: ast.AST) -> bool:
+    """True if the body opens with a string, even an empty one (ast.get_docstring reports that as "")."""
+    first = node.body[0]
+    return isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant) \
+        and isinstance(first.value.value, str)
+
+
+class Symbol:
+    __slots__ = ("symbol_id", "qualified_name", "name", "kind", "lineno", "endline", "has_docstring")
+
+    def __init__(self, symbol_id: str, qualified_name: str, name: str, kind: str,
+                 lineno: int, endline: Optional[int], has_docstring: bool):
+        self.symbol_id = symbol_id
+        self.qualified_name = qualified_name
+        self.name = name
+        self.kind = kind
+        self.lineno = lineno
+        self.endline = endline
+        self.has_docstring = has_docstring
+
+    def __repr__(self):
+        return f"Symbol({self.symbol_id!r}, lines {self.lineno}-{self.endline})"
+
+
+class SymbolTable:
+    def __init__(self):
+        self.symbols: List[Symbol] = []
+        self._by_line: Dict[int, Symbol] = {}
+        self._id_counts: Dict[str, int] = {}
+
+    def add(self, qualified_name: str, name: str, kind: str, lineno: int,
+            endline: Optional[int] = None, has_docstring: bool = False,
+            signature: Optional[str] = None) -> Symbol:
+        base_id = f"{qualified_name}({signature})" if signature is not None else qualified_name
+        # Same identity defined twice (e.g. in both branches of an if): number the repeats
+        count = self._id_counts.get(base_id, 0) + 1
+        self._id_counts[base_id] = count
+        symbol_id = base_id if count == 1 else f"{base_id}#{count}"
+
+        symbol = Symbol(symbol_id, qualified_name, name, kind, lineno, endline, has_docstring)
+        self.symbols.append(symbol)
+        # Keep the outermost definition if two start on the same line
+        self._by_line.setdefault(lineno, symbol)
+        return symbol
+
+    def at_line(self, lineno: int, tolerance: int = 0) -> Optional[Symbol]:
+        """Find the symbol starting at `lineno`, or the closest one within `tolerance` lines."""
+        symbol = self._by_line.get(lineno)
+        if symbol is not None:
+            return symbol
+        for delta in range(1, tolerance + 1):
+            for candidate in (lineno - delta, lineno + delta):
+                symbol = self._by_line.get(candidate)
+                if symbol is not None:
+                    return symbol
+        return None
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __iter__(self):
+        return iter(self.symbols)
+
+    @classmethod
+    def from_python(cls, tree: ast.AST) -> "SymbolTable":
+        """Build a table of classes and functions using Python's __qualname__ convention."""
+        table = cls()
+        # (node, qualified-name prefix, enclosing node is a class)
+        stack = [(tree, "", False)]
+        while stack:
+            node, prefix, in_class = stack.pop()
+            children = []
+            for child in ast.iter_child_nodes(node):
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    qualified_name = prefix + child.name
+                    is_class = isinstance(child, ast.ClassDef)
+                    if is_class:
+                        kind = "class"
+                    else:
+                        kind = "method" if in_class else "function"
+                    table.add(qualified_name, child.name, kind, child.lineno,
+                              getattr(child, "end_lineno", None), _has_docstring(child))
+                    child_prefix = qualified_name + ("." if is_class else ".<locals>.")
+                    children.append((child, child_prefix, is_class))
+                else:
+                    children.append((child, prefix, in_class))
+            # Reversed so definitions are visited (and numbered) in source order
+            stack.extend(reversed(children))
+        return table
+
+    @classmethod
+    def from_javalang(cls, tree) -> "SymbolTable":
+        """Build a table of methods and constructors, with parameter types to tell overloads apart."""
+        table = cls()
+        for path, node in tree:
+            if not isinstance(node, (javalang.tree.MethodDeclaration, javalang.tree.ConstructorDeclaration)):
+                continue
+            owners = [p.name for p in path if isinstance(p, _JAVA_TYPE_DECLARATIONS)]
+            qualified_name = ".".join(owners + [node.name])
+            kind = "constructor" if isinstance(node, javalang.tree.ConstructorDeclaration) else "method"
+            lineno = node.position.line if node.position else 0
+            table.add(qualified_name, node.name, kind, lineno,
+                      has_docstring=bool(node.documentation),
+                      signature=",".join(_java_type_name(p) for p in node.parameters))
+        return table
+
+    @classmethod
+    def from_lizard(cls, functions: Iterable) -> "SymbolTable":
+        """Fallback for languages without a dedicated parser: Lizard's own names."""
+        table = cls()
+        for func in functions:
+            table.add(func.name, func.name.split("::")[-1].split(".")[-1], "function",
+                      func.start_line, func.end_line)
+        return table
+
+
+def _java_type_name(parameter) -> str:
+    name = parameter.type.name + "[]" * len(parameter.type.dimensions or [])
+    return name + "..." if parameter.varargs else name
@@ -0,0 +1,395 @@
+"""
+Prometheus metrics and per-request tracing.
+
+Code marks the expensive parts of a request with `stage(name)`:
+
+    with stage("parse"):
+        tree = ast.parse(source)
+
+Each stage is observed in the `codewhisper_stage_duration_seconds`
+histogram and, when tracing is enabled, recorded as a span of the current
+request's trace. HTTP latency per route comes from TelemetryMiddleware.
+Streamed generation reports its time to first token separately, and each
+docstring is counted by source (model or template); queue depths, cache hit
+ratios and process memory are read when /metrics is scraped.
+
+Work done in engine worker processes cannot reach this process's registry
+directly, so workers run under `capture()` and send the captured samples back
+with their results; the parent replays them with `record_captured()`.
+
+Tracing is off unless $CODEWHISPER_TRACE_FILE is set: each traced request is
+then appended to that file as one JSON line holding its spans.
+$CODEWHISPER_TRACE_SAMPLE (0-1, default 1) traces only a fraction of requests.
+
+prometheus_client is optional; without it stages still feed traces, and
+/metrics reports that metrics are unavailable.
+"""
+import contextvars
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    Counter = Gauge = Histogram = generate_latest = None
+
+TRACE_FILE = os.environ.get("CODEWHISPER_TRACE_FILE")
+TRACE_SAMPLE = float(os.environ.get("CODEWHISPER_TRACE_SAMPLE", "1"))
+
+# Requests range from sub-millisecond health checks to whole-project scans
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+if Histogram is not None:
+    REQUEST_LATENCY = Histogram(
+        "codewhisper_http_request_duration_seconds", "HTTP request latency, including the response body",
+        ["method", "route", "status"], buckets=LATENCY_BUCKETS)
+    STAGE_LATENCY = Histogram(
+        "codewhisper_stage_duration_seconds", "Time spent in each processing stage",
+        ["stage"], buckets=STAGE_BUCKETS)
+    CACHE_LOOKUPS = Counter(
+        "codewhisper_cache_lookups_total", "Cache lookups by cache and outcome", ["cache", "result"])
+    CACHE_HIT_RATIO = Gauge(
+        "codewhisper_cache_hit_ratio", "Hits / lookups since start, per cache", ["cache"])
+    QUEUE_DEPTH = Gauge(
+        "codewhisper_queue_depth", "Items waiting in each queue", ["queue"])
+    TIME_TO_FIRST_TOKEN = Histogram(
+        "codewhisper_time_to_first_token_seconds", "Time from a streamed generate request to its first token",
+        ["mode"], buckets=LATENCY_BUCKETS)
+    DOCSTRING_SOURCE = Counter(
+        "codewhisper_docstrings_total", "Docstrings produced, by source (model or template) and template kind",
+        ["source", "kind"])
+
+# cache name -> [hits, misses], for the hit ratio gauge
+_cache_totals: Dict[str, List[int]] = {}
+_cache_totals_lock = threading.Lock()
+# queue name -> function returning its current depth
+_queue_gauges: Dict[str, Callable[[], float]] = {}
+
+
+def metrics_available() -> bool:
+    return Histogram is not None
+
+
+class _Capture:
+    """Samples collected under capture(), to be replayed in another process."""
+
+    def __init__(self):
+        self.stages: List[tuple] = []
+        self.cache: Dict[tuple, int] = {}
+
+
+_capture: contextvars.ContextVar[Optional[_Capture]] = contextvars.ContextVar("codewhisper_capture", default=None)
+
+
+@contextmanager
+def capture() -> Iterator[_Capture]:
+    """Collect stage timings and cache lookups instead of recording them."""
+    captured = _Capture()
+    token = _capture.set(captured)
+    try:
+        yield captured
+    finally:
+        _capture.reset(token)
+
+
+def record_captured(captured: _Capture):
+    for name, seconds in captured.stages:
+        _observe_stage(name, seconds)
+    for (cache, hit), count in captured.cache.items():
+        _count_cache(cache, hit, count)
+    trace = _trace.get()
+    if trace is not None:
+        # Worker-side stages have no meaningful offsets here; keep per-stage totals
+        for name, seconds in captured.stages:
+            trace.add_aggregate(name, 1, seconds)
+
+
+def _observe_stage(name: str, seconds: float):
+    if Histogram is not None:
+        STAGE_LATENCY.labels(name).observe(seconds)
+
+
+def _count_cache(cache: str, hit: bool, count: int = 1):
+    if Counter is not None:
+        CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc(count)
+    with _cache_totals_lock:
+        totals = _cache_totals.setdefault(cache, [0, 0])
+        totals[0 if hit else 1] += count
+
+
+def record_cache_lookup(cache: str, hit: bool):
+    captured = _capture.get()
+    if captured is not None:
+        key = (cache, hit)
+        captured.cache[key] = captured.cache.get(key, 0) + 1
+    else:
+        _count_cache(cache, hit)
+
+
+def cache_hit_ratios() -> Dict[str, float]:
+    with _cache_totals_lock:
+        return {cache: hits / (hits + misses) for cache, (hits, misses) in _cache_totals.items() if hits + misses}
+
+
+def record_time_to_first_token(mode: str, seconds: float):
+    if Histogram is not None:
+        TIME_TO_FIRST_TOKEN.labels(mode).observe(seconds)
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes["time_to_first_token_ms"] = seconds * 1000
+
+
+def record_docstring_source(source: str, kind: str = ""):
+    """Count one docstring produced by `source` ("model", or "template" of `kind`)."""
+    if Counter is not None:
+        DOCSTRING_SOURCE.labels(source, kind).inc()
+    trace = _trace.get()
+    if trace is not None:
+        trace.attributes["docstring_source"] = f"{source}:{kind}" if kind else source
+
+
+def register_queue(name: str, depth: Callable[[], float]):
+    """Report `depth()` as the size of queue `name` on every scrape."""
+    _queue_gauges[name] = depth
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as processing stage `name`."""
+    start = time.perf_counter()
+    trace = _trace.get()
+    span = trace.start_span(name, start) if trace is not None else None
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        _record_stage(name, end - start)
+        if trace is not None:
+            trace.end_span(span, name, start, end)
+
+
+def _record_stage(name: str, seconds: float):
+    captured = _capture.get()
+    if captured is not None:
+        captured.stages.append((name, seconds))
+    else:
+        _observe_stage(name, seconds)
+
+
+def timed_iter(name: str, iterable: Iterable) -> Iterator:
+    """
+    Yield from `iterable` (e.g. a lazy directory scan), recording the time
+    spent producing items as a single `name` stage once iteration ends. The
+    consumer's work between items is not counted.
+    """
+    iterator = iter(iterable)
+    trace = _trace.get()
+    first = None
+    seconds = 0.0
+    try:
+        while True:
+            start = time.perf_counter()
+            if first is None:
+                first = start
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                seconds += time.perf_counter() - start
+            yield item
+    finally:
+        if first is not None:
+            _record_stage(name, seconds)
+            if trace is not None:
+                trace.add_span(name, first, seconds)
+
+
+# --- Tracing ---
+
+# Spans kept per trace; later ones are folded into per-name totals
+MAX_SPANS = 1000
+
+_span_parent: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar("codewhisper_span_parent", default=None)
+
+
+class Trace:
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        self.attributes: Dict[str, Any] = {}
+        self._overflow: Dict[str, List[float]] = {}
+
+    def start_span(self, name: str, start: float) -> Optional[Dict[str, Any]]:
+        if len(self.spans) >= MAX_SPANS:
+            return None
+        span = {
+            "id": len(self.spans),
+            "parent": _span_parent.get(),
+            "name": name,
+            "start_ms": (start - self.start) * 1000,
+            "thread": threading.current_thread().name,
+        }
+        self.spans.append(span)
+        span["_token"] = _span_parent.set(span["id"])
+        return span
+
+    def end_span(self, span: Optional[Dict[str, Any]], name: str, start: float, end: float):
+        if span is None:
+            self.add_aggregate(name, 1, end - start)
+            return
+        token = span.pop("_token")
+        try:
+            _span_parent.reset(token)
+        except ValueError:
+            # Ended in a different context than it started (e.g. a generator
+            # resumed on another thread); nesting of later spans may be off.
+            pass
+        span["duration_ms"] = (end - self.start) * 1000 - span["start_ms"]
+
+    def add_span(self, name: str, start: float, seconds: float):
+        """A finished span of `seconds` of work that began at `start`, possibly with gaps."""
+        if len(self.spans) >= MAX_SPANS:
+            self.add_aggregate(name, 1, seconds)
+            return
+        self.spans.append({
+            "id": len(self.spans),
+            "parent": _span_parent.get(),
+            "name": name,
+            "start_ms": (start - self.start) * 1000,
+            "thread": threading.current_thread().name,
+            "duration_ms": seconds * 1000,
+        })
+
+    def add_aggregate(self, name: str, count: int, seconds: float):
+        entry = self._overflow.setdefault(name, [0, 0.0])
+        entry[0] += count
+        entry[1] += seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        spans = [{k: v for k, v in span.items() if not k.startswith("_")} for span in self.spans]
+        spans.extend({"name": name, "count": count, "total_ms": seconds * 1000, "aggregated": True}
+                     for name, (count, seconds) in self._overflow.items())
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "start": self.start_wall,
+            "duration_ms": (time.perf_counter() - self.start) * 1000,
+            "attributes": self.attributes,
+            "spans": spans,
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("codewhisper_trace", default=None)
+
+
+class FileExporter:
+    """Appends finished traces to a JSON-lines file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace):
+        line = json.dumps(trace.to_dict())
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+_exporter: Optional[FileExporter] = FileExporter(TRACE_FILE) if TRACE_FILE else None
+
+
+def set_trace_exporter(exporter: Optional[FileExporter]):
+    global _exporter
+    _exporter = exporter
+
+
+# --- HTTP ---
+
+def _route_template(scope) -> str:
+    """
+    The matched route's path template (e.g. /api/v1/jobs/{job_id}).
+    Unmatched paths share one label so scanners cannot blow up cardinality.
+    """
+    route = scope.get("route")
+    template = getattr(route, "path", None)
+    if template is None:
+        return "unmatched"
+    # Routes of included routers may only know the part after the router
+    # prefix; recover the prefix from the request path.
+    path = scope["path"]
+    regex = getattr(route, "path_regex", None)
+    if regex is not None and not regex.match(path):
+        for i, char in enumerate(path):
+            if char == "/" and i and regex.match(path[i:]):
+                return path[:i] + template
+    return template
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware recording request latency per route template, measured
+    until the last body chunk is sent (so streamed responses count in full),
+    and tracing sampled requests.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+        trace = None
+        token = None
+        if _exporter is not None and random.random() < TRACE_SAMPLE:
+            trace = Trace(f"{scope['method']} {scope['path']}")
+            token = _trace.set(trace)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if token is not None:
+                _trace.reset(token)
+            route_label = _route_template(scope)
+            if Histogram is not None:
+                REQUEST_LATENCY.labels(scope["method"], route_label, str(status["code"])).observe(
+                    time.perf_counter() - start)
+            if trace is not None:
+                trace.attributes.update(route=route_label, status=status["code"])
+                _exporter.export(trace)
+
+
+def render_metrics() -> bytes:
+    """The Prometheus text exposition of every metric, refreshed gauges included."""
+    if generate_latest is None:
+        raise RuntimeError("prometheus_client is not installed")
+    for name, depth in list(_queue_gauges.items()):
+        try:
+            QUEUE_DEPTH.labels(name).set(depth())
+        except Exception as e:
+            print(f"Queue gauge {name} failed: {e}")
+    for cache, ratio in cache_hit_ratios().items():
+        CACHE_HIT_RATIO.labels(cache).set(ratio)
+    # Process memory and CPU come from prometheus_client's default process collector
+    return generate_latest()
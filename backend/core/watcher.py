@@ -0,0 +1,357 @@
+"""
+Watch mode: keep per-file metrics for registered project roots up to date.
+
+Each watched root gets a ProjectIndex, populated once with the analysis
+engine and then updated incrementally as files change. Changes are picked up
+from file system events (inotify on Linux, through watchdog) when watchdog
+is installed and usable, and with a polling scanner otherwise. Events are
+coalesced: a burst of saves, a branch checkout or a formatter run is
+processed as one batch once things go quiet.
+
+Every change that alters the index bumps its version counter, so clients can
+ask for just the files that changed since the version they last saw.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from core.engine import analyze_path, get_engine
+from core.scanner import Scanner, is_scanned_dir, is_scanned_path, scan_directory, scan_order_key
+from core.telemetry import register_queue, stage
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+DEFAULT_DEBOUNCE = 0.2
+DEFAULT_POLL_INTERVAL = 2.0
+# Deletions remembered for clients catching up; older ones force a reset
+DEFAULT_DELETION_WINDOW = 10000
+
+# Polling only needs the candidate paths: reading the head of every file on
+# every poll would be costly, so contents are checked (by notify) only for
+# files whose stat changed.
+_stat_scanner = Scanner(max_file_size=None, skip_binary=False)
+
+
+class ProjectIndex:
+    """
+    In-memory metrics for one project root, keyed by path relative to it.
+
+    Stored results never contain `file_path`; callers join the relative path
+    onto whatever form of the root they were given.
+    """
+
+    def __init__(self, root: str, deletion_window: int = DEFAULT_DELETION_WINDOW):
+        self.root = root
+        self.deletion_window = deletion_window
+        self.version = 0
+        self._lock = threading.Lock()
+        # rel_path -> (version it last changed at, metrics)
+        self._entries: Dict[str, Tuple[int, Dict]] = {}
+        # rel_path -> version it was deleted at, oldest first, for the most
+        # recent `deletion_window` deletions
+        self._deleted: Dict[str, int] = {}
+        # Deletions up to this version have been dropped from _deleted
+        self._pruned_through = 0
+
+    def update(self, rel_path: str, metrics: Dict) -> bool:
+        """Store new metrics for a file. Returns False if nothing changed."""
+        with self._lock:
+            current = self._entries.get(rel_path)
+            if current is not None and current[1] == metrics:
+                return False
+            self.version += 1
+            self._entries[rel_path] = (self.version, metrics)
+            self._deleted.pop(rel_path, None)
+            return True
+
+    def remove(self, rel_path: str) -> bool:
+        with self._lock:
+            if self._entries.pop(rel_path, None) is None:
+                return False
+            self.version += 1
+            self._deleted[rel_path] = self.version
+            while len(self._deleted) > self.deletion_window:
+                # Versions only grow, so the first tombstone is the oldest
+                oldest = next(iter(self._deleted))
+                self._pruned_through = self._deleted.pop(oldest)
+            return True
+
+    def paths_under(self, rel_dir: str) -> List[str]:
+        prefix = rel_dir.rstrip(os.sep) + os.sep
+        with self._lock:
+            return [p for p in self._entries if rel_dir in (os.curdir, '') or p.startswith(prefix)]
+
+    def snapshot(self) -> Tuple[int, List[Tuple[str, Dict]]]:
+        """All entries in scan order, with the version they reflect."""
+        with self._lock:
+            items = [(rel, entry[1]) for rel, entry in self._entries.items()]
+            version = self.version
+        items.sort(key=lambda item: scan_order_key(item[0]))
+        return version, items
+
+    def iter_entries(self, batch_size: int = 256) -> Iterator[Tuple[str, Dict]]:
+        """
+        All entries in scan order, like snapshot(), but read `batch_size` at a
+        time so the first ones are available without copying the whole index.
+        Files deleted while iterating are skipped.
+        """
+        with self._lock:
+            paths = list(self._entries)
+        paths.sort(key=scan_order_key)
+        for start in range(0, len(paths), batch_size):
+            with self._lock:
+                batch = [(rel, self._entries.get(rel)) for rel in paths[start:start + batch_size]]
+            for rel, entry in batch:
+                if entry is not None:
+                    yield rel, entry[1]
+
+    def changes_since(self, since: int) -> Tuple[int, List[Tuple[str, Dict]], List[str], bool]:
+        """
+        Files changed and deleted after version `since`, the current version,
+        and whether this is a reset.
+
+        Only the last `deletion_window` deletions are remembered. A caller
+        whose `since` is older than the oldest of them, or newer than the
+        current version (e.g. it last saw a previous run of the server), gets
+        a reset instead: every file, no deletions, and it should drop
+        whatever it has that is not listed.
+        """
+        with self._lock:
+            reset = 0 < since < self._pruned_through or since > self.version
+            if reset:
+                since = 0
+            changed = [(rel, entry[1]) for rel, entry in self._entries.items() if entry[0] > since]
+            deleted = [rel for rel, version in self._deleted.items() if version > since] if since else []
+            version = self.version
+        changed.sort(key=lambda item: scan_order_key(item[0]))
+        deleted.sort(key=scan_order_key)
+        return version, changed, deleted, reset
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class _EventHandler(FileSystemEventHandler):
+    """Forwards watchdog events to a ProjectWatcher."""
+
+    def __init__(self, watcher: "ProjectWatcher"):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.event_type == "moved":
+            # A rename is a delete of the old path plus a create of the new one
+            self.watcher.notify(event.src_path, event.is_directory)
+            self.watcher.notify(event.dest_path, event.is_directory)
+        elif event.event_type in ("created", "deleted"):
+            self.watcher.notify(event.src_path, event.is_directory)
+        elif event.event_type in ("modified", "closed") and not event.is_directory:
+            # Directory "modified" events only echo changes to their entries
+            self.watcher.notify(event.src_path)
+
+
+class ProjectWatcher:
+    """Keeps a ProjectIndex in sync with the files under `root`."""
+
+    def __init__(self, root: str, jobs: Optional[int] = None, debounce: float = DEFAULT_DEBOUNCE,
+                 poll_interval: float = DEFAULT_POLL_INTERVAL, use_polling: bool = False):
+        self.root = os.path.abspath(root)
+        self.index = ProjectIndex(self.root)
+        self.jobs = jobs
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_polling = use_polling or Observer is None
+        self.mode = None
+
+        self._pending_files: Set[str] = set()
+        self._pending_dirs: Set[str] = set()
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._observer = None
+
+    def start(self):
+        # Take the polling baseline before the initial scan so edits made
+        # while it runs are not missed.
+        snapshot = self._stat_tree() if self.use_polling else None
+        if not self.use_polling:
+            self._start_observer()
+
+        for result in get_engine(jobs=self.jobs).iter_results(scan_directory(self.root)):
+            rel = os.path.relpath(result.pop("file_path"), self.root)
+            self.index.update(rel, result)
+
+        if self.use_polling:
+            if snapshot is None:
+                snapshot = self._stat_tree()
+            self.mode = "polling"
+            self._spawn(self._poll_loop, snapshot)
+        self._spawn(self._process_loop)
+        print(f"Watching {self.root} ({self.mode}, {len(self.index)} files indexed)")
+
+    def stop(self):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        for thread in self._threads:
+            thread.join()
+
+    @property
+    def pending(self) -> int:
+        """Paths queued for re-analysis but not processed yet."""
+        with self._cond:
+            return len(self._pending_files) + len(self._pending_dirs)
+
+    def notify(self, path: str, is_directory: bool = False):
+        """Queue a path for re-analysis; the batch runs once events stop for `debounce` seconds."""
+        path = os.path.abspath(path)
+        with self._cond:
+            if is_directory:
+                if not is_scanned_dir(self.root, path):
+                    return
+                self._pending_dirs.add(path)
+            elif is_scanned_path(self.root, path):
+                self._pending_files.add(path)
+            else:
+                return
+            self._last_event = time.monotonic()
+            self._cond.notify()
+
+    def _start_observer(self):
+        try:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.root, recursive=True)
+            self._observer.start()
+            self.mode = "events"
+        except OSError as e:
+            # e.g. the inotify watch limit is exhausted
+            print(f"File system events unavailable for {self.root} ({e}); falling back to polling")
+            self._observer = None
+            self.use_polling = True
+
+    def _spawn(self, target, *args):
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _process_loop(self):
+        while not self._stop.is_set():
+            with self._cond:
+                while not (self._pending_files or self._pending_dirs) and not self._stop.is_set():
+                    self._cond.wait()
+                # Coalesce: wait until no new event has arrived for `debounce` seconds
+                while not self._stop.is_set():
+                    quiet_for = time.monotonic() - self._last_event
+                    if quiet_for >= self.debounce:
+                        break
+                    self._cond.wait(self.debounce - quiet_for)
+                files, self._pending_files = self._pending_files, set()
+                dirs, self._pending_dirs = self._pending_dirs, set()
+            if self._stop.is_set():
+                return
+            with stage("watch_update"):
+                self._apply(files, dirs)
+
+    def _apply(self, files: Set[str], dirs: Set[str]):
+        for directory in dirs:
+            rel_dir = os.path.relpath(directory, self.root)
+            # Entries under a deleted or moved-away directory disappear;
+            # anything (still) present gets re-analyzed.
+            files.update(os.path.join(self.root, rel) for rel in self.index.paths_under(rel_dir))
+            if os.path.isdir(directory):
+                files.update(p for p in scan_directory(directory) if is_scanned_path(self.root, p))
+        for path in files:
+            rel = os.path.relpath(path, self.root)
+            result = analyze_path(path) if os.path.isfile(path) else None
+            if result is None:
+                self.index.remove(rel)
+            else:
+                result.pop("file_path", None)
+                self.index.update(rel, result)
+
+    def _stat_tree(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in scan_directory(self.root, _stat_scanner):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            snapshot[path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def _poll_loop(self, previous: Dict[str, Tuple[int, int]]):
+        while not self._stop.wait(self.poll_interval):
+            current = self._stat_tree()
+            for path, stamp in current.items():
+                if previous.get(path) != stamp:
+                    self.notify(path)
+            for path in previous.keys() - current.keys():
+                self.notify(path)
+            previous = current
+
+
+# Registry of watched roots, keyed by absolute path
+_watchers: Dict[str, ProjectWatcher] = {}
+_registry_lock = threading.Lock()
+
+
+def watch_project(root: str, jobs: Optional[int] = None, use_polling: bool = False) -> ProjectWatcher:
+    """Start watching `root`, or return the existing watcher for it."""
+    key = os.path.abspath(root)
+    with _registry_lock:
+        watcher = _watchers.get(key)
+    if watcher is not None:
+        return watcher
+    # The initial scan runs outside the lock so other roots are not held up
+    watcher = ProjectWatcher(key, jobs=jobs, use_polling=use_polling)
+    watcher.start()
+    with _registry_lock:
+        registered = _watchers.setdefault(key, watcher)
+    if registered is not watcher:
+        # Another caller started watching the same root meanwhile
+        watcher.stop()
+    return registered
+
+
+def unwatch_project(root: str) -> bool:
+    with _registry_lock:
+        watcher = _watchers.pop(os.path.abspath(root), None)
+    if watcher is None:
+        return False
+    watcher.stop()
+    return True
+
+
+def get_watcher(root: str) -> Optional[ProjectWatcher]:
+    return _watchers.get(os.path.abspath(root))
+
+
+def list_watchers() -> List[ProjectWatcher]:
+    return list(_watchers.values())
+
+
+def watch_from_env(var: str = "CODEWHISPER_WATCH"):
+    """Register the roots listed (os.pathsep-separated) in $CODEWHISPER_WATCH."""
+    for root in filter(None, os.environ.get(var, "").split(os.pathsep)):
+        if os.path.isdir(root):
+            watch_project(root)
+        else:
+            print(f"Not watching {root}: not a directory")
+
+
+register_queue("watch_events", lambda: sum(w.pending for w in list_watchers()))
+
+
+def stop_all():
+    for root in list(_watchers):
+        unwatch_project(root)
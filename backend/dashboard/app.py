@@ -1,14 +1,17 @@
 import streamlit as st
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import sys
 import os
-import glob
 
 # Add parent directory to path to import core modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from core.analyzer import MetricsAnalyzer
+from core.cache import open_default_cache
+from core.columnar import MetricsStore
+from core.scanner import Scanner
 
 # --- Page Config ---
 st.set_page_config(page_title="CodeWhisper Report", layout="wide", initial_sidebar_state="expanded")
@@ -109,12 +112,10 @@ st.sidebar.info("v1.0.0 | CONFIDENTIAL")
 # --- Analysis Logic ---
 @st.cache_data
 def run_analysis(path):
-    analyzer = MetricsAnalyzer()
+    cache = open_default_cache()
+    analyzer = MetricsAnalyzer(cache=cache)
     results = []
-    files = []
-    for ext in ['*.py', '*.java']:
-        files.extend(glob.glob(os.path.join(path, '**', ext), recursive=True))
-    files = [f for f in files if 'venv' not in f and '__pycache__' not in f and 'node_modules' not in f]
+    files = list(Scanner(extensions={'.py', '.java'}).scan(path))
     
     progress_bar = st.sidebar.progress(0)
     for i, file_path in enumerate(files):
@@ -125,6 +126,8 @@ def run_analysis(path):
         except Exception:
             pass
         progress_bar.progress((i + 1) / len(files))
+    if cache is not None:
+        cache.close()
     return results
 
 # --- Main Document Content ---
@@ -141,27 +144,16 @@ if analyze_btn or 'analysis_results' in st.session_state:
         st.warning("No data found. Please verify the source path.")
     else:
         # Data Processing
-        df_files = []
-        for r in results:
-            funcs = r.get('functions', [])
-            if funcs:
-                avg_complexity = sum(f['cyclomatic_complexity'] for f in funcs) / len(funcs)
-                doc_count = sum(1 for f in funcs if f.get('has_docstring', False))
-                coverage = (doc_count / len(funcs)) * 100
-                max_complexity = max(f['cyclomatic_complexity'] for f in funcs)
-            else:
-                avg_complexity = 0; coverage = 0; max_complexity = 0
-                
-            df_files.append({
-                "File": os.path.relpath(r['file_path'], repo_path),
-                "LOC": r.get('loc', 0),
-                "MI": r.get('maintainability_index', 0),
-                "Avg Comp": avg_complexity,
-                "Max Comp": max_complexity,
-                "Doc %": coverage
-            })
-        
-        df = pd.DataFrame(df_files)
+        store = MetricsStore.from_results(results)
+        features = store.file_features()
+        df = pd.DataFrame({
+            "File": [os.path.relpath(p, repo_path) for p in store.files['file_path']],
+            "LOC": features['loc'],
+            "MI": np.nan_to_num(features['maintainability_index'], nan=0.0),
+            "Avg Comp": features['avg_complexity'],
+            "Max Comp": features['max_complexity'],
+            "Doc %": features['doc_coverage']
+        })
 
         # --- Document Header ---
         st.markdown("# TECHNICAL DEBT AUDIT REPORT")
@@ -1,11 +1,41 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response
 import os
-from api import analysis
+import threading
+from api import analysis, jobs, watch
+from core.engine import shutdown_engines
+from core.jobs import shutdown_job_manager
+from core.telemetry import CONTENT_TYPE_LATEST, TelemetryMiddleware, metrics_available, render_metrics
+from core.watcher import watch_from_env, stop_all
+from ml.batching import shutdown_generation_batcher
+from ml.doc_cache import close_docstring_cache
 
-app = FastAPI(title="CodeWhisper API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Project roots listed in CODEWHISPER_WATCH are indexed and watched for the lifetime of the server;
+    # indexing runs in the background so startup is not blocked by the initial scans
+    threading.Thread(target=watch_from_env, name="codewhisper-watch-init", daemon=True).start()
+    # Load and warm up the model in the background; /ready reports when it is done
+    try:
+        from ml.inference import start_preload
+    except ImportError as e:
+        print(f"Model preload skipped: {e}")
+    else:
+        start_preload()
+    yield
+    shutdown_job_manager()
+    shutdown_generation_batcher()
+    close_docstring_cache()
+    stop_all()
+    shutdown_engines()
+
+app = FastAPI(title="CodeWhisper API", version="0.1.0", lifespan=lifespan)
+app.add_middleware(TelemetryMiddleware)
 
 app.include_router(analysis.router, prefix="/api/v1", tags=["analysis"])
+app.include_router(watch.router, prefix="/api/v1", tags=["watch"])
+app.include_router(jobs.router, prefix="/api/v1", tags=["jobs"])
 
 @app.get("/")
 def read_root():
@@ -15,6 +45,22 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check():
+    """200 once the model is loaded and warmed up; 503 while loading or after a failed load."""
+    try:
+        from ml.inference import model_status
+    except ImportError as e:
+        return JSONResponse({"status": "failed", "error": str(e)}, status_code=503)
+    status = model_status()
+    return JSONResponse(status, status_code=200 if status["status"] == "ready" else 503)
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    if not metrics_available():
+        return Response("prometheus_client is not installed\n", status_code=501, media_type="text/plain")
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     return FileResponse("favicon.ico") if os.path.exists("favicon.ico") else {"message": "No favicon"}
@@ -4,49 +4,44 @@ import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
 from typing import List, Dict, Any
+import sys
+import os
+
+# Add parent directory to path to import core modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.columnar import load_results
 
 def detect_anomalies(metrics_file: str, output_file: str, contamination: float = 0.1):
+    """
+    `metrics_file` may be an analyzer JSON file or a columnar store directory
+    (python -m core.analyzer ... --format columnar).
+    """
     try:
-        with open(metrics_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        store = load_results(metrics_file)
     except FileNotFoundError:
         print(f"Error: Metrics file '{metrics_file}' not found.")
         return
 
-    if not data:
+    if len(store.files) == 0:
         print("No data to analyze.")
         return
 
     # Prepare features
     # Features: LOC, SLOC, Maintainability Index, Avg Function Complexity
-    features = []
-    valid_indices = []
-
-    for i, item in enumerate(data):
-        # Calculate average function complexity
-        funcs = item.get('functions', [])
-        if funcs:
-            avg_complexity = sum(f.get('cyclomatic_complexity', 0) for f in funcs) / len(funcs)
-        else:
-            avg_complexity = 0
-            
-        # We want to detect high complexity and low maintainability.
-        # Isolation Forest detects "rare" points. 
-        # High complexity/LOC and low MI are rare in good codebases (hopefully).
-        
-        loc = item.get('loc', 0)
-        sloc = item.get('sloc', 0)
-        mi = item.get('maintainability_index', 100) # Default to 100 if missing
-        
-        # Skip empty files or files with 0 LOC if desired, but here we include them
-        features.append([loc, sloc, mi, avg_complexity])
-        valid_indices.append(i)
-
-    if not features:
-        print("No valid features extracted.")
-        return
-
-    X = np.array(features)
+    # We want to detect high complexity and low maintainability.
+    # Isolation Forest detects "rare" points. 
+    # High complexity/LOC and low MI are rare in good codebases (hopefully).
+    file_features = store.file_features()
+    mi = np.nan_to_num(file_features['maintainability_index'], nan=100.0) # Default to 100 if missing
+    X = np.column_stack([
+        file_features['loc'],
+        file_features['sloc'],
+        mi,
+        file_features['avg_complexity'],
+    ]).astype(np.float64)
+    features = X
+    file_paths = store.files['file_path']
     
     # Standardize features
     scaler = StandardScaler()
@@ -61,29 +56,33 @@ def detect_anomalies(metrics_file: str, output_file: str, contamination: float =
     
     print(f"Analyzed {len(X)} files. Found {list(preds).count(-1)} anomalies.")
 
-    for idx, pred in zip(valid_indices, preds):
-        if pred == -1:
-            item = data[idx]
-            # Determine why it's anomalous (simple heuristic for display)
-            # High complexity or Low MI?
-            reasons = []
-            if features[idx][0] > np.mean(X[:, 0]) + np.std(X[:, 0]):
-                reasons.append("High LOC")
-            if features[idx][2] < np.mean(X[:, 2]) - np.std(X[:, 2]):
-                reasons.append("Low Maintainability")
-            if features[idx][3] > np.mean(X[:, 3]) + np.std(X[:, 3]):
-                reasons.append("High Avg Complexity")
-                
-            anomalies.append({
-                "file_path": item['file_path'],
-                "metrics": {
-                    "loc": features[idx][0],
-                    "sloc": features[idx][1],
-                    "maintainability_index": features[idx][2],
-                    "avg_complexity": features[idx][3]
-                },
-                "reasons": reasons
-            })
+    # Determine why each point is anomalous (simple heuristic for display)
+    # High complexity or Low MI? Thresholds are computed once for all files.
+    means = X.mean(axis=0)
+    stds = X.std(axis=0)
+    high_loc = X[:, 0] > means[0] + stds[0]
+    low_mi = X[:, 2] < means[2] - stds[2]
+    high_complexity = X[:, 3] > means[3] + stds[3]
+
+    for idx in np.flatnonzero(preds == -1):
+        reasons = []
+        if high_loc[idx]:
+            reasons.append("High LOC")
+        if low_mi[idx]:
+            reasons.append("Low Maintainability")
+        if high_complexity[idx]:
+            reasons.append("High Avg Complexity")
+            
+        anomalies.append({
+            "file_path": str(file_paths[idx]),
+            "metrics": {
+                "loc": float(features[idx][0]),
+                "sloc": float(features[idx][1]),
+                "maintainability_index": float(features[idx][2]),
+                "avg_complexity": float(features[idx][3])
+            },
+            "reasons": reasons
+        })
 
     # Save results
     with open(output_file, 'w', encoding='utf-8') as f:
@@ -98,7 +97,7 @@ def detect_anomalies(metrics_file: str, output_file: str, contamination: float =
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Detect Code Anomalies")
-    parser.add_argument("--metrics_file", type=str, default="metrics_results.json", help="Input metrics JSON")
+    parser.add_argument("--metrics_file", type=str, default="metrics_results.json", help="Input metrics JSON or columnar store directory")
     parser.add_argument("--output", type=str, default="anomalies.json", help="Output JSON file")
     parser.add_argument("--contamination", type=float, default=0.1, help="Expected proportion of outliers")
     
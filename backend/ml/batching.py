@@ -0,0 +1,211 @@
+"""
+Dynamic micro-batching for model inference.
+
+Concurrent requests are queued; a single worker thread waits up to
+`max_wait` seconds after the oldest queued request arrived (or until
+`max_batch_size` requests are queued), then runs them as one batch and hands
+each caller its own result. One batch of N costs far less than N separate
+generate calls, so under load throughput grows with concurrency while the
+added latency is bounded by `max_wait`. An idle server still answers a lone
+request after at most `max_wait`.
+
+Requests are only batched with others that share the same key (e.g. the
+same decoding settings and adapter), since one generate call takes one set of
+parameters.
+
+The batcher is also the admission point for inference: its queue is bounded
+(submit raises QueueFullError when it is full), requests carry a deadline
+after which they are dropped instead of computed, and a caller that stops
+waiting (a timeout or a disconnected client) cancels its request. All model
+work runs on the batcher's own thread, never on the event loop.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Deque, Hashable, List, Optional, Tuple
+
+from core.jobs import QueueFullError
+from core.telemetry import register_queue, stage
+
+DEFAULT_MAX_BATCH_SIZE = int(os.environ.get("CODEWHISPER_BATCH_MAX_SIZE", "8"))
+DEFAULT_MAX_WAIT = float(os.environ.get("CODEWHISPER_BATCH_MAX_WAIT_MS", "10")) / 1000
+DEFAULT_MAX_QUEUED = int(os.environ.get("CODEWHISPER_GENERATE_QUEUE", "64"))
+# How often a waiting request checks whether its client is still there
+DISCONNECT_POLL_INTERVAL = 0.25
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+class MicroBatcher:
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT, key: Optional[Callable[[Any], Hashable]] = None,
+                 name: str = "batch", max_queued: int = DEFAULT_MAX_QUEUED):
+        """
+        `batch_fn` maps a list of items to a list of results of the same
+        length and order. `key` groups items that may share a batch.
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.key = key or (lambda item: None)
+        self.max_queued = max_queued
+        self.name = name
+        self.batches = 0
+        self.items = 0
+
+        # (arrival time, item, future, deadline or None), all times monotonic
+        self._queue: Deque[Tuple[float, Any, Future, Optional[float]]] = deque()
+        self._cond = threading.Condition()
+        self._stop = False
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def submit(self, item: Any, timeout: Optional[float] = None) -> Future:
+        """
+        Queue `item`. If it has not started `timeout` seconds from now it is
+        dropped and its future fails with TimeoutError.
+        """
+        future = Future()
+        now = time.monotonic()
+        with self._cond:
+            if self._stop:
+                raise RuntimeError(f"{self.name} batcher is shut down")
+            if self.max_queued and len(self._queue) >= self.max_queued:
+                raise QueueFullError(f"{len(self._queue)} {self.name} requests already queued")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name=f"codewhisper-{self.name}", daemon=True)
+                self._thread.start()
+            self._queue.append((now, item, future, now + timeout if timeout is not None else None))
+            self._cond.notify()
+        return future
+
+    async def submit_async(self, item: Any, timeout: Optional[float] = None,
+                           disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        return await self.wait(self.submit(item, timeout), timeout, disconnected)
+
+    async def wait(self, future: Future, timeout: Optional[float] = None,
+                   disconnected: Optional[Callable[[], Awaitable[bool]]] = None) -> Any:
+        """
+        Wait for a submitted request without blocking the event loop. Raises
+        TimeoutError after `timeout` seconds, or ClientDisconnected as soon
+        as `disconnected()` returns True; either way the request is cancelled
+        if it has not started yet.
+        """
+        waiter = asyncio.wrap_future(future)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        try:
+            while True:
+                wait = DISCONNECT_POLL_INTERVAL if disconnected is not None else None
+                if deadline is not None:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        raise TimeoutError(f"{self.name} request did not finish within {timeout:g}s")
+                    wait = remaining if wait is None else min(wait, remaining)
+                done, _ = await asyncio.wait({waiter}, timeout=wait)
+                if done:
+                    return waiter.result()
+                if disconnected is not None and await disconnected():
+                    raise ClientDisconnected()
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+
+    def shutdown(self):
+        """Stop accepting work; already queued requests are still served."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stop:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                # The wait is measured from the oldest request's arrival
+                deadline = self._queue[0][0] + self.max_wait
+                while len(self._queue) < self.max_batch_size and not self._stop:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = [self._queue.popleft() for _ in range(min(len(self._queue), self.max_batch_size))]
+            self._run(batch)
+
+    def _run(self, batch: List[Tuple[float, Any, Future, Optional[float]]]):
+        groups = {}
+        now = time.monotonic()
+        for _, item, future, deadline in batch:
+            # Callers that gave up (e.g. a cancelled request) are not computed
+            if not future.set_running_or_notify_cancel():
+                continue
+            if deadline is not None and now > deadline:
+                future.set_exception(TimeoutError(f"{self.name} request expired in the queue"))
+                continue
+            groups.setdefault(self.key(item), []).append((item, future))
+        for group in groups.values():
+            items = [item for item, _ in group]
+            try:
+                with stage(f"{self.name}_batch"):
+                    results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in group:
+                    future.set_exception(e)
+                continue
+            if len(results) != len(items):
+                # Pairing results with requests would leave some requests waiting forever
+                error = RuntimeError(f"Batch of {len(items)} {self.name} requests got {len(results)} results")
+                for _, future in group:
+                    future.set_exception(error)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(group, results):
+                future.set_result(result)
+
+
+_generation_batcher: Optional[MicroBatcher] = None
+_generation_lock = threading.Lock()
+
+
+def _generate_batch(items: List[Tuple[str, str, Any, str]]) -> List[str]:
+    from ml.inference import generate_docstrings
+    return generate_docstrings([code for code, _, _, _ in items], [language for _, language, _, _ in items],
+                               decoding=items[0][2], adapter=items[0][3])
+
+
+def get_generation_batcher() -> MicroBatcher:
+    """
+    Process-wide batcher for docstring generation; items are (code,
+    language, Decoding, adapter name), batched by decoding and adapter.
+    """
+    global _generation_batcher
+    with _generation_lock:
+        if _generation_batcher is None:
+            _generation_batcher = MicroBatcher(_generate_batch, key=lambda item: item[2:], name="generate")
+        return _generation_batcher
+
+
+def shutdown_generation_batcher():
+    global _generation_batcher
+    with _generation_lock:
+        batcher, _generation_batcher = _generation_batcher, None
+    if batcher is not None:
+        batcher.shutdown()
+
+
+register_queue("generate", lambda: _generation_batcher.pending if _generation_batcher is not None else 0)
@@ -0,0 +1,266 @@
+"""
+Cache for generated docstrings.
+
+Generating a docstring runs a beam search that takes from a few hundred
+milliseconds to seconds, and the same function is often documented again and
+again. Results are kept in an in-memory LRU and, unless caching is switched
+off (CODEWHISPER_CACHE=off), in a persistent SQLite store, keyed by the hash
+of the normalized code, the language, the generation parameters and the model
+version.
+
+Normalization removes what cannot change the meaning of the code: Python is
+compared by its AST (so whitespace, comments and formatting are ignored) and
+Java by its token stream. Code that does not parse is compared verbatim.
+
+Identical requests that arrive while one is already being generated share
+that computation (single-flight) instead of queueing another copy.
+"""
+import ast
+import hashlib
+import io
+import json
+import os
+import textwrap
+import threading
+import tokenize
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+
+import javalang
+
+from core.analyzer import LANGUAGE_ALIASES
+from core.cache import MetricsCache, cache_enabled
+from core.telemetry import record_cache_lookup
+
+DEFAULT_MAX_ENTRIES = int(os.environ.get("CODEWHISPER_DOC_CACHE_SIZE", "1024"))
+DEFAULT_DOC_CACHE_PATH = os.environ.get(
+    "CODEWHISPER_DOC_CACHE_PATH",
+    os.path.join(os.path.expanduser("~"), ".cache", "codewhisper", "docstrings.sqlite")
+)
+DEFAULT_DOC_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+
+def _python_tokens(code: str) -> str:
+    tokens = []
+    skip = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT, tokenize.DEDENT,
+            tokenize.ENDMARKER)
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type not in skip:
+            tokens.append(token.string)
+    return "\0".join(tokens)
+
+
+def normalize_code(code: str, language: str) -> str:
+    """
+    A canonical form of `code`: two snippets with the same canonical form
+    differ only in whitespace, comments or formatting.
+    """
+    language = language.lower()
+    if language == "python":
+        source = textwrap.dedent(code)
+        try:
+            return "ast:" + ast.dump(ast.parse(source))
+        except (SyntaxError, ValueError):
+            pass
+        # Fragments that are not a complete module (e.g. an unclosed block)
+        try:
+            return "tokens:" + _python_tokens(source)
+        except (tokenize.TokenError, IndentationError, SyntaxError):
+            pass
+    elif language == "java":
+        try:
+            # The tokenizer drops comments and whitespace
+            return "tokens:" + "\0".join(token.value for token in javalang.tokenizer.tokenize(code))
+        except (javalang.tokenizer.LexerError, TypeError):
+            pass
+    return "raw:" + code
+
+
+class _Flight:
+    """One generation in progress and the number of callers waiting for it."""
+
+    def __init__(self, future: Future):
+        self.future = future
+        self.waiters = 0
+
+
+class DocstringCache:
+    def __init__(self, version: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 persistent: Optional[MetricsCache] = None):
+        """
+        `version` identifies the model and decoding settings; entries made
+        under another version are never returned.
+        """
+        self.version = version
+        self.max_entries = max_entries
+        self.persistent = persistent
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._inflight: Dict[str, _Flight] = {}
+        # Reentrant: cancelling a flight runs its callbacks, which take it again
+        self._lock = threading.RLock()
+
+    def make_key(self, code: str, language: str, **params: Any) -> str:
+        # "py" and "python" generate the same docstring
+        language = LANGUAGE_ALIASES.get(language.lower(), language.lower())
+        digest = hashlib.sha256()
+        for part in (self.version, language, json.dumps(params, sort_keys=True),
+                     normalize_code(code, language)):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            docstring = self._entries.get(key)
+            if docstring is not None:
+                self._entries.move_to_end(key)
+                return docstring
+        if self.persistent is not None:
+            stored = self.persistent.get(key)
+            if stored is not None:
+                self._remember(key, stored["docstring"])
+                return stored["docstring"]
+        return None
+
+    def put(self, key: str, docstring: str):
+        self._remember(key, docstring)
+        if self.persistent is not None:
+            self.persistent.put(key, {"docstring": docstring})
+            # Writes are rare next to generation time; make each one durable
+            self.persistent.flush()
+
+    def _remember(self, key: str, docstring: str):
+        with self._lock:
+            self._entries[key] = docstring
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def submit(self, key: str, start: Callable[[], Future]) -> Future:
+        """
+        A future for the docstring under `key`: already resolved on a cache
+        hit, otherwise tied to the generation in flight for the same key,
+        which is begun with `start()` if there is none (exceptions from
+        `start`, such as QueueFullError, propagate). Cancelling the returned
+        future detaches this caller; the generation itself is cancelled once
+        no caller is left waiting for it.
+        """
+        docstring = self.get(key)
+        started = None
+        with self._lock:
+            flight = self._inflight.get(key)
+            hit = docstring is not None or flight is not None
+            if not hit:
+                flight = started = _Flight(start())
+                self._inflight[key] = flight
+            elif docstring is None:
+                self.coalesced += 1
+            if docstring is None:
+                flight.waiters += 1
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        record_cache_lookup("docstring", hit)
+        if started is not None:
+            # Outside the lock: the callback takes it, and may run right away
+            started.future.add_done_callback(lambda future: self._finish(key, future))
+
+        waiter = Future()
+        if docstring is not None:
+            waiter.set_result(docstring)
+            return waiter
+
+        def deliver(future: Future):
+            if future.cancelled():
+                waiter.cancel()
+                return
+            # A waiter that was cancelled in the meantime is left alone
+            if not waiter.set_running_or_notify_cancel():
+                return
+            if future.exception() is not None:
+                waiter.set_exception(future.exception())
+            else:
+                waiter.set_result(future.result())
+
+        def detach(done: Future):
+            if not done.cancelled():
+                return
+            # Under the lock, so nobody can join a flight that is being cancelled
+            with self._lock:
+                flight.waiters -= 1
+                if flight.waiters == 0:
+                    # Only succeeds if generation has not started yet
+                    flight.future.cancel()
+
+        waiter.add_done_callback(detach)
+        flight.future.add_done_callback(deliver)
+        return waiter
+
+    def _finish(self, key: str, future: Future):
+        with self._lock:
+            self._inflight.pop(key, None)
+        # Failures are not cached; the next request tries again
+        if not future.cancelled() and future.exception() is None:
+            self.put(key, future.result())
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = len(self._entries)
+            in_flight = len(self._inflight)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "in_flight": in_flight,
+        }
+
+    def close(self):
+        if self.persistent is not None:
+            self.persistent.close()
+
+
+_doc_cache: Optional[DocstringCache] = None
+_doc_cache_lock = threading.Lock()
+
+
+def _open_persistent() -> Optional[MetricsCache]:
+    if not cache_enabled():
+        return None
+    try:
+        # Used as a plain key-value store: DocstringCache makes its own keys
+        return MetricsCache(DEFAULT_DOC_CACHE_PATH, max_bytes=DEFAULT_DOC_CACHE_MAX_BYTES, name="docstring_disk")
+    except Exception as e:
+        print(f"Docstring cache unavailable on disk: {e}")
+        return None
+
+
+def get_docstring_cache() -> DocstringCache:
+    """Process-wide docstring cache for the current model and decoding settings."""
+    global _doc_cache
+    from ml.inference import GENERATION_KWARGS, model_version
+
+    version = f"{model_version()}|{json.dumps(GENERATION_KWARGS, sort_keys=True)}"
+    with _doc_cache_lock:
+        if _doc_cache is None:
+            _doc_cache = DocstringCache(version, persistent=_open_persistent())
+        elif _doc_cache.version != version:
+            # Retrained model: start a fresh LRU. Stored entries carry their
+            # version in the key, so the same store can be kept.
+            _doc_cache = DocstringCache(version, persistent=_doc_cache.persistent)
+        return _doc_cache
+
+
+def close_docstring_cache():
+    global _doc_cache
+    with _doc_cache_lock:
+        cache, _doc_cache = _doc_cache, None
+    if cache is not None:
+        cache.close()
@@ -6,6 +6,8 @@ from peft import PeftModel, PeftConfig
 import evaluate
 from tqdm import tqdm
 import os
+import statistics
+import time
 
 def evaluate_model(
     test_file: str,
@@ -92,12 +94,142 @@ def evaluate_model(
         json.dump(results, f, indent=2)
     print("Detailed results saved to evaluation_results.json")
 
+def compare_backends(
+    test_file: str,
+    backends: list,
+    batch_size: int = 4,
+    limit: int = 200,
+    output_file: str = "backend_comparison.json"
+):
+    """
+    Latency and BLEU of the serving backends (see ml/inference.py) on the
+    same examples, with the fixed 4-beam decoding. Each entry
+    of `backends` is a backend name, optionally followed by `=<model dir>`
+    (e.g. onnxruntime=models/codet5-onnx-int8 or mmap=models/codet5-merged).
+    """
+    from ml.inference import generate_with, load_backend
+
+    with open(test_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)[:limit]
+    references = [item['docstring'] for item in data]
+    bleu = evaluate.load("bleu")
+
+    rows = []
+    for spec in backends:
+        backend, _, path = spec.partition("=")
+        model, tokenizer, device = load_backend(backend, path or None)
+
+        # One untimed batch so lazy initialization is not counted
+        generate_with(model, tokenizer, device, [data[0]['code']], [data[0]['language']])
+
+        generated_docs = []
+        batch_times = []
+        for i in tqdm(range(0, len(data), batch_size), desc=spec):
+            batch = data[i:i+batch_size]
+            start = time.perf_counter()
+            generated_docs.extend(generate_with(model, tokenizer, device,
+                                                [item['code'] for item in batch],
+                                                [item['language'] for item in batch]))
+            batch_times.append(time.perf_counter() - start)
+
+        batch_times.sort()
+        rows.append({
+            "backend": spec,
+            "examples": len(data),
+            "ms_per_example": sum(batch_times) / len(data) * 1000,
+            "p50_batch_ms": statistics.median(batch_times) * 1000,
+            "p95_batch_ms": batch_times[min(len(batch_times) - 1, int(len(batch_times) * 0.95))] * 1000,
+            "bleu": bleu.compute(predictions=generated_docs, references=references)['bleu'],
+        })
+        del model
+
+    print(f"\n{'backend':<40}{'ms/example':>12}{'p50 batch':>11}{'p95 batch':>11}{'BLEU':>8}")
+    for row in rows:
+        print(f"{row['backend']:<40}{row['ms_per_example']:>12.1f}{row['p50_batch_ms']:>11.0f}"
+              f"{row['p95_batch_ms']:>11.0f}{row['bleu']:>8.4f}")
+
+    with open(output_file, "w", encoding='utf-8') as f:
+        json.dump({"batch_size": batch_size, "results": rows}, f, indent=2)
+    print(f"Comparison saved to {output_file}")
+
+def compare_policies(
+    test_file: str,
+    latency_budgets: list,
+    limit: int = 200,
+    output_file: str = "policy_comparison.json"
+):
+    """
+    Quality against latency for each decoding policy (see ml/decoding.py):
+    the fixed 4-beam settings, greedy, adaptive, and adaptive under each
+    latency budget in milliseconds. Requests are generated one at a time, as
+    an interactive user sends them, on the configured backend.
+    """
+    from ml.decoding import choose_decoding
+    from ml.inference import generate_with, load_backend, token_lengths
+
+    with open(test_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)[:limit]
+    references = [item['docstring'] for item in data]
+    bleu = evaluate.load("bleu")
+    rouge = evaluate.load("rouge")
+
+    model, tokenizer, device = load_backend()
+    lengths = token_lengths([item['code'] for item in data], [item['language'] for item in data], tokenizer)
+    policies = [("beam", "beam", None), ("greedy", "greedy", None), ("adaptive", "adaptive", None)]
+    policies += [(f"adaptive@{budget:g}ms", "adaptive", budget) for budget in latency_budgets]
+
+    # One untimed generation so lazy initialization is not counted
+    generate_with(model, tokenizer, device, [data[0]['code']], [data[0]['language']])
+
+    rows = []
+    for name, policy, budget in policies:
+        generated_docs = []
+        latencies = []
+        beams_used = []
+        for item, length in tqdm(list(zip(data, lengths)), desc=name):
+            decoding = choose_decoding(length, budget, policy)
+            beams_used.append(decoding.num_beams)
+            start = time.perf_counter()
+            generated_docs.extend(generate_with(model, tokenizer, device, [item['code']], [item['language']], decoding))
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        rouge_score = rouge.compute(predictions=generated_docs, references=references)
+        rows.append({
+            "policy": name,
+            "examples": len(data),
+            "bleu": bleu.compute(predictions=generated_docs, references=references)['bleu'],
+            "rouge1": rouge_score['rouge1'],
+            "rougeL": rouge_score['rougeL'],
+            "p50_ms": statistics.median(latencies) * 1000,
+            "p95_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000,
+            "mean_beams": sum(beams_used) / len(beams_used),
+        })
+
+    print(f"\n{'policy':<22}{'BLEU':>8}{'ROUGE-1':>9}{'ROUGE-L':>9}{'p50 ms':>9}{'p95 ms':>9}{'beams':>7}")
+    for row in rows:
+        print(f"{row['policy']:<22}{row['bleu']:>8.4f}{row['rouge1']:>9.4f}{row['rougeL']:>9.4f}"
+              f"{row['p50_ms']:>9.0f}{row['p95_ms']:>9.0f}{row['mean_beams']:>7.1f}")
+
+    with open(output_file, "w", encoding='utf-8') as f:
+        json.dump({"results": rows}, f, indent=2)
+    print(f"Comparison saved to {output_file}")
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Evaluate Docstring Generation")
     parser.add_argument("--test_file", type=str, required=True, help="Path to test data (JSON)")
     parser.add_argument("--model_path", type=str, default="Salesforce/codet5-small", help="Path to model or checkpoint")
     parser.add_argument("--batch_size", type=int, default=4, help="Batch size")
+    parser.add_argument("--compare_backends", type=str, help="Compare serving backends instead, e.g. torch,onnxruntime,onnxruntime=models/codet5-onnx-int8")
+    parser.add_argument("--compare_policies", action="store_true", help="Compare decoding policies instead (quality vs latency)")
+    parser.add_argument("--latency_budgets", type=str, default="100,250,500", help="Comma-separated budgets in ms for --compare_policies")
+    parser.add_argument("--limit", type=int, default=200, help="Examples used for --compare_backends and --compare_policies")
     
     args = parser.parse_args()
     
-    evaluate_model(args.test_file, args.model_path, args.batch_size)
+    if args.compare_policies:
+        compare_policies(args.test_file, [float(b) for b in args.latency_budgets.split(",") if b], args.limit)
+    elif args.compare_backends:
+        compare_backends(args.test_file, args.compare_backends.split(","), args.batch_size, args.limit)
+    else:
+        evaluate_model(args.test_file, args.model_path, args.batch_size)
@@ -0,0 +1,36 @@
+"""
+Export the fine-tuned model for the mmap inference backend.
+
+The LoRA adapter in models/codet5-finetuned is merged into the base weights
+and saved as a single safetensors checkpoint with its tokenizer. With
+CODEWHISPER_INFERENCE_BACKEND=mmap every server worker memory-maps that
+file instead of loading its own copy of the weights, so running more
+workers costs little more memory than running one.
+
+Usage (from backend/):
+    python -m ml.export_merged [--output_dir models/codet5-merged]
+
+Serve the result with CODEWHISPER_INFERENCE_BACKEND=mmap (and
+CODEWHISPER_MERGED_PATH pointing at it, if not the default).
+"""
+import argparse
+
+from ml.export_onnx import merge_adapter
+from ml.inference import MERGED_PATH, MODEL_PATH, load_mmap_model
+
+
+def export(adapter_path: str = MODEL_PATH, output_dir: str = MERGED_PATH):
+    merge_adapter(adapter_path, output_dir)
+    # Fails now rather than at server startup if the checkpoint cannot be mapped
+    load_mmap_model(output_dir)
+    print(f"Merged model saved to {output_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter for memory-mapped serving")
+    parser.add_argument("--adapter_path", type=str, default=MODEL_PATH, help="Fine-tuned LoRA adapter directory")
+    parser.add_argument("--output_dir", type=str, default=MERGED_PATH, help="Where to write the merged model")
+
+    args = parser.parse_args()
+
+    export(args.adapter_path, args.output_dir)
@@ -0,0 +1,83 @@
+"""
+Export the fine-tuned model for the onnxruntime inference backend.
+
+The LoRA adapter in models/codet5-finetuned is merged into the base weights,
+so inference no longer pays for the adapter on every forward pass, and the
+merged model is exported to ONNX as separate encoder, decoder and
+decoder-with-past graphs (the last one reuses the attention cache between
+decoding steps). With --quantize an int8 dynamically quantized copy is
+written as well.
+
+Usage (from backend/):
+    python -m ml.export_onnx [--output_dir models/codet5-onnx] [--quantize]
+
+Serve the result with CODEWHISPER_INFERENCE_BACKEND=onnxruntime (and
+CODEWHISPER_ONNX_PATH pointing at the quantized copy, if wanted).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+from peft import PeftModel
+from transformers import AutoModelForSeq2SeqLM
+
+from ml.inference import MODEL_PATH, MODELS_DIR, base_model_source, load_tokenizer
+
+DEFAULT_OUTPUT_DIR = os.path.join(MODELS_DIR, "codet5-onnx")
+
+
+def merge_adapter(adapter_path: str, output_dir: str):
+    """Fold the LoRA adapter into the base model and save a plain checkpoint."""
+    print(f"Merging adapter {adapter_path} into {base_model_source()}...")
+    base_model = AutoModelForSeq2SeqLM.from_pretrained(base_model_source())
+    model = PeftModel.from_pretrained(base_model, adapter_path).merge_and_unload()
+    model.save_pretrained(output_dir)
+    load_tokenizer(adapter_path).save_pretrained(output_dir)
+
+
+def export_onnx(merged_dir: str, output_dir: str):
+    from optimum.exporters.onnx import main_export
+
+    print(f"Exporting ONNX graphs to {output_dir}...")
+    # no_post_process keeps decoder and decoder-with-past as separate graphs
+    main_export(merged_dir, output=output_dir, task="text2text-generation-with-past",
+                no_post_process=True)
+
+
+def quantize(onnx_dir: str, output_dir: str):
+    """Int8 dynamic quantization of every graph; other files are copied as they are."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in sorted(os.listdir(onnx_dir)):
+        source = os.path.join(onnx_dir, name)
+        target = os.path.join(output_dir, name)
+        if name.endswith(".onnx"):
+            print(f"Quantizing {name}...")
+            quantize_dynamic(source, target, weight_type=QuantType.QInt8)
+        elif os.path.isfile(source):
+            shutil.copy2(source, target)
+
+
+def export(adapter_path: str = MODEL_PATH, output_dir: str = DEFAULT_OUTPUT_DIR, int8: bool = False):
+    with tempfile.TemporaryDirectory(prefix="codewhisper-merged-") as merged_dir:
+        merge_adapter(adapter_path, merged_dir)
+        export_onnx(merged_dir, output_dir)
+    print(f"ONNX model saved to {output_dir}")
+
+    if int8:
+        quantized_dir = output_dir.rstrip("/\\") + "-int8"
+        quantize(output_dir, quantized_dir)
+        print(f"Quantized model saved to {quantized_dir}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the fine-tuned model to ONNX")
+    parser.add_argument("--adapter_path", type=str, default=MODEL_PATH, help="Fine-tuned LoRA adapter directory")
+    parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR, help="Where to write the ONNX model")
+    parser.add_argument("--quantize", action="store_true", help="Also write an int8 quantized copy to <output_dir>-int8")
+
+    args = parser.parse_args()
+
+    export(args.adapter_path, args.output_dir, args.quantize)
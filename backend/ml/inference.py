@@ -1,57 +1,331 @@
 """
 Inference module for the fine-tuned CodeT5 model.
 Loads the LoRA adapter and generates documentation.
+
+Three backends are available, chosen with $CODEWHISPER_INFERENCE_BACKEND:
+"torch" (default) runs the base model with the PEFT adapter, "mmap" runs the
+merged model written by ml/export_merged.py from $CODEWHISPER_MERGED_PATH
+with its weights memory-mapped, so that every worker process of a server
+shares one copy of them (see load_mmap_model), and "onnxruntime" runs the
+merged model exported by ml/export_onnx.py from $CODEWHISPER_ONNX_PATH
+(optionally int8-quantized), which is faster on CPU.
+
+The torch backend can serve several LoRA adapters on one copy of the base
+model: the fine-tuned model is the "default" adapter, and more are listed in
+$CODEWHISPER_ADAPTERS as `name=path` pairs (e.g. per language, or per team
+style guide). Each request picks one (resolve_adapter); switching between
+them changes which adapter weights the layers apply, nothing is reloaded.
+
+Models are only ever read from disk: the base model comes from
+$CODEWHISPER_BASE_MODEL_PATH (models/codet5-small) or, failing that, the
+local Hugging Face cache, so a replica without network access starts the
+same way as one with it. The server loads and warms up the model in the
+background at startup (preload_model); model_status() reports progress for
+the /ready endpoint.
 """
+import glob
+import hashlib
+import json
 import os
+import struct
+import threading
+import time
 import torch
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from transformers import AutoConfig, AutoModelForSeq2SeqLM, AutoTokenizer
 from peft import PeftModel
 
+from core.telemetry import stage
+from ml.decoding import Decoding, observe
+from ml.templates import template_docstring
+
 # Global model and tokenizer (loaded once)
 _model = None
 _tokenizer = None
 _device = None
+_load_lock = threading.Lock()
+# Held while a model with several adapters generates: the active adapter is model state
+_adapter_lock = threading.Lock()
+
+# Readiness: "not_loaded", "loading", "ready" or "failed"
+_status = "not_loaded"
+_status_error: Optional[str] = None
+_load_seconds: Optional[float] = None
+_warmup_seconds: Optional[float] = None
+# Adapter name -> MB of adapter weights, once loaded
+_adapter_sizes: Dict[str, float] = {}
+# model_version() of the loaded model, fixed when it is loaded
+_loaded_version: Optional[str] = None
 
-MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "codet5-finetuned")
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+MODEL_PATH = os.path.join(MODELS_DIR, "codet5-finetuned")
 BASE_MODEL = "Salesforce/codet5-small"
+BASE_MODEL_PATH = os.environ.get("CODEWHISPER_BASE_MODEL_PATH", os.path.join(MODELS_DIR, "codet5-small"))
+
+BACKENDS = ("torch", "mmap", "onnxruntime")
+BACKEND = os.environ.get("CODEWHISPER_INFERENCE_BACKEND", "torch").lower()
+ONNX_PATH = os.environ.get("CODEWHISPER_ONNX_PATH", os.path.join(MODELS_DIR, "codet5-onnx"))
+MERGED_PATH = os.environ.get("CODEWHISPER_MERGED_PATH", os.path.join(MODELS_DIR, "codet5-merged"))
+
+DEFAULT_ADAPTER = "default"
+
+# safetensors dtype names
+_SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+# Decoding settings shared by every generate call; the beam count and output
+# budget come from the decoding policy (ml/decoding.py)
+GENERATION_KWARGS = {"no_repeat_ngram_size": 2}
+
+# Streaming cannot use beam search (the best beam is only known at the end),
+# so streamed generations decode greedily or by sampling
+STREAM_MODES = {
+    "greedy": {"num_beams": 1, "do_sample": False, "no_repeat_ngram_size": 2},
+    "sample": {"num_beams": 1, "do_sample": True, "top_p": 0.95, "temperature": 0.8, "no_repeat_ngram_size": 2},
+}
+
+WARMUP_CODE = "def add(a, b):\n    return a + b\n"
+
+def _parse_adapters(setting: str) -> Dict[str, str]:
+    """Adapter name -> directory from `name=path,...`; the fine-tuned model is always "default"."""
+    adapters = {DEFAULT_ADAPTER: MODEL_PATH}
+    for entry in setting.split(","):
+        if not entry.strip():
+            continue
+        name, sep, path = entry.partition("=")
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"CODEWHISPER_ADAPTERS entries must be name=path, got {entry!r}")
+        adapters[name.strip().lower()] = path.strip()
+    return adapters
+
+ADAPTERS = _parse_adapters(os.environ.get("CODEWHISPER_ADAPTERS", ""))
+
+def base_model_source() -> str:
+    """Local directory of the base model if present, else its name (resolved from the local cache only)."""
+    return BASE_MODEL_PATH if os.path.isdir(BASE_MODEL_PATH) else BASE_MODEL
+
+def load_tokenizer(path: str = MODEL_PATH):
+    """Tokenizer saved next to the model, or the base model's if there is none."""
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(path, local_files_only=True)
+        print("Loaded tokenizer from local model directory")
+    except (OSError, ValueError):
+        tokenizer = AutoTokenizer.from_pretrained(base_model_source(), local_files_only=True)
+        print("Loaded tokenizer from base model")
+    return tokenizer
+
+def mmap_safetensors(path: str) -> Dict[str, torch.Tensor]:
+    """
+    The tensors of a safetensors file as views of one private, read-only
+    memory mapping of it: nothing is copied, and pages are read from the OS
+    page cache on first use, so every process mapping the same file shares
+    the same physical memory.
+    """
+    with open(path, "rb") as f:
+        header_size = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_size))
+    data_start = 8 + header_size
+    # shared=False maps the file copy-on-write; inference never writes to it
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = _SAFETENSORS_DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        itemsize = torch.empty(0, dtype=dtype).element_size()
+        if (data_start + begin) % itemsize:
+            raise ValueError(f"{path}: tensor {name} is not aligned for memory mapping")
+        tensors[name] = torch.empty(0, dtype=dtype).set_(
+            storage, (data_start + begin) // itemsize, info["shape"])
+    return tensors
+
+def load_mmap_model(path: str = MERGED_PATH):
+    """
+    The merged model in `path` with its parameters memory-mapped from the
+    safetensors checkpoint instead of loaded into process memory. The
+    module structure is created on the meta device, so no weights are
+    allocated only to be replaced.
+    """
+    config = AutoConfig.from_pretrained(path, local_files_only=True)
+    with torch.device("meta"):
+        model = AutoModelForSeq2SeqLM.from_config(config)
+    files = sorted(glob.glob(os.path.join(path, "*.safetensors")))
+    if not files:
+        raise FileNotFoundError(f"No safetensors checkpoint in {path}")
+    state_dict = {}
+    for file in files:
+        state_dict.update(mmap_safetensors(file))
+    # Tied weights (shared embeddings, LM head) are stored once
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+    missing = [name for name, tensor in list(model.named_parameters()) + list(model.named_buffers())
+               if tensor.is_meta]
+    if missing:
+        raise RuntimeError(f"{path} is missing weights: {', '.join(missing[:5])}")
+    model.eval()
+    return model
+
+def load_backend(backend: str = BACKEND, path: Optional[str] = None) -> Tuple[object, object, str]:
+    """
+    Load a (model, tokenizer, device) triple for `backend` without touching
+    the process-wide model; used by load_model and for backend comparisons.
+    `path` overrides the exported model directory of the onnxruntime and
+    mmap backends.
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    path = path or _model_dir(backend)
+
+    if backend == "onnxruntime":
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        except ImportError:
+            raise RuntimeError("The onnxruntime backend needs optimum[onnxruntime] installed")
+        print(f"Loading ONNX model from {path}...")
+        model = ORTModelForSeq2SeqLM.from_pretrained(path, use_cache=True, provider="CPUExecutionProvider",
+                                                     local_files_only=True)
+        return model, load_tokenizer(path), "cpu"
+
+    if backend == "mmap":
+        # CPU only: moving the weights to a GPU would copy them per process
+        print(f"Memory-mapping merged model from {path}...")
+        return load_mmap_model(path), load_tokenizer(path), "cpu"
 
-def load_model():
-    """Load the fine-tuned model and tokenizer."""
-    global _model, _tokenizer, _device
-    
-    if _model is not None:
-        return _model, _tokenizer
-    
     print(f"Loading model from {MODEL_PATH}...")
-    
-    _device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {_device}")
-    
-    # Load base model
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Using device: {device}")
+
+    # Load base model; never from the network, so an offline start fails fast
     base_model = AutoModelForSeq2SeqLM.from_pretrained(
-        BASE_MODEL,
+        base_model_source(),
         trust_remote_code=True,
-        local_files_only=False  # Allow downloading base model if needed
+        local_files_only=True
     )
+
+    # Load LoRA adapters; they share the base model's weights
+    model = PeftModel.from_pretrained(base_model, MODEL_PATH, adapter_name=DEFAULT_ADAPTER)
+    for name, path in ADAPTERS.items():
+        if name != DEFAULT_ADAPTER:
+            print(f"Loading adapter {name} from {path}...")
+            model.load_adapter(path, adapter_name=name)
+    model = model.to(device)
+    model.eval()
+
+    # Tokenizer files are saved with the adapter
+    return model, load_tokenizer(MODEL_PATH), device
+
+def _adapter_size_mb(model, adapter: str) -> float:
+    """Memory taken by one adapter's weights (LoRA parameters are named `...lora_A.<adapter>.weight`)."""
+    return sum(param.numel() * param.element_size() for name, param in model.named_parameters()
+               if f".{adapter}." in name) / (1024 * 1024)
+
+def adapter_names() -> List[str]:
+    """Adapters requests can choose from; the exported backends only have the default (merged) one."""
+    return sorted(ADAPTERS) if BACKEND == "torch" else [DEFAULT_ADAPTER]
+
+def resolve_adapter(language: str, adapter: Optional[str] = None) -> str:
+    """
+    The adapter for a request: `adapter` if given (ValueError if unknown),
+    else the adapter named after the language if there is one, else the
+    default.
+    """
+    available = adapter_names()
+    if adapter is not None:
+        if adapter.lower() not in available:
+            raise ValueError(f"Unknown adapter {adapter!r}; available: {', '.join(available)}")
+        return adapter.lower()
+    return language.lower() if language.lower() in available else DEFAULT_ADAPTER
+
+@contextmanager
+def _using_adapter(model, adapter: Optional[str]):
+    """
+    Make `adapter` the model's active adapter for the duration of one
+    generate call. Models with a single adapter (or none) run unlocked.
+    """
+    adapters = getattr(model, "peft_config", None) or {DEFAULT_ADAPTER: None}
+    adapter = adapter or DEFAULT_ADAPTER
+    if adapter not in adapters:
+        raise ValueError(f"Adapter {adapter!r} is not loaded")
+    if len(adapters) == 1:
+        yield
+        return
+    with _adapter_lock:
+        if model.active_adapter != adapter:
+            model.set_adapter(adapter)
+        yield
+
+def load_model():
+    """Load the fine-tuned model and tokenizer for the configured backend."""
+    global _model, _tokenizer, _device, _loaded_version
     
-    # Load LoRA adapter
-    _model = PeftModel.from_pretrained(base_model, MODEL_PATH)
-    _model = _model.to(_device)
-    _model.eval()
-    
-    # Load tokenizer from local model directory (it has tokenizer files)
-    # Fall back to base model if local tokenizer not found
-    try:
-        _tokenizer = AutoTokenizer.from_pretrained(MODEL_PATH, local_files_only=True)
-        print("Loaded tokenizer from local model directory")
-    except:
-        _tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
-        print("Loaded tokenizer from base model")
+    if _model is not None:
+        return _model, _tokenizer
     
-    print("Model loaded successfully!")
+    # Requests arriving during the startup load wait for it instead of loading again
+    with _load_lock:
+        if _model is None:
+            with stage("model_load"):
+                model, _tokenizer, _device = load_backend(BACKEND)
+                for name in getattr(model, "peft_config", {}):
+                    _adapter_sizes[name] = _adapter_size_mb(model, name)
+                    print(f"Adapter {name}: {_adapter_sizes[name]:.2f} MB")
+                _loaded_version = _scan_model_version()
+                _model = model
+                print(f"Model loaded successfully ({BACKEND} backend)!")
     return _model, _tokenizer
 
-def generate_docstring(code: str, language: str = "python", max_length: int = 128) -> str:
+def preload_model():
+    """
+    Load the model and run one warm-up generation (the first generate call
+    pays for lazy initialization), updating model_status() as it goes.
+    """
+    global _status, _status_error, _load_seconds, _warmup_seconds
+    
+    _status = "loading"
+    try:
+        if not is_model_available():
+            raise FileNotFoundError(f"No trained model in {_model_dir()}")
+        start = time.perf_counter()
+        load_model()
+        _load_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        with stage("warmup"):
+            generate_docstrings([WARMUP_CODE], ["python"])
+        _warmup_seconds = time.perf_counter() - start
+    except Exception as e:
+        _status, _status_error = "failed", f"{type(e).__name__}: {e}"
+        print(f"Model preload failed: {_status_error}")
+        return
+    _status = "ready"
+    print(f"Model ready (load {_load_seconds:.1f}s, warm-up {_warmup_seconds:.1f}s)")
+
+def start_preload() -> threading.Thread:
+    """Run preload_model in a background thread so server startup is not blocked."""
+    global _status
+    _status = "loading"
+    thread = threading.Thread(target=preload_model, name="codewhisper-model-load", daemon=True)
+    thread.start()
+    return thread
+
+def model_status() -> Dict[str, Any]:
+    return {
+        "status": _status,
+        "backend": BACKEND,
+        "pid": os.getpid(),
+        "adapters": {name: round(size_mb, 2) for name, size_mb in sorted(_adapter_sizes.items())} or None,
+        "load_seconds": _load_seconds,
+        "warmup_seconds": _warmup_seconds,
+        "error": _status_error,
+    }
+
+def generate_docstring(code: str, language: str = "python", max_length: int = 128,
+                       decoding: Optional[Decoding] = None, use_templates: bool = True,
+                       adapter: Optional[str] = None) -> str:
     """
     Generate a docstring for the given code.
     
@@ -59,40 +333,174 @@ def generate_docstring(code: str, language: str = "python", max_length: int = 12
         code: The source code to document
         language: Programming language (python, java)
         max_length: Maximum length of generated docstring
+        decoding: Beam count and output budget (overrides max_length);
+            4 beams by default
+        use_templates: Answer trivial functions (see ml.templates)
+            without running the model
+        adapter: LoRA adapter to generate with (see resolve_adapter)
         
     Returns:
         Generated docstring
     """
+    if use_templates:
+        template = template_docstring(code, language)
+        if template is not None:
+            return template[1]
+    return generate_docstrings([code], [language], max_length, decoding,
+                               resolve_adapter(language, adapter))[0]
+
+def generate_docstrings(codes: List[str], languages: List[str], max_length: int = 128,
+                        decoding: Optional[Decoding] = None, adapter: Optional[str] = None) -> List[str]:
+    """
+    Generate docstrings for several snippets with one padded generate call,
+    all with the same adapter (default: DEFAULT_ADAPTER). Results are in
+    input order.
+    """
     model, tokenizer = load_model()
+    return generate_with(model, tokenizer, _device, codes, languages,
+                         decoding or Decoding(max_new_tokens=max_length), adapter)
+
+def generate_with(model, tokenizer, device: str, codes: List[str], languages: List[str],
+                  decoding: Decoding = Decoding(), adapter: Optional[str] = None) -> List[str]:
+    """generate_docstrings on an explicitly loaded backend (see load_backend)."""
+    input_texts = [_prompt(code, language) for code, language in zip(codes, languages)]
     
-    # Format input like training data
-    input_text = f"Generate a documentation string for this function:\n{language}: {code}"
-    
-    # Tokenize
-    inputs = tokenizer(
-        input_text,
-        max_length=512,
-        truncation=True,
-        padding="max_length",
-        return_tensors="pt"
-    ).to(_device)
+    # Tokenize; pad only to the longest input in the batch
+    with stage("tokenize"):
+        inputs = tokenizer(
+            input_texts,
+            max_length=512,
+            truncation=True,
+            padding=True,
+            return_tensors="pt"
+        ).to(device)
     
     # Generate
-    with torch.no_grad():
+    start = time.perf_counter()
+    with _using_adapter(model, adapter), stage("generate"), torch.no_grad():
         outputs = model.generate(
             input_ids=inputs["input_ids"],
             attention_mask=inputs["attention_mask"],
-            max_length=max_length,
-            num_beams=4,
-            early_stopping=True,
-            no_repeat_ngram_size=2
+            num_beams=decoding.num_beams,
+            max_new_tokens=decoding.max_new_tokens,
+            early_stopping=decoding.num_beams > 1,
+            **GENERATION_KWARGS
         )
+    # Keeps the policy's latency estimates current; the first output
+    # position is the decoder start token, not a step. Only single requests
+    # count: a batch's step time covers all of its rows and would overstate
+    # what one request costs
+    if len(codes) == 1:
+        observe(decoding, outputs.shape[1] - 1, time.perf_counter() - start)
     
     # Decode
-    docstring = tokenizer.decode(outputs[0], skip_special_tokens=True)
+    with stage("decode"):
+        docstrings = tokenizer.batch_decode(outputs, skip_special_tokens=True)
     
-    return docstring
+    return docstrings
+
+def token_lengths(codes: List[str], languages: List[str], tokenizer=None) -> List[int]:
+    """
+    Prompt length in tokens (after truncation) of each snippet, for grouping
+    similar lengths into batches. Uses the served model's tokenizer unless
+    one is given.
+    """
+    if tokenizer is None:
+        _, tokenizer = load_model()
+    prompts = [_prompt(code, language) for code, language in zip(codes, languages)]
+    return [len(ids) for ids in tokenizer(prompts, max_length=512, truncation=True)["input_ids"]]
+
+def stream_docstring(code: str, language: str = "python", max_length: int = 128,
+                     mode: str = "greedy", adapter: Optional[str] = None,
+                     decoding: Optional[Decoding] = None) -> Iterator[str]:
+    """
+    Yield the docstring in pieces as it is decoded, using one of
+    STREAM_MODES. Generation runs in its own thread and stops early if the
+    iterator is closed (e.g. the client went away). Only the output budget
+    of `decoding` applies; the mode sets the search.
+    """
+    decoding = decoding or Decoding(max_new_tokens=max_length)
+    from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+    model, tokenizer = load_model()
+    with stage("tokenize"):
+        inputs = tokenizer([_prompt(code, language)], max_length=512, truncation=True,
+                           return_tensors="pt").to(_device)
+
+    # skip_prompt drops the decoder start token
+    streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    stop = threading.Event()
+    errors = []
+
+    class _Stopped(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return stop.is_set()
+
+    def run():
+        try:
+            with _using_adapter(model, adapter), torch.no_grad():
+                model.generate(
+                    input_ids=inputs["input_ids"],
+                    attention_mask=inputs["attention_mask"],
+                    max_new_tokens=decoding.max_new_tokens,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([_Stopped()]),
+                    **STREAM_MODES[mode]
+                )
+        except Exception as e:
+            errors.append(e)
+            # Unblock the consumer; generate may have failed before ending the stream
+            streamer.end()
+
+    thread = threading.Thread(target=run, name="codewhisper-stream", daemon=True)
+    thread.start()
+    try:
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+
+def _prompt(code: str, language: str) -> str:
+    # Format input like training data
+    return f"Generate a documentation string for this function:\n{language}: {code}"
+
+def _model_dir(backend: str = BACKEND) -> str:
+    return {"onnxruntime": ONNX_PATH, "mmap": MERGED_PATH}.get(backend, MODEL_PATH)
+
+def model_version() -> str:
+    """
+    Identifies the model that generate_docstrings would use: the backend and
+    base model plus the name, size and mtime of every file in its model
+    directory and, for the torch backend, in every adapter's directory.
+    Computed once when the model is loaded (the loaded model does not change
+    with the files); until then the files are read on every call.
+    """
+    if _loaded_version is not None:
+        return _loaded_version
+    return _scan_model_version()
+
+def _scan_model_version() -> str:
+    digest = hashlib.sha256(f"{BACKEND}|{BASE_MODEL}".encode("utf-8"))
+    if is_model_available():
+        model_dirs = [("", _model_dir())]
+        if BACKEND == "torch":
+            model_dirs += [(f"\0adapter:{name}", ADAPTERS[name]) for name in adapter_names()
+                           if name != DEFAULT_ADAPTER]
+        for label, model_dir in model_dirs:
+            if not os.path.isdir(model_dir):
+                continue
+            digest.update(label.encode("utf-8"))
+            for name in sorted(os.listdir(model_dir)):
+                path = os.path.join(model_dir, name)
+                if os.path.isfile(path):
+                    st = os.stat(path)
+                    digest.update(f"\0{name}:{st.st_size}:{st.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:16]
 
 def is_model_available() -> bool:
-    """Check if the trained model is available."""
-    return os.path.exists(MODEL_PATH) and os.path.isdir(MODEL_PATH)
+    """Check if the trained model (or its merged or ONNX export) is available."""
+    return os.path.isdir(_model_dir())
@@ -5,56 +5,45 @@ import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 from typing import List, Dict, Any
+import sys
+import os
+
+# Add parent directory to path to import core modules
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from core.columnar import load_results
 
 def predict_maintainability(metrics_file: str, output_file: str):
     try:
-        with open(metrics_file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        store = load_results(metrics_file)
     except FileNotFoundError:
         print(f"Error: Metrics file '{metrics_file}' not found.")
         return
 
-    if not data:
+    if len(store.files) == 0:
         print("No data to analyze.")
         return
 
     # Prepare features and target
-    features = []
-    targets = []
-    file_paths = []
-
-    for item in data:
-        # Target: Maintainability Index
-        mi = item.get('maintainability_index', None)
-        if mi is None:
-            continue
-            
-        # Features: LOC, SLOC, Avg Complexity, Avg NLOC, Avg Token Count
-        loc = item.get('loc', 0)
-        sloc = item.get('sloc', 0)
-        
-        funcs = item.get('functions', [])
-        if funcs:
-            avg_complexity = sum(f.get('cyclomatic_complexity', 0) for f in funcs) / len(funcs)
-            avg_nloc = sum(f.get('nloc', 0) for f in funcs) / len(funcs)
-            avg_tokens = sum(f.get('token_count', 0) for f in funcs) / len(funcs)
-            num_funcs = len(funcs)
-        else:
-            avg_complexity = 0
-            avg_nloc = 0
-            avg_tokens = 0
-            num_funcs = 0
-            
-        features.append([loc, sloc, avg_complexity, avg_nloc, avg_tokens, num_funcs])
-        targets.append(mi)
-        file_paths.append(item['file_path'])
-
-    if not features:
+    # Target: Maintainability Index (files without one are skipped)
+    # Features: LOC, SLOC, Avg Complexity, Avg NLOC, Avg Token Count, Num Functions
+    file_features = store.file_features()
+    mi = file_features['maintainability_index']
+    mask = ~np.isnan(mi)
+    if not mask.any():
         print("No valid features extracted.")
         return
 
-    X = np.array(features)
-    y = np.array(targets)
+    X = np.column_stack([
+        file_features['loc'],
+        file_features['sloc'],
+        file_features['avg_complexity'],
+        file_features['avg_nloc'],
+        file_features['avg_tokens'],
+        file_features['n_functions'],
+    ]).astype(np.float64)[mask]
+    y = np.asarray(mi[mask], dtype=np.float64)
+    file_paths = store.files['file_path'][mask]
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
@@ -87,7 +76,7 @@ def predict_maintainability(metrics_file: str, output_file: str):
             status = "Better than expected"
             
         results.append({
-            "file_path": file_paths[i],
+            "file_path": str(file_paths[i]),
             "actual_mi": float(actual),
             "predicted_mi": float(pred),
             "difference": float(diff),
@@ -111,7 +100,7 @@ def predict_maintainability(metrics_file: str, output_file: str):
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Predict Maintainability Index")
-    parser.add_argument("--metrics_file", type=str, default="metrics_results.json", help="Input metrics JSON")
+    parser.add_argument("--metrics_file", type=str, default="metrics_results.json", help="Input metrics JSON or columnar store directory")
     parser.add_argument("--output", type=str, default="maintainability_predictions.json", help="Output JSON file")
     
     args = parser.parse_args()
@@ -0,0 +1,263 @@
+"""
+Template docstrings for trivial functions.
+
+Many functions sent for documentation have nothing for the model to explain:
+property getters and setters, constructors that only store their arguments,
+and one-line delegations. template_docstring recognizes these shapes in the
+syntax tree (ast for Python, javalang for Java) and returns a fixed-form
+docstring, so they never reach the model.
+
+The recognized kinds are listed in $CODEWHISPER_TEMPLATES (comma-separated,
+default all of getter, setter, init, delegate; "off" disables templates).
+"""
+import ast
+import os
+import re
+import textwrap
+from typing import List, Optional, Tuple
+
+import javalang
+
+KINDS = ("getter", "setter", "init", "delegate")
+
+
+def _enabled_kinds() -> Tuple[str, ...]:
+    setting = os.environ.get("CODEWHISPER_TEMPLATES", ",".join(KINDS)).lower()
+    if setting in ("0", "off", "false", "no", ""):
+        return ()
+    return tuple(kind.strip() for kind in setting.split(",") if kind.strip() in KINDS)
+
+
+ENABLED_KINDS = _enabled_kinds()
+# Trivial functions are short; longer code is not parsed at all
+MAX_LINES = 40
+
+
+def _words(name: str) -> str:
+    """`first_name` and `firstName` both become "first name"."""
+    name = re.sub(r"(?<=[a-z0-9])(?=[A-Z])", " ", name.strip("_"))
+    return name.replace("_", " ").lower() or name
+
+
+def _join(names: List[str], code: str = "`{}`") -> str:
+    quoted = [code.format(name) for name in names]
+    return quoted[0] if len(quoted) == 1 else ", ".join(quoted[:-1]) + " and " + quoted[-1]
+
+
+def template_docstring(code: str, language: str,
+                       kinds: Tuple[str, ...] = None) -> Optional[Tuple[str, str]]:
+    """
+    (kind, docstring) if `code` is a single trivial function of one of
+    `kinds` (default: ENABLED_KINDS), else None.
+    """
+    kinds = ENABLED_KINDS if kinds is None else kinds
+    if not kinds or code.count("\n") >= MAX_LINES:
+        return None
+    language = language.lower()
+    if language == "python":
+        match = _python_template(code)
+    elif language == "java":
+        match = _java_template(code)
+    else:
+        return None
+    if match is not None and match[0] in kinds:
+        return match
+    return None
+
+
+# --- Python ---
+
+def _self_attribute(node: ast.AST) -> Optional[str]:
+    if (isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name)
+            and node.value.id in ("self", "cls")):
+        return node.attr
+    return None
+
+
+def _body_statements(func: ast.AST) -> List[ast.stmt]:
+    body = list(func.body)
+    # An existing docstring or a bare `pass` does not make a function less trivial
+    if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+            and isinstance(body[0].value.value, str):
+        body = body[1:]
+    return [stmt for stmt in body if not isinstance(stmt, ast.Pass)]
+
+
+def _argument_names(call: ast.Call) -> Optional[List[str]]:
+    """The names passed to `call`, in order, or None if any argument is not a plain name."""
+    names = []
+    # `*args` and `**kwargs` unpack their contents, so they are not plain names either
+    for arg in call.args:
+        if not isinstance(arg, ast.Name):
+            return None
+        names.append(arg.id)
+    for keyword in call.keywords:
+        if keyword.arg is None or not isinstance(keyword.value, ast.Name):
+            return None
+        names.append(keyword.value.id)
+    return names
+
+
+def _passes_through(call: ast.AST, params: List[str]) -> bool:
+    """A call whose arguments are exactly the function's parameters, in order."""
+    return isinstance(call, ast.Call) and _argument_names(call) == params
+
+
+def _python_template(code: str) -> Optional[Tuple[str, str]]:
+    try:
+        tree = ast.parse(textwrap.dedent(code))
+    except (SyntaxError, ValueError):
+        return None
+    if len(tree.body) != 1 or not isinstance(tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return None
+    func = tree.body[0]
+    args = func.args
+    params = [a.arg for a in args.posonlyargs + args.args + args.kwonlyargs]
+    if args.vararg:
+        params.append(args.vararg.arg)
+    if args.kwarg:
+        params.append(args.kwarg.arg)
+    is_method = bool(params) and params[0] in ("self", "cls")
+    own_params = params[1:] if is_method else params
+    body = _body_statements(func)
+    if not body:
+        return None
+
+    if func.name == "__init__":
+        fields = []
+        stored = set()
+        for stmt in body:
+            if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1:
+                target = stmt.targets[0]
+            elif isinstance(stmt, ast.AnnAssign):
+                target = stmt.target
+            elif isinstance(stmt, ast.Expr) and isinstance(stmt.value, ast.Call) \
+                    and isinstance(stmt.value.func, ast.Attribute) and stmt.value.func.attr == "__init__":
+                # super().__init__(...), passing on some of the parameters
+                names = _argument_names(stmt.value)
+                if names is None or not set(names) <= set(own_params):
+                    return None
+                stored.update(names)
+                continue
+            else:
+                return None
+            value = stmt.value
+            if _self_attribute(target) is None or not (
+                    isinstance(value, ast.Constant) or (isinstance(value, ast.Name) and value.id in own_params)):
+                return None
+            fields.append(target.attr)
+            if isinstance(value, ast.Name):
+                stored.add(value.id)
+        # A parameter that is neither stored nor passed on is used some other way
+        if stored != set(own_params):
+            return None
+        if not fields:
+            return "init", "Initialize a new instance."
+        return "init", f"Initialize {_join(fields)}."
+
+    if len(body) != 1:
+        return None
+    stmt = body[0]
+
+    if isinstance(stmt, ast.Return) and not own_params and _self_attribute(stmt.value) is not None:
+        return "getter", f"Return the {_words(_self_attribute(stmt.value))}."
+
+    if isinstance(stmt, (ast.Assign, ast.AnnAssign)) and len(own_params) == 1:
+        target = stmt.targets[0] if isinstance(stmt, ast.Assign) and len(stmt.targets) == 1 else \
+            getattr(stmt, "target", None)
+        if _self_attribute(target) is not None and isinstance(stmt.value, ast.Name) \
+                and stmt.value.id == own_params[0]:
+            return "setter", f"Set the {_words(target.attr)} to `{own_params[0]}`."
+
+    call = stmt.value if isinstance(stmt, (ast.Return, ast.Expr)) else None
+    if call is not None and _passes_through(call, own_params):
+        callee = ast.unparse(call.func)
+        if callee != func.name:
+            verb = "Return the result of" if isinstance(stmt, ast.Return) else "Call"
+            return "delegate", f"{verb} `{callee}`."
+    return None
+
+
+# --- Java ---
+
+def _java_name(expression) -> Optional[str]:
+    """`x` alone: no qualifier, selectors or operators such as `-x` or `x++`."""
+    if isinstance(expression, javalang.tree.MemberReference) and not expression.qualifier \
+            and not expression.selectors and not expression.prefix_operators \
+            and not expression.postfix_operators:
+        return expression.member
+    return None
+
+
+def _java_field(expression) -> Optional[str]:
+    """`x` or `this.x`."""
+    name = _java_name(expression)
+    if name is not None:
+        return name
+    if isinstance(expression, javalang.tree.This) and not expression.prefix_operators \
+            and not expression.postfix_operators and expression.selectors \
+            and len(expression.selectors) == 1:
+        return _java_name(expression.selectors[0])
+    return None
+
+
+def _java_assignment(statement) -> Optional[Tuple[str, str]]:
+    """(field, value) for `this.field = value;` where value is a bare name."""
+    if not isinstance(statement, javalang.tree.StatementExpression):
+        return None
+    expression = statement.expression
+    if not isinstance(expression, javalang.tree.Assignment) or expression.type != "=":
+        return None
+    field = _java_field(expression.expressionl)
+    # `this.y` is a field, never a parameter
+    value = _java_name(expression.value)
+    if field is None or value is None:
+        return None
+    return field, value
+
+
+def _java_template(code: str) -> Optional[Tuple[str, str]]:
+    try:
+        # Snippets are single members; give them a class to parse in
+        tree = javalang.parse.parse("class __Snippet {\n" + code + "\n}")
+    except (javalang.parser.JavaSyntaxError, javalang.tokenizer.LexerError, TypeError, IndexError):
+        return None
+    members = [node for _, node in tree.filter(javalang.tree.MethodDeclaration)]
+    members += [node for _, node in tree.filter(javalang.tree.ConstructorDeclaration)]
+    if len(members) != 1 or members[0].body is None:
+        return None
+    member = members[0]
+    params = [p.name for p in member.parameters]
+    body = member.body
+
+    if isinstance(member, javalang.tree.ConstructorDeclaration):
+        assignments = [_java_assignment(statement) for statement in body]
+        if not body or any(a is None for a in assignments):
+            return None
+        # Every value is a parameter and every parameter is stored
+        if sorted(value for _, value in assignments) != sorted(params):
+            return None
+        fields = _join([field for field, _ in assignments], "{{@code {}}}")
+        return "init", f"Creates a new {member.name} with the given {fields}."
+
+    if len(body) != 1:
+        return None
+    statement = body[0]
+
+    if isinstance(statement, javalang.tree.ReturnStatement) and not params:
+        field = _java_field(statement.expression) if statement.expression is not None else None
+        if field is not None:
+            return "getter", f"Returns the {_words(field)}."
+
+    assignment = _java_assignment(statement)
+    if assignment is not None and [assignment[1]] == params:
+        return "setter", f"Sets the {_words(assignment[0])}."
+
+    expression = getattr(statement, "expression", None)
+    if isinstance(expression, javalang.tree.MethodInvocation) and not expression.selectors:
+        arguments = [_java_name(argument) for argument in expression.arguments]
+        callee = f"{expression.qualifier}.{expression.member}" if expression.qualifier else expression.member
+        if arguments == params and callee != member.name:
+            verb = "Returns the result of" if isinstance(statement, javalang.tree.ReturnStatement) else "Calls"
+            return "delegate", f"{verb} {{@code {callee}()}}."
+    return None
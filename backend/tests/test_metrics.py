@@ -0,0 +1,39 @@
+from core.metrics import analyze_complexity
+
+SOURCE = '''
+class Shape:
+    kind = "a" if True else "b"
+
+    def area(self, x):
+        if x:
+            return 1
+        return 0
+
+    def scale(self, x):
+        return x
+
+def free(x):
+    return x and x
+'''
+
+
+def test_class_entry_listed_with_its_methods():
+    blocks = analyze_complexity(SOURCE)["functions"]
+    names = [(block["qualified_name"], block["type"]) for block in blocks]
+    assert names == [
+        ("Shape", "class"),
+        ("Shape.area", "method"),
+        ("Shape.scale", "method"),
+        ("free", "function"),
+    ]
+    complexity = {block["qualified_name"]: block["complexity"] for block in blocks}
+    assert complexity["Shape.area"] == 2
+    assert complexity["Shape.scale"] == 1
+    # Sum of the methods; the conditional expression is not a decision point
+    assert complexity["Shape"] == 3
+    assert complexity["free"] == 2
+
+
+def test_empty_class_has_complexity_one():
+    blocks = analyze_complexity("class Empty:\n    pass\n")["functions"]
+    assert [(block["type"], block["complexity"]) for block in blocks] == [("class", 1)]
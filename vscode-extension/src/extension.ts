@@ -1,6 +1,8 @@
 import * as vscode from 'vscode';
 import axios from 'axios';
 
+const API_URL = 'http://localhost:8000/api/v1';
+
 export function activate(context: vscode.ExtensionContext) {
     console.log('CodeWhisper extension is now active!');
 
@@ -19,35 +21,202 @@ export function activate(context: vscode.ExtensionContext) {
             return;
         }
 
-        try {
-            vscode.window.withProgress({
-                location: vscode.ProgressLocation.Notification,
-                title: "Generating documentation...",
-                cancellable: false
-            }, async (progress) => {
-                const response = await axios.post('http://localhost:8000/api/v1/generate', {
-                    code: text,
-                    language: editor.document.languageId
-                });
+        const config = vscode.workspace.getConfiguration('codewhisper');
+        const request = {
+            code: text,
+            language: editor.document.languageId,
+            adapter: config.get<string>('adapter') || undefined
+        };
 
-                const docstring = response.data.docstring;
+        await vscode.window.withProgress({
+            location: vscode.ProgressLocation.Notification,
+            title: "Generating documentation...",
+            cancellable: true
+        }, async (progress, token) => {
+            const abort = new AbortController();
+            token.onCancellationRequested(() => abort.abort());
+
+            try {
+                let docstring: string | undefined;
+                if (config.get<boolean>('streaming', true)) {
+                    docstring = await generateStreaming(editor, selection.start, {
+                        ...request,
+                        mode: config.get<string>('streamingMode', 'greedy')
+                    }, abort.signal);
+                } else {
+                    const response = await axios.post(`${API_URL}/generate`, request, { signal: abort.signal });
+                    docstring = response.data.docstring;
+                    if (docstring) {
+                        await editor.edit(editBuilder => {
+                            editBuilder.insert(selection.start, docstring + '\n');
+                        });
+                    }
+                }
 
                 if (docstring) {
-                    editor.edit(editBuilder => {
-                        editBuilder.insert(selection.start, docstring + '\n');
-                    });
                     vscode.window.showInformationMessage('Documentation generated successfully!');
                 } else {
                     vscode.window.showWarningMessage('No documentation returned from backend.');
                 }
-            });
-        } catch (error) {
-            vscode.window.showErrorMessage(`Error generating docs: ${error}`);
-            console.error(error);
-        }
+            } catch (error) {
+                if (axios.isCancel(error) || token.isCancellationRequested) {
+                    return;
+                }
+                vscode.window.showErrorMessage(`Error generating docs: ${error}`);
+                console.error(error);
+            }
+        });
     });
 
     context.subscriptions.push(disposable);
+
+    context.subscriptions.push(vscode.commands.registerCommand('codewhisper.documentFile', async () => {
+        const editor = vscode.window.activeTextEditor;
+        if (!editor) {
+            vscode.window.showErrorMessage('No active editor found.');
+            return;
+        }
+
+        const document = editor.document;
+        const version = document.version;
+
+        await vscode.window.withProgress({
+            location: vscode.ProgressLocation.Notification,
+            title: "Documenting file...",
+            cancellable: true
+        }, async (progress, token) => {
+            const abort = new AbortController();
+            token.onCancellationRequested(() => abort.abort());
+
+            try {
+                const response = await axios.post(`${API_URL}/generate/batch`, {
+                    code: document.getText(),
+                    language: document.languageId,
+                    adapter: vscode.workspace.getConfiguration('codewhisper').get<string>('adapter') || undefined
+                }, { signal: abort.signal });
+
+                const functions: { insert_line: number, text: string }[] = response.data.functions;
+                if (!functions.length) {
+                    vscode.window.showInformationMessage('Every function in this file is already documented.');
+                    return;
+                }
+                if (document.version !== version) {
+                    vscode.window.showWarningMessage('The file changed while documentation was generated; run the command again.');
+                    return;
+                }
+
+                // All insertions in one edit, so a single undo reverts them
+                const edit = new vscode.WorkspaceEdit();
+                for (const func of functions) {
+                    edit.insert(document.uri, new vscode.Position(func.insert_line - 1, 0), func.text);
+                }
+                await vscode.workspace.applyEdit(edit);
+                vscode.window.showInformationMessage(`Documented ${functions.length} function(s).`);
+            } catch (error) {
+                if (axios.isCancel(error) || token.isCancellationRequested) {
+                    return;
+                }
+                vscode.window.showErrorMessage(`Error documenting file: ${error}`);
+                console.error(error);
+            }
+        });
+    }));
+}
+
+/**
+ * Insert the docstring at `start` token by token as the backend streams it
+ * (Server-Sent Events from /generate/stream), then replace the partial text
+ * with the final docstring. Returns the final docstring, if any.
+ */
+async function generateStreaming(
+    editor: vscode.TextEditor,
+    start: vscode.Position,
+    request: { code: string, language: string, adapter?: string, mode?: string },
+    signal: AbortSignal
+): Promise<string | undefined> {
+    const response = await axios.post(`${API_URL}/generate/stream?format=sse`, request, {
+        responseType: 'stream',
+        signal
+    });
+
+    const startOffset = editor.document.offsetAt(start);
+    let inserted = '';
+    // Edits are applied one after another, in the order tokens arrive
+    let edits: Thenable<unknown> = Promise.resolve();
+    const insertedRange = () => new vscode.Range(
+        editor.document.positionAt(startOffset),
+        editor.document.positionAt(startOffset + inserted.length)
+    );
+
+    const append = (piece: string) => {
+        edits = edits.then(() => editor.edit(editBuilder => {
+            editBuilder.insert(editor.document.positionAt(startOffset + inserted.length), piece);
+        }, { undoStopBefore: false, undoStopAfter: false }).then(() => {
+            inserted += piece;
+        }));
+    };
+    const replaceAll = (final: string) => {
+        edits = edits.then(() => editor.edit(editBuilder => {
+            editBuilder.replace(insertedRange(), final);
+        }).then(() => {
+            inserted = final;
+        }));
+    };
+
+    let docstring: string | undefined;
+    let failure: string | undefined;
+    let buffer = '';
+    let streamedAny = false;
+
+    const handleEvent = (block: string) => {
+        let event = 'message';
+        const data: string[] = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                data.push(line.slice(5).trimStart());
+            }
+        }
+        if (!data.length) {
+            return;
+        }
+        const payload = JSON.parse(data.join('\n'));
+        if (event === 'token') {
+            // Show where the docstring is going as soon as the first token arrives
+            append(streamedAny ? payload.text : '"""\n' + payload.text);
+            streamedAny = true;
+        } else if (event === 'done') {
+            docstring = payload.docstring;
+            replaceAll(payload.docstring + '\n');
+        } else if (event === 'error') {
+            failure = payload.detail;
+        }
+    };
+
+    // Decode as text here so multi-byte characters split across chunks survive
+    response.data.setEncoding('utf8');
+    try {
+        for await (const chunk of response.data) {
+            buffer += chunk;
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                handleEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+            }
+        }
+    } finally {
+        if (docstring === undefined) {
+            // Cancelled or failed part-way: remove the partial text
+            replaceAll('');
+        }
+        await edits;
+    }
+
+    if (failure) {
+        throw new Error(failure);
+    }
+    return docstring;
 }
 
 export function deactivate() { }